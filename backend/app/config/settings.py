@@ -19,10 +19,79 @@ class Settings:
     # Supabase Configuration
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_SERVICE_KEY: str = os.getenv("SUPABASE_SERVICE_KEY", "")
+    # Pooled async PostgREST client (timeouts and retries on transient errors)
+    SUPABASE_TIMEOUT_SECONDS: float = float(os.getenv("SUPABASE_TIMEOUT_SECONDS", "10"))
+    SUPABASE_MAX_CONNECTIONS: int = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+    SUPABASE_MAX_KEEPALIVE: int = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "10"))
+    SUPABASE_MAX_RETRIES: int = int(os.getenv("SUPABASE_MAX_RETRIES", "2"))
+    SUPABASE_RETRY_BACKOFF_SECONDS: float = float(os.getenv("SUPABASE_RETRY_BACKOFF_SECONDS", "0.2"))
+    # Keyset pagination of listings (used when the client sends cursor or page_size)
+    PAGE_SIZE_DEFAULT: int = int(os.getenv("PAGE_SIZE_DEFAULT", "50"))
+    PAGE_SIZE_MAX: int = int(os.getenv("PAGE_SIZE_MAX", "200"))
     
     # Gemini AI Configuration
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
     GEMINI_MODEL: str = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+    # Point to the local stub (gemini_stub_server.py) for offline load tests
+    GEMINI_BASE_URL: str = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
+    # Pooled HTTP client for Gemini (keep-alive, HTTP/2, limits, timeouts)
+    GEMINI_HTTP2: bool = os.getenv("GEMINI_HTTP2", "true").lower() == "true"
+    GEMINI_MAX_CONNECTIONS: int = int(os.getenv("GEMINI_MAX_CONNECTIONS", "20"))
+    GEMINI_MAX_KEEPALIVE: int = int(os.getenv("GEMINI_MAX_KEEPALIVE", "10"))
+    GEMINI_KEEPALIVE_EXPIRY: float = float(os.getenv("GEMINI_KEEPALIVE_EXPIRY", "60"))
+    GEMINI_TIMEOUT_SECONDS: float = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "10"))
+    GEMINI_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("GEMINI_CONNECT_TIMEOUT_SECONDS", "5"))
+    # Model health memory and circuit breaker
+    GEMINI_MODEL_COOLDOWN_SECONDS: float = float(os.getenv("GEMINI_MODEL_COOLDOWN_SECONDS", "300"))
+    GEMINI_CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("GEMINI_CIRCUIT_FAILURE_THRESHOLD", "3"))
+    GEMINI_CIRCUIT_RESET_SECONDS: float = float(os.getenv("GEMINI_CIRCUIT_RESET_SECONDS", "30"))
+    # Outbound rate limit and concurrency (background calls leave reserved slots free)
+    GEMINI_RATE_LIMIT_RPS: float = float(os.getenv("GEMINI_RATE_LIMIT_RPS", "5"))
+    GEMINI_RATE_LIMIT_BURST: int = int(os.getenv("GEMINI_RATE_LIMIT_BURST", "10"))
+    GEMINI_MAX_CONCURRENCY: int = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+    GEMINI_INTERACTIVE_RESERVED: int = int(os.getenv("GEMINI_INTERACTIVE_RESERVED", "2"))
+    GEMINI_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("GEMINI_QUEUE_TIMEOUT_SECONDS", "30"))
+    # Response cache (empty GEMINI_CACHE_DB_PATH disables the persistent tier)
+    GEMINI_CACHE_TTL_SECONDS: float = float(os.getenv("GEMINI_CACHE_TTL_SECONDS", "86400"))
+    GEMINI_CACHE_MAX_ENTRIES: int = int(os.getenv("GEMINI_CACHE_MAX_ENTRIES", "512"))
+    GEMINI_CACHE_DB_PATH: str = os.getenv("GEMINI_CACHE_DB_PATH", "")
+    # Insight prompt budget (estimated tokens); older learnings are summarized
+    GEMINI_INSIGHT_TOKEN_BUDGET: int = int(os.getenv("GEMINI_INSIGHT_TOKEN_BUDGET", "2000"))
+    GEMINI_INSIGHT_SUMMARY_TOKEN_BUDGET: int = int(os.getenv("GEMINI_INSIGHT_SUMMARY_TOKEN_BUDGET", "400"))
+    GEMINI_INSIGHT_MIN_RECENT: int = int(os.getenv("GEMINI_INSIGHT_MIN_RECENT", "3"))
+    GEMINI_INSIGHT_SUMMARY_WORDS: int = int(os.getenv("GEMINI_INSIGHT_SUMMARY_WORDS", "20"))
+    
+    # Recommendations catalog cache (reloaded after the TTL or on explicit invalidation)
+    RECOMMENDATIONS_CACHE_TTL_SECONDS: float = float(os.getenv("RECOMMENDATIONS_CACHE_TTL_SECONDS", "300"))
+    # Content-based ranking: results per request and weight of liked items vs recent notes
+    RECOMMENDATIONS_TOP_K: int = int(os.getenv("RECOMMENDATIONS_TOP_K", "10"))
+    RECOMMENDATIONS_LIKES_WEIGHT: float = float(os.getenv("RECOMMENDATIONS_LIKES_WEIGHT", "0.5"))
+    # Item-item collaborative filtering from likes (neighbours per item, rebuild period, ranking weight)
+    RECOMMENDATIONS_CF_NEIGHBORS: int = int(os.getenv("RECOMMENDATIONS_CF_NEIGHBORS", "20"))
+    RECOMMENDATIONS_CF_REFRESH_SECONDS: float = float(os.getenv("RECOMMENDATIONS_CF_REFRESH_SECONDS", "600"))
+    RECOMMENDATIONS_CF_WEIGHT: float = float(os.getenv("RECOMMENDATIONS_CF_WEIGHT", "0.5"))
+    
+    # Rendered analysis charts cache ("" = memory only, "disk" or "storage" for a persistent tier)
+    CHART_CACHE_MAX_ENTRIES: int = int(os.getenv("CHART_CACHE_MAX_ENTRIES", "256"))
+    CHART_CACHE_BACKEND: str = os.getenv("CHART_CACHE_BACKEND", "").lower()
+    CHART_CACHE_DIR: str = os.getenv("CHART_CACHE_DIR", "./cache/charts")
+    CHART_CACHE_BUCKET: str = os.getenv("CHART_CACHE_BUCKET", "chart_cache")
+    # Server-rendered chart output ("png" or "webp") and resolution
+    CHART_IMAGE_FORMAT: str = os.getenv("CHART_IMAGE_FORMAT", "png").lower()
+    CHART_DPI: int = int(os.getenv("CHART_DPI", "100"))
+    # Per-student word frequency counters kept in memory (word cloud input)
+    WORD_FREQ_MAX_USERS: int = int(os.getenv("WORD_FREQ_MAX_USERS", "1000"))
+    
+    # Cohort bulk exports (Parquet / Arrow IPC files, removed after the TTL)
+    EXPORT_DIR: str = os.getenv("EXPORT_DIR", "./exports")
+    EXPORT_TTL_SECONDS: float = float(os.getenv("EXPORT_TTL_SECONDS", "86400"))
+    EXPORT_RISK_RECENT_NOTES: int = int(os.getenv("EXPORT_RISK_RECENT_NOTES", "5"))
+    
+    # On-demand profiling (off by default; requests must send X-Profiling-Token)
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILING_TOKEN: str = os.getenv("PROFILING_TOKEN", "")
+    PROFILING_MAX_SECONDS: float = float(os.getenv("PROFILING_MAX_SECONDS", "60"))
+    PROFILING_SAMPLE_INTERVAL_MS: float = float(os.getenv("PROFILING_SAMPLE_INTERVAL_MS", "5"))
     
     # Email Configuration
     GMAIL_SENDER: str = os.getenv("GMAIL_SENDER", "")
@@ -32,6 +101,9 @@ class Settings:
     # Gmail API Configuration (Optional)
     GMAIL_SERVICE_ACCOUNT_JSON: str = os.getenv("GMAIL_SERVICE_ACCOUNT_JSON", "")
     GMAIL_DELEGATED_USER: str = os.getenv("GMAIL_DELEGATED_USER", "")
+    # "api" sends through Gmail API; "local" uses the in-memory stand-in transport
+    GMAIL_TRANSPORT: str = os.getenv("GMAIL_TRANSPORT", "api")
+    GMAIL_LOCAL_LATENCY_MS: int = int(os.getenv("GMAIL_LOCAL_LATENCY_MS", "0"))
     
     # CORS Configuration
     CORS_ORIGINS: List[str] = os.getenv(
@@ -0,0 +1,145 @@
+"""
+Async PostgREST client for Supabase
+Shares pooled keep-alive connections, applies per-call timeouts and retries transient errors
+"""
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+from app.config.settings import settings
+from app.services.metrics_service import metrics
+
+# Methods that are safe to retry after the request may have reached the server
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "PATCH", "DELETE"}
+# Responses worth retrying (gateway errors / rate limiting)
+_RETRY_STATUS = {429, 502, 503, 504}
+
+
+class PostgrestError(Exception):
+    """Error returned by PostgREST (or raised after exhausting retries)"""
+
+    def __init__(self, status_code: int, message: str, details: Optional[Any] = None):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+        self.details = details
+
+
+class PostgrestClient:
+    """Process-wide pooled httpx client for the Supabase REST API (/rest/v1)"""
+
+    _client: Optional[httpx.AsyncClient] = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_client(cls) -> httpx.AsyncClient:
+        """Get the shared async client, creating it on first use"""
+        if cls._client is None or cls._client.is_closed:
+            with cls._lock:
+                if cls._client is None or cls._client.is_closed:
+                    if not settings.SUPABASE_URL or not settings.SUPABASE_SERVICE_KEY:
+                        raise ValueError(
+                            "Supabase credentials not configured. "
+                            "Please set SUPABASE_URL and SUPABASE_SERVICE_KEY in .env file"
+                        )
+                    key = settings.SUPABASE_SERVICE_KEY
+                    cls._client = httpx.AsyncClient(
+                        base_url=f"{settings.SUPABASE_URL.rstrip('/')}/rest/v1",
+                        headers={
+                            "apikey": key,
+                            "Authorization": f"Bearer {key}",
+                            "Content-Type": "application/json",
+                        },
+                        limits=httpx.Limits(
+                            max_connections=settings.SUPABASE_MAX_CONNECTIONS,
+                            max_keepalive_connections=settings.SUPABASE_MAX_KEEPALIVE,
+                        ),
+                        timeout=httpx.Timeout(settings.SUPABASE_TIMEOUT_SECONDS),
+                    )
+        return cls._client
+
+    @staticmethod
+    def _can_retry(method: str, error: Optional[Exception], status_code: Optional[int]) -> bool:
+        if error is not None:
+            # The request never left: safe to retry even for inserts
+            if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+                return True
+            return method in _IDEMPOTENT_METHODS and isinstance(error, httpx.TransportError)
+        return method in _IDEMPOTENT_METHODS and status_code in _RETRY_STATUS
+
+    @classmethod
+    async def request(
+        cls,
+        method: str,
+        table: str,
+        params: Optional[Dict[str, str]] = None,
+        json: Any = None,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Perform a PostgREST request with retries on transient errors
+
+        Args:
+            method: HTTP method (GET, POST, PATCH, DELETE)
+            table: Table name
+            params: Query string (select, filters, order, limit)
+            json: Request body
+            headers: Extra headers (e.g. Prefer)
+            timeout: Per-call timeout in seconds (defaults to SUPABASE_TIMEOUT_SECONDS)
+
+        Returns:
+            Decoded JSON body (None for empty responses)
+        """
+        client = cls.get_client()
+        attempts = settings.SUPABASE_MAX_RETRIES + 1
+        for attempt in range(attempts):
+            start = time.perf_counter()
+            error: Optional[Exception] = None
+            response: Optional[httpx.Response] = None
+            try:
+                response = await client.request(
+                    method,
+                    f"/{table}",
+                    params=params,
+                    json=json,
+                    headers=headers,
+                    timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+                )
+            except httpx.HTTPError as e:
+                error = e
+            elapsed = time.perf_counter() - start
+            metrics.observe("db_request_latency_seconds", elapsed, {"table": table, "method": method})
+            metrics.record_span("supabase", elapsed)
+
+            status_code = response.status_code if response is not None else None
+            if error is None and status_code < 400:
+                if not response.content:
+                    return None
+                return response.json()
+
+            if attempt + 1 < attempts and cls._can_retry(method, error, status_code):
+                metrics.inc("db_retries_total", {"table": table, "method": method})
+                backoff = settings.SUPABASE_RETRY_BACKOFF_SECONDS * (2 ** attempt)
+                await asyncio.sleep(backoff + random.uniform(0, backoff))
+                continue
+
+            metrics.inc("db_errors_total", {"table": table, "method": method})
+            if error is not None:
+                raise PostgrestError(0, f"Error de conexión con Supabase: {error}") from error
+            try:
+                body = response.json()
+            except ValueError:
+                body = {"message": response.text}
+            message = body.get("message", response.text) if isinstance(body, dict) else response.text
+            raise PostgrestError(status_code, message, body)
+
+    @classmethod
+    async def aclose(cls) -> None:
+        """Close pooled connections (called on application shutdown)"""
+        if cls._client is not None:
+            await cls._client.aclose()
+            cls._client = None
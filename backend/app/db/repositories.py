@@ -0,0 +1,484 @@
+"""
+Async repositories for the Supabase tables used by the app
+Thin wrappers over PostgrestClient; rows are returned as plain dicts (still encrypted)
+
+Keyset pagination (select_page) orders by (sort column, id) descending. Recommended indexes:
+    CREATE INDEX IF NOT EXISTS notas_usuario_created_idx ON public.notas (usuario_id, created_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS drawings_usuario_created_idx ON public.drawings (usuario_id, created_at DESC, id DESC);
+    CREATE INDEX IF NOT EXISTS citas_creacion_idx ON public.citas (fecha_creacion DESC, id_cita DESC);
+"""
+import base64
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from app.config.settings import settings
+from app.db.postgrest_client import PostgrestClient
+
+# Ask PostgREST to return the affected rows (same behaviour as supabase-py)
+_RETURN_REPRESENTATION = {"Prefer": "return=representation"}
+
+
+def _compact_select(columns: str) -> str:
+    """Remove whitespace from a select list (embedded resources included)"""
+    return "".join(columns.split())
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _filter_params(filters: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Translate filters to PostgREST query params
+
+    - value        -> column=eq.value
+    - None         -> column=is.null
+    - list / set   -> column=in.("a","b")
+    - (op, value)  -> column=op.value (PostgREST operator: lt, gte, neq, ...)
+    """
+    params: Dict[str, str] = {}
+    for column, value in (filters or {}).items():
+        if value is None:
+            params[column] = "is.null"
+        elif isinstance(value, tuple):
+            operator, operand = value
+            params[column] = f"{operator}.{_format_value(operand)}"
+        elif isinstance(value, (list, set)):
+            quoted = ",".join('"' + _format_value(v).replace('"', '\\"') + '"' for v in value)
+            params[column] = f"in.({quoted})"
+        else:
+            params[column] = f"eq.{_format_value(value)}"
+    return params
+
+
+def encode_cursor(sort_value: Any, row_id: Any) -> str:
+    """Opaque cursor pointing just after a row"""
+    raw = json.dumps([sort_value, row_id], separators=(",", ":"), default=str)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, Any]:
+    """Inverse of encode_cursor; raises ValueError on malformed cursors"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
+    return sort_value, row_id
+
+
+def resolve_page_size(cursor: Optional[str], page_size: Optional[int]) -> Optional[int]:
+    """
+    Effective page size of a listing request
+
+    Returns None when neither cursor nor page_size was sent (legacy clients
+    get the full list), otherwise the page size capped at PAGE_SIZE_MAX.
+    """
+    if cursor is None and page_size is None:
+        return None
+    if cursor is not None:
+        decode_cursor(cursor)
+    return min(page_size or settings.PAGE_SIZE_DEFAULT, settings.PAGE_SIZE_MAX)
+
+
+def project_columns(
+    fields: Optional[str],
+    allowed: Sequence[str],
+    always: Sequence[str] = ("id", "created_at")
+) -> str:
+    """
+    Select list for a comma-separated `fields` request parameter
+
+    Args:
+        fields: Requested fields (None or empty -> "*", the legacy full row)
+        allowed: Whitelisted columns of the endpoint
+        always: Columns always returned (ids, pagination keys)
+
+    Returns:
+        PostgREST select list; raises ValueError on fields outside the whitelist
+    """
+    if not fields:
+        return "*"
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise ValueError(
+            f"Campos no permitidos: {', '.join(unknown)}. Permitidos: {', '.join(allowed)}"
+        )
+    columns = list(always) + [f for f in requested if f not in always]
+    return ", ".join(columns)
+
+
+def _quote(value: Any) -> str:
+    """Quote a value inside a PostgREST logic tree (timestamps contain reserved chars)"""
+    return '"' + _format_value(value).replace('"', '\\"') + '"'
+
+
+class TableRepository:
+    """Generic CRUD over one table"""
+
+    def __init__(self, table: str):
+        self.table = table
+
+    async def select(
+        self,
+        columns: str = "*",
+        filters: Optional[Dict[str, Any]] = None,
+        order: Optional[str] = None,
+        desc: bool = False,
+        limit: Optional[int] = None,
+        timeout: Optional[float] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Select rows
+
+        Args:
+            columns: Select list (PostgREST syntax, embedded resources allowed)
+            filters: See _filter_params
+            order: Column to order by
+            desc: Descending order
+            limit: Maximum number of rows
+            timeout: Per-call timeout in seconds
+
+        Returns:
+            List of rows
+        """
+        params = {"select": _compact_select(columns)}
+        params.update(_filter_params(filters))
+        if order:
+            params["order"] = f"{order}.{'desc' if desc else 'asc'}"
+        if limit is not None:
+            params["limit"] = str(limit)
+        return await PostgrestClient.request("GET", self.table, params=params, timeout=timeout) or []
+
+    async def select_one(
+        self,
+        columns: str = "*",
+        filters: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None
+    ) -> Optional[Dict[str, Any]]:
+        """First matching row or None"""
+        rows = await self.select(columns, filters, limit=1, timeout=timeout)
+        return rows[0] if rows else None
+
+    async def select_page(
+        self,
+        columns: str = "*",
+        filters: Optional[Dict[str, Any]] = None,
+        page_size: int = 50,
+        cursor: Optional[str] = None,
+        sort_column: str = "created_at",
+        id_column: str = "id"
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Keyset pagination, newest first
+
+        Args:
+            columns: Select list; sort_column and id_column are added if missing
+            filters: See _filter_params
+            page_size: Rows per page
+            cursor: next_cursor of the previous page (None for the first page)
+            sort_column: Column to order by (descending)
+            id_column: Unique tie-breaker column
+
+        Returns:
+            Tuple of (rows, next_cursor); next_cursor is None on the last page
+        """
+        select = _compact_select(columns)
+        if select != "*" and not select.startswith("*,"):
+            present = set(select.split(","))
+            select += "".join(f",{c}" for c in (sort_column, id_column) if c not in present)
+
+        params = {"select": select}
+        params.update(_filter_params(filters))
+        if cursor:
+            sort_value, row_id = decode_cursor(cursor)
+            params["or"] = (
+                f"({sort_column}.lt.{_quote(sort_value)},"
+                f"and({sort_column}.eq.{_quote(sort_value)},{id_column}.lt.{_quote(row_id)}))"
+            )
+        params["order"] = f"{sort_column}.desc,{id_column}.desc"
+        # One extra row tells whether there is a next page
+        params["limit"] = str(page_size + 1)
+
+        rows = await PostgrestClient.request("GET", self.table, params=params) or []
+        next_cursor = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            last = rows[-1]
+            next_cursor = encode_cursor(last.get(sort_column), last.get(id_column))
+        return rows, next_cursor
+
+    async def insert(self, rows: Any) -> List[Dict[str, Any]]:
+        """Insert one row (dict) or several (list) and return them"""
+        return await PostgrestClient.request(
+            "POST", self.table, json=rows, headers=_RETURN_REPRESENTATION
+        ) or []
+
+    async def update(self, values: Dict[str, Any], filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Update matching rows and return them"""
+        if not filters:
+            raise ValueError("update requires at least one filter")
+        return await PostgrestClient.request(
+            "PATCH", self.table, params=_filter_params(filters), json=values, headers=_RETURN_REPRESENTATION
+        ) or []
+
+    async def delete(self, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Delete matching rows and return them"""
+        if not filters:
+            raise ValueError("delete requires at least one filter")
+        return await PostgrestClient.request(
+            "DELETE", self.table, params=_filter_params(filters), headers=_RETURN_REPRESENTATION
+        ) or []
+
+
+class UsuariosRepository(TableRepository):
+    """Table `usuarios` (students, psychologists, admins)"""
+
+    def __init__(self):
+        super().__init__("usuarios")
+
+    async def get_by_id(self, user_id: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+        return await self.select_one(columns, {"id": user_id})
+
+    async def list_students(
+        self,
+        psychologist_id: Optional[str] = None,
+        columns: str = "id, nombre, apellido, codigo_alumno"
+    ) -> List[Dict[str, Any]]:
+        filters: Dict[str, Any] = {"rol": "estudiante"}
+        if psychologist_id:
+            filters["psicologo_id"] = psychologist_id
+        return await self.select(columns, filters)
+
+    async def list_psychologists(
+        self,
+        columns: str = "id, nombre, apellido, correo_institucional"
+    ) -> List[Dict[str, Any]]:
+        return await self.select(columns, {"rol": "psicologo"})
+
+    async def update_by_id(self, user_id: str, values: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return await self.update(values, {"id": user_id})
+
+
+class NotasRepository(TableRepository):
+    """Table `notas` (diary notes)"""
+
+    def __init__(self):
+        super().__init__("notas")
+
+    async def get_by_id(self, note_id: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+        return await self.select_one(columns, {"id": note_id})
+
+    async def list_by_user(
+        self,
+        user_id: str,
+        columns: str = "*",
+        limit: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Notes of a user, newest first"""
+        return await self.select(columns, {"usuario_id": user_id}, order="created_at", desc=True, limit=limit)
+
+    async def page_by_user(
+        self,
+        user_id: str,
+        page_size: int,
+        cursor: Optional[str] = None,
+        columns: str = "*"
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of a user's notes, newest first"""
+        return await self.select_page(columns, {"usuario_id": user_id}, page_size, cursor)
+
+    async def update_by_id(self, note_id: str, values: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return await self.update(values, {"id": note_id})
+
+    async def set_accompaniment_if_missing(self, note_id: str, value: str) -> List[Dict[str, Any]]:
+        """Store the accompaniment unless one is already stored (empty list if it was)"""
+        return await self.update({"acompanamiento": value}, {"id": note_id, "acompanamiento": None})
+
+
+class AsistenciaRepository(TableRepository):
+    """Table `asistencia` (attendance and learnings)"""
+
+    def __init__(self):
+        super().__init__("asistencia")
+
+    async def list_by_user(
+        self,
+        user_id: str,
+        columns: str = "id_asistencia, aprendizaje_obtenido, fecha_atencion"
+    ) -> List[Dict[str, Any]]:
+        """Attendance of a user, most recent first"""
+        return await self.select(columns, {"id_usuario": user_id}, order="fecha_atencion", desc=True)
+
+    async def page_by_user(
+        self,
+        user_id: str,
+        page_size: int,
+        cursor: Optional[str] = None,
+        columns: str = "*"
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of a user's attendance, most recent first"""
+        return await self.select_page(
+            columns, {"id_usuario": user_id}, page_size, cursor, "fecha_atencion", "id_asistencia"
+        )
+
+
+class DrawingsRepository(TableRepository):
+    """Table `drawings` (student drawings gallery)"""
+
+    def __init__(self):
+        super().__init__("drawings")
+
+    async def get_by_id(self, drawing_id: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+        return await self.select_one(columns, {"id": drawing_id})
+
+    async def list_by_user(self, user_id: str, columns: str = "*") -> List[Dict[str, Any]]:
+        """Drawings of a student, newest first"""
+        return await self.select(columns, {"usuario_id": user_id}, order="created_at", desc=True)
+
+    async def page_by_user(
+        self,
+        user_id: str,
+        page_size: int,
+        cursor: Optional[str] = None,
+        columns: str = "*"
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of a student's drawings, newest first"""
+        return await self.select_page(columns, {"usuario_id": user_id}, page_size, cursor)
+
+    async def list_by_users(self, user_ids: Sequence[str], columns: str = "*") -> List[Dict[str, Any]]:
+        """Drawings of several students, newest first"""
+        if not user_ids:
+            return []
+        return await self.select(columns, {"usuario_id": list(user_ids)}, order="created_at", desc=True)
+
+    async def page_by_users(
+        self,
+        user_ids: Sequence[str],
+        page_size: int,
+        cursor: Optional[str] = None,
+        columns: str = "*"
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of the drawings of several students, newest first"""
+        if not user_ids:
+            return [], None
+        return await self.select_page(columns, {"usuario_id": list(user_ids)}, page_size, cursor)
+
+
+class CitasRepository(TableRepository):
+    """Table `citas` (appointments)"""
+
+    def __init__(self):
+        super().__init__("citas")
+
+    async def get_by_id(self, id_cita: int, columns: str = "*") -> Optional[Dict[str, Any]]:
+        return await self.select_one(columns, {"id_cita": id_cita})
+
+    async def list_pending(
+        self,
+        columns: str = "*, usuarios:id_usuario(nombre, apellido, correo_institucional)"
+    ) -> List[Dict[str, Any]]:
+        """Appointments without an assigned psychologist"""
+        return await self.select(columns, {"id_psicologo": None})
+
+    async def list_all(self, columns: str = "*") -> List[Dict[str, Any]]:
+        return await self.select(columns)
+
+    async def page_pending(
+        self,
+        page_size: int,
+        cursor: Optional[str] = None,
+        columns: str = "*, usuarios:id_usuario(nombre, apellido, correo_institucional)"
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of unassigned appointments, newest first"""
+        return await self.select_page(
+            columns, {"id_psicologo": None}, page_size, cursor, "fecha_creacion", "id_cita"
+        )
+
+    async def page_all(
+        self,
+        page_size: int,
+        cursor: Optional[str] = None,
+        columns: str = "*"
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One page of all appointments, newest first"""
+        return await self.select_page(columns, None, page_size, cursor, "fecha_creacion", "id_cita")
+
+    async def list_by_student(self, id_usuario: str, columns: str = "*") -> List[Dict[str, Any]]:
+        return await self.select(columns, {"id_usuario": id_usuario})
+
+    async def list_by_psychologist(self, id_psicologo: str, columns: str = "*") -> List[Dict[str, Any]]:
+        return await self.select(columns, {"id_psicologo": id_psicologo})
+
+    async def update_by_id(self, id_cita: int, values: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return await self.update(values, {"id_cita": id_cita})
+
+    async def delete_by_id(self, id_cita: int) -> List[Dict[str, Any]]:
+        return await self.delete({"id_cita": id_cita})
+
+
+class RecomendacionesRepository(TableRepository):
+    """Table `recomendaciones` (wellbeing recommendations catalog)"""
+
+    def __init__(self):
+        super().__init__("recomendaciones")
+
+    async def list_all(self, columns: str = "*") -> List[Dict[str, Any]]:
+        return await self.select(columns)
+
+    async def like_counts(self, ids: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Like count of recommendations (all of them when ids is None)
+
+        likes_count is maintained by a trigger on likes_recomendaciones
+        (migrations/002_recomendaciones_likes_count.sql).
+        """
+        filters = {"id": list(ids)} if ids is not None else None
+        return await self.select("id, likes_count", filters)
+
+
+class LikesRecomendacionesRepository(TableRepository):
+    """Table `likes_recomendaciones` (user favourites)"""
+
+    def __init__(self):
+        super().__init__("likes_recomendaciones")
+
+    async def add(self, user_id: str, recomendacion_id: str) -> List[Dict[str, Any]]:
+        return await self.insert({"user_id": user_id, "recomendacion_id": recomendacion_id})
+
+    async def remove(self, user_id: str, recomendacion_id: str) -> List[Dict[str, Any]]:
+        return await self.delete({"user_id": user_id, "recomendacion_id": recomendacion_id})
+
+    async def list_by_user(self, user_id: str, columns: str = "recomendacion_id") -> List[Dict[str, Any]]:
+        return await self.select(columns, {"user_id": user_id})
+
+    async def list_by_user_for_items(self, user_id: str, recomendacion_ids: List[Any]) -> List[Dict[str, Any]]:
+        return await self.select("recomendacion_id", {"user_id": user_id, "recomendacion_id": list(recomendacion_ids)})
+
+    async def page_all(
+        self,
+        page_size: int,
+        cursor: Optional[str] = None,
+        columns: str = "user_id, recomendacion_id"
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        One page of all likes, keyset-ordered by (user_id, recomendacion_id)
+
+        The pair is unique (migrations/002_recomendaciones_likes_count.sql),
+        so it is a valid keyset; a single unpaginated select would be cut at
+        PostgREST's max-rows.
+        """
+        return await self.select_page(columns, None, page_size, cursor, "user_id", "recomendacion_id")
+
+
+# Global repository instances
+usuarios_repo = UsuariosRepository()
+notas_repo = NotasRepository()
+asistencia_repo = AsistenciaRepository()
+drawings_repo = DrawingsRepository()
+citas_repo = CitasRepository()
+recomendaciones_repo = RecomendacionesRepository()
+likes_repo = LikesRecomendacionesRepository()
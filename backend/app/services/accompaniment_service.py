@@ -0,0 +1,185 @@
+"""
+Accompaniment job service
+Generates the Gemini accompaniment for a saved note outside the request path
+and stores it alongside the note so it is generated only once.
+
+Requiere la columna notas.acompanamiento (migrations/001_notas_acompanamiento.sql)
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+from app.db.repositories import notas_repo
+from app.services.encryption_service import encryption_service
+from app.services.gemini_service import GeminiService
+
+# Job states
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Maximum number of finished jobs kept in memory
+_MAX_TRACKED_JOBS = 1000
+# Age after which an untracked note without accompaniment is considered
+# orphaned (its job was lost to a restart) rather than running on another worker
+_ORPHANED_AFTER_SECONDS = 120
+
+
+class _Job:
+    """In-memory state of one accompaniment job"""
+
+    __slots__ = ("status", "accompaniment", "event", "created_at")
+
+    def __init__(self):
+        self.status = STATUS_PENDING
+        self.accompaniment: Optional[str] = None
+        self.event = asyncio.Event()
+        self.created_at = time.time()
+
+
+class AccompanimentService:
+    """Service that runs and tracks accompaniment jobs (job id = note id)"""
+
+    _jobs: "OrderedDict[str, _Job]" = OrderedDict()
+    # Restarted jobs (references keep the tasks from being garbage collected)
+    _restarts: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _job_payload(job_id: str, status: str, accompaniment: Optional[str]) -> Dict[str, Any]:
+        return {
+            "job_id": job_id,
+            "status": status,
+            "accompaniment": accompaniment,
+        }
+
+    @classmethod
+    def _track(cls, job_id: str) -> _Job:
+        """Register a pending job, evicting the oldest finished ones"""
+        job = _Job()
+        cls._jobs[job_id] = job
+        while len(cls._jobs) > _MAX_TRACKED_JOBS:
+            oldest_id, oldest = next(iter(cls._jobs.items()))
+            if oldest.status == STATUS_PENDING:
+                break
+            cls._jobs.pop(oldest_id)
+        return job
+
+    @staticmethod
+    async def _load_stored(job_id: str) -> Optional[Dict[str, Any]]:
+        """Read the note row; None if the note does not exist"""
+        return await notas_repo.get_by_id(job_id, "id, acompanamiento, created_at")
+
+    @staticmethod
+    def _is_orphaned(stored: Dict[str, Any]) -> bool:
+        """True if the note is old enough that no worker can still be generating for it"""
+        try:
+            created_at = datetime.fromisoformat(str(stored.get("created_at")))
+        except ValueError:
+            return True
+        now = datetime.now(created_at.tzinfo)
+        return (now - created_at).total_seconds() > _ORPHANED_AFTER_SECONDS
+
+    @classmethod
+    def _restart(cls, job_id: str) -> None:
+        """Track and rerun a lost job in this worker"""
+        cls._track(job_id)
+        print(f"[ACCOMPANIMENT] Job {job_id}: no estaba en curso, se reinicia la generación")
+        task = asyncio.create_task(cls.run_job(job_id))
+        cls._restarts.add(task)
+        task.add_done_callback(cls._restarts.discard)
+
+    @classmethod
+    def create_job(cls, job_id: str) -> str:
+        """Register a job for a freshly inserted note"""
+        if job_id not in cls._jobs:
+            cls._track(job_id)
+        return job_id
+
+    @classmethod
+    async def run_job(cls, job_id: str, note_text: Optional[str] = None) -> None:
+        """
+        Generate and persist the accompaniment for a note
+
+        Runs as a background task after the POST /notas response is sent.
+        Skips generation if the note already has a stored accompaniment.
+        Without note_text (restarted job) the note is read from the table.
+        """
+        job = cls._jobs.get(job_id) or cls._track(job_id)
+        if job.status == STATUS_DONE:
+            return
+
+        try:
+            stored = await cls._load_stored(job_id)
+            if stored and stored.get("acompanamiento"):
+                job.accompaniment = encryption_service.decrypt(stored["acompanamiento"])
+                job.status = STATUS_DONE
+                return
+
+            if note_text is None:
+                note = await notas_repo.get_by_id(job_id, "nota")
+                note_text = encryption_service.decrypt(note["nota"]) if note and note.get("nota") else ""
+
+            accompaniment = await GeminiService.generate_accompaniment_async(note_text)
+            if not accompaniment:
+                print(f"[ACCOMPANIMENT] Job {job_id}: no se pudo generar acompañamiento")
+                job.status = STATUS_FAILED
+                return
+
+            # Conditional write: a job restarted on another worker may have stored one first
+            updated = await notas_repo.set_accompaniment_if_missing(
+                job_id, encryption_service.encrypt(accompaniment)
+            )
+            if not updated:
+                stored = await cls._load_stored(job_id)
+                if stored and stored.get("acompanamiento"):
+                    accompaniment = encryption_service.decrypt(stored["acompanamiento"])
+
+            job.accompaniment = accompaniment
+            job.status = STATUS_DONE
+            print(f"[ACCOMPANIMENT] Job {job_id}: acompañamiento generado (length: {len(accompaniment)})")
+        except Exception as e:
+            print(f"[ACCOMPANIMENT] Job {job_id}: error generando acompañamiento: {e}")
+            job.status = STATUS_FAILED
+        finally:
+            job.event.set()
+
+    @classmethod
+    async def get_status(cls, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Current state of a job
+
+        Falls back to the stored note when the job is not tracked in memory
+        (e.g. after a restart). An untracked note without accompaniment is
+        reported pending while another worker may still be generating it;
+        once older than that, its job was lost and is restarted here (the
+        job is tracked from then on, so it is restarted once per worker).
+        Returns None if the note does not exist.
+        """
+        job = cls._jobs.get(job_id)
+        if job is not None and job.status != STATUS_FAILED:
+            return cls._job_payload(job_id, job.status, job.accompaniment)
+
+        stored = await cls._load_stored(job_id)
+        if stored is None:
+            return None
+        if stored.get("acompanamiento"):
+            accompaniment = encryption_service.decrypt(stored["acompanamiento"])
+            return cls._job_payload(job_id, STATUS_DONE, accompaniment)
+        if job is not None:
+            return cls._job_payload(job_id, STATUS_FAILED, None)
+        if cls._is_orphaned(stored):
+            cls._restart(job_id)
+        return cls._job_payload(job_id, STATUS_PENDING, None)
+
+    @classmethod
+    async def wait_for(cls, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Wait up to `timeout` seconds for a tracked job to finish, then return its state"""
+        job = cls._jobs.get(job_id)
+        if job is not None and job.status == STATUS_PENDING:
+            try:
+                await asyncio.wait_for(job.event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return await cls.get_status(job_id)
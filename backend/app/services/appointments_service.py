@@ -2,9 +2,9 @@
 Servicio de gestión de citas médicas/psicológicas.
 Maneja la lógica de negocio para operaciones CRUD de citas.
 """
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from fastapi import HTTPException
-from app.db.supabase_client import supabase
+from app.db.repositories import citas_repo, usuarios_repo
 from app.models.schemas import CitaCreate, CitaUpdate, CitaAsignarPsicologo
 
 
@@ -12,33 +12,29 @@ class AppointmentsService:
     """Servicio de gestión de citas"""
 
     @staticmethod
-    def crear_cita(cita_data: CitaCreate, id_usuario: str) -> Dict[str, Any]:
+    async def crear_cita(cita_data: CitaCreate, id_usuario: str) -> Dict[str, Any]:
         """
         Crea una nueva cita.
         Solo estudiantes pueden crear citas.
         """
         try:
             # Verificar que el usuario sea estudiante
-            usuario = supabase.table("usuarios")\
-                .select("rol")\
-                .eq("id", id_usuario)\
-                .single()\
-                .execute()
+            usuario = await usuarios_repo.get_by_id(id_usuario, "rol")
 
-            if not usuario.data or usuario.data.get("rol") != "estudiante":
+            if not usuario or usuario.get("rol") != "estudiante":
                 raise HTTPException(
                     status_code=403,
                     detail="Solo los estudiantes pueden crear citas"
                 )
 
             # Insertar la cita
-            response = supabase.table("citas").insert({
+            rows = await citas_repo.insert({
                 "titulo": cita_data.titulo,
                 "fecha_cita": cita_data.fecha_cita,
                 "id_usuario": id_usuario
-            }).execute()
+            })
 
-            return response.data[0] if response.data else {}
+            return rows[0] if rows else {}
 
         except HTTPException:
             raise
@@ -49,18 +45,18 @@ class AppointmentsService:
             )
 
     @staticmethod
-    def obtener_citas_pendientes() -> List[Dict[str, Any]]:
-        """Obtiene citas sin psicólogo asignado"""
+    async def obtener_citas_pendientes(
+        page_size: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Obtiene citas sin psicólogo asignado.
+        Sin page_size devuelve todas; con page_size, una página y el cursor siguiente.
+        """
         try:
-            response = supabase.table("citas")\
-                .select("""
-                    *,
-                    usuarios:id_usuario(nombre, apellido, correo_institucional)
-                """)\
-                .is_("id_psicologo", "null")\
-                .execute()
-
-            return response.data or []
+            if page_size is None:
+                return await citas_repo.list_pending(), None
+            return await citas_repo.page_pending(page_size, cursor)
 
         except Exception as e:
             raise HTTPException(
@@ -69,11 +65,18 @@ class AppointmentsService:
             )
 
     @staticmethod
-    def obtener_todas_las_citas() -> List[Dict[str, Any]]:
-        """Obtiene todas las citas del sistema"""
+    async def obtener_todas_las_citas(
+        page_size: Optional[int] = None,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Obtiene todas las citas del sistema.
+        Sin page_size devuelve todas; con page_size, una página y el cursor siguiente.
+        """
         try:
-            response = supabase.table("citas").select("*").execute()
-            return response.data or []
+            if page_size is None:
+                return await citas_repo.list_all(), None
+            return await citas_repo.page_all(page_size, cursor)
 
         except Exception as e:
             raise HTTPException(
@@ -82,37 +85,24 @@ class AppointmentsService:
             )
 
     @staticmethod
-    def obtener_citas_usuario(id_usuario: str) -> List[Dict[str, Any]]:
+    async def obtener_citas_usuario(id_usuario: str) -> List[Dict[str, Any]]:
         """Obtiene citas de un usuario según su rol"""
         try:
             # Obtener rol del usuario
-            usuario = supabase.table("usuarios")\
-                .select("rol")\
-                .eq("id", id_usuario)\
-                .single()\
-                .execute()
+            usuario = await usuarios_repo.get_by_id(id_usuario, "rol")
 
-            if not usuario.data:
+            if not usuario:
                 raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
-            rol = usuario.data.get("rol")
+            rol = usuario.get("rol")
 
             # Filtrar según rol
             if rol == "estudiante":
-                response = supabase.table("citas")\
-                    .select("*")\
-                    .eq("id_usuario", id_usuario)\
-                    .execute()
-            elif rol == "psicologo":
-                response = supabase.table("citas")\
-                    .select("*")\
-                    .eq("id_psicologo", id_usuario)\
-                    .execute()
-            else:
-                # Administrador u otro rol ve todas las citas
-                response = supabase.table("citas").select("*").execute()
-
-            return response.data or []
+                return await citas_repo.list_by_student(id_usuario)
+            if rol == "psicologo":
+                return await citas_repo.list_by_psychologist(id_usuario)
+            # Administrador u otro rol ve todas las citas
+            return await citas_repo.list_all()
 
         except HTTPException:
             raise
@@ -123,19 +113,15 @@ class AppointmentsService:
             )
 
     @staticmethod
-    def obtener_cita_por_id(id_cita: int) -> Dict[str, Any]:
+    async def obtener_cita_por_id(id_cita: int) -> Dict[str, Any]:
         """Obtiene una cita por ID"""
         try:
-            response = supabase.table("citas")\
-                .select("*")\
-                .eq("id_cita", id_cita)\
-                .single()\
-                .execute()
+            cita = await citas_repo.get_by_id(id_cita)
 
-            if not response.data:
+            if not cita:
                 raise HTTPException(status_code=404, detail="Cita no encontrada")
 
-            return response.data
+            return cita
 
         except HTTPException:
             raise
@@ -146,32 +132,25 @@ class AppointmentsService:
             )
 
     @staticmethod
-    def asignar_psicologo(
+    async def asignar_psicologo(
         id_cita: int,
         asignacion: CitaAsignarPsicologo
     ) -> Dict[str, Any]:
         """Asigna un psicólogo a una cita"""
         try:
             # Verificar que el ID corresponda a un psicólogo
-            psicologo = supabase.table("usuarios")\
-                .select("rol")\
-                .eq("id", asignacion.id_psicologo)\
-                .single()\
-                .execute()
+            psicologo = await usuarios_repo.get_by_id(asignacion.id_psicologo, "rol")
 
-            if not psicologo.data or psicologo.data.get("rol") != "psicologo":
+            if not psicologo or psicologo.get("rol") != "psicologo":
                 raise HTTPException(
                     status_code=400,
                     detail="El ID proporcionado no corresponde a un psicólogo"
                 )
 
             # Actualizar la cita
-            response = supabase.table("citas")\
-                .update({"id_psicologo": asignacion.id_psicologo})\
-                .eq("id_cita", id_cita)\
-                .execute()
+            rows = await citas_repo.update_by_id(id_cita, {"id_psicologo": asignacion.id_psicologo})
 
-            return response.data[0] if response.data else {}
+            return rows[0] if rows else {}
 
         except HTTPException:
             raise
@@ -182,7 +161,7 @@ class AppointmentsService:
             )
 
     @staticmethod
-    def actualizar_cita(
+    async def actualizar_cita(
         id_cita: int,
         cita_update: CitaUpdate,
         id_usuario: str
@@ -190,7 +169,7 @@ class AppointmentsService:
         """Actualiza una cita. Solo el creador puede actualizar."""
         try:
             # Obtener la cita actual
-            cita_actual = AppointmentsService.obtener_cita_por_id(id_cita)
+            cita_actual = await AppointmentsService.obtener_cita_por_id(id_cita)
 
             # Verificar que el usuario sea el creador
             if cita_actual.get("id_usuario") != id_usuario:
@@ -210,12 +189,9 @@ class AppointmentsService:
                 return cita_actual
 
             # Actualizar la cita
-            response = supabase.table("citas")\
-                .update(update_data)\
-                .eq("id_cita", id_cita)\
-                .execute()
+            rows = await citas_repo.update_by_id(id_cita, update_data)
 
-            return response.data[0] if response.data else {}
+            return rows[0] if rows else {}
 
         except HTTPException:
             raise
@@ -226,11 +202,11 @@ class AppointmentsService:
             )
 
     @staticmethod
-    def eliminar_cita(id_cita: int, id_usuario: str) -> Dict[str, str]:
+    async def eliminar_cita(id_cita: int, id_usuario: str) -> Dict[str, str]:
         """Elimina una cita. Solo el creador puede eliminar."""
         try:
             # Obtener la cita actual
-            cita_actual = AppointmentsService.obtener_cita_por_id(id_cita)
+            cita_actual = await AppointmentsService.obtener_cita_por_id(id_cita)
 
             # Verificar que el usuario sea el creador
             if cita_actual.get("id_usuario") != id_usuario:
@@ -240,10 +216,7 @@ class AppointmentsService:
                 )
 
             # Eliminar la cita
-            supabase.table("citas")\
-                .delete()\
-                .eq("id_cita", id_cita)\
-                .execute()
+            await citas_repo.delete_by_id(id_cita)
 
             return {"message": "Cita eliminada con éxito"}
 
@@ -256,15 +229,10 @@ class AppointmentsService:
             )
 
     @staticmethod
-    def obtener_psicologos_disponibles() -> List[Dict[str, Any]]:
+    async def obtener_psicologos_disponibles() -> List[Dict[str, Any]]:
         """Obtiene lista de psicólogos disponibles"""
         try:
-            response = supabase.table("usuarios")\
-                .select("id, nombre, apellido, correo_institucional")\
-                .eq("rol", "psicologo")\
-                .execute()
-
-            return response.data or []
+            return await usuarios_repo.list_psychologists()
 
         except Exception as e:
             raise HTTPException(
@@ -0,0 +1,154 @@
+"""
+Cache of rendered analysis charts per student
+Keyed by user and a fingerprint of the analyzed rows, in memory with an optional disk or Storage tier
+"""
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config.settings import settings
+from app.services.encryption_service import encryption_service
+from app.services.metrics_service import metrics
+
+
+class ChartCache:
+    """
+    Rendered charts (base64 images) for the analysis dashboards.
+
+    An entry is valid while the student's data keeps the same fingerprint (row
+    count plus latest timestamp), so repeated dashboard views skip matplotlib.
+    Only the latest fingerprint is kept per user and chart set.
+
+    - Memory tier: LRU bounded by CHART_CACHE_MAX_ENTRIES.
+    - Persistent tier (optional, CHART_CACHE_BACKEND): "disk" writes one file per
+      user under CHART_CACHE_DIR, "storage" uploads it to the CHART_CACHE_BUCKET
+      Supabase Storage bucket. Stored encrypted, since word clouds show note text.
+    """
+
+    _lock = threading.Lock()
+    _entries: "OrderedDict[Tuple[str, str], Tuple[str, Dict[str, Any]]]" = OrderedDict()
+
+    @staticmethod
+    def fingerprint(rows: List[Dict[str, Any]], time_field: str = "created_at") -> str:
+        """
+        Fingerprint of the analyzed rows: count plus latest timestamp
+
+        Args:
+            rows: Rows fed to the analysis
+            time_field: Timestamp column of the rows
+        """
+        timestamps = [str(r[time_field]) for r in rows if r.get(time_field) is not None]
+        return f"{len(rows)}:{max(timestamps) if timestamps else ''}"
+
+    @staticmethod
+    def _render_key(fingerprint: str) -> str:
+        """Fingerprint plus render settings, so a format/DPI change is a miss"""
+        return f"{fingerprint}|{settings.CHART_IMAGE_FORMAT}|{settings.CHART_DPI}"
+
+    @staticmethod
+    def _object_name(kind: str, user_id: str) -> str:
+        digest = hashlib.sha256(f"{kind}:{user_id}".encode("utf-8")).hexdigest()[:32]
+        return f"{kind}_{digest}.json"
+
+    @classmethod
+    def _read_persistent(cls, kind: str, user_id: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        backend = settings.CHART_CACHE_BACKEND
+        name = cls._object_name(kind, user_id)
+        if backend == "disk":
+            path = os.path.join(settings.CHART_CACHE_DIR, name)
+            if not os.path.exists(path):
+                return None
+            with open(path, "r", encoding="utf-8") as f:
+                raw = f.read()
+        elif backend == "storage":
+            from app.db.supabase_client import supabase
+            try:
+                raw = supabase.storage.from_(settings.CHART_CACHE_BUCKET).download(name).decode("utf-8")
+            except Exception:
+                # Object not found
+                return None
+        else:
+            return None
+        payload = encryption_service.decrypt(raw)
+        if not isinstance(payload, dict):
+            return None
+        return payload.get("fingerprint", ""), payload.get("images", {})
+
+    @classmethod
+    def _write_persistent(cls, kind: str, user_id: str, fingerprint: str, images: Dict[str, Any]) -> None:
+        backend = settings.CHART_CACHE_BACKEND
+        name = cls._object_name(kind, user_id)
+        raw = encryption_service.encrypt({"fingerprint": fingerprint, "images": images})
+        if backend == "disk":
+            os.makedirs(settings.CHART_CACHE_DIR, exist_ok=True)
+            path = os.path.join(settings.CHART_CACHE_DIR, name)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(raw)
+            os.replace(tmp_path, path)
+        elif backend == "storage":
+            from app.db.supabase_client import supabase
+            supabase.storage.from_(settings.CHART_CACHE_BUCKET).upload(
+                name,
+                raw.encode("utf-8"),
+                {"content-type": "text/plain", "upsert": "true"}
+            )
+
+    @classmethod
+    def _store_memory(cls, key: Tuple[str, str], fingerprint: str, images: Dict[str, Any]) -> None:
+        with cls._lock:
+            cls._entries[key] = (fingerprint, images)
+            cls._entries.move_to_end(key)
+            while len(cls._entries) > settings.CHART_CACHE_MAX_ENTRIES:
+                cls._entries.popitem(last=False)
+
+    @classmethod
+    async def get(cls, kind: str, user_id: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """
+        Cached charts for a user if they were rendered from the same data
+
+        Args:
+            kind: Chart set (e.g. "notas", "asistencia")
+            user_id: Student id
+            fingerprint: Value from `fingerprint()` for the current rows
+
+        Returns:
+            Copy of the cached images dict, or None
+        """
+        key = (kind, str(user_id))
+        fingerprint = cls._render_key(fingerprint)
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is not None and entry[0] == fingerprint:
+                cls._entries.move_to_end(key)
+                metrics.inc("chart_cache_requests_total", {"kind": kind, "result": "hit", "tier": "memory"})
+                return dict(entry[1])
+
+        if settings.CHART_CACHE_BACKEND:
+            try:
+                stored = await asyncio.to_thread(cls._read_persistent, kind, str(user_id))
+            except Exception as e:
+                print(f"[CHART_CACHE] Error leyendo caché persistente: {e}")
+                stored = None
+            if stored is not None and stored[0] == fingerprint:
+                cls._store_memory(key, stored[0], stored[1])
+                metrics.inc("chart_cache_requests_total", {"kind": kind, "result": "hit", "tier": "persistent"})
+                return dict(stored[1])
+
+        metrics.inc("chart_cache_requests_total", {"kind": kind, "result": "miss", "tier": "none"})
+        return None
+
+    @classmethod
+    async def set(cls, kind: str, user_id: str, fingerprint: str, images: Dict[str, Any]) -> None:
+        """Store the charts rendered for `fingerprint`, replacing older ones for the user"""
+        images = dict(images)
+        fingerprint = cls._render_key(fingerprint)
+        cls._store_memory((kind, str(user_id)), fingerprint, images)
+        if settings.CHART_CACHE_BACKEND:
+            try:
+                await asyncio.to_thread(cls._write_persistent, kind, str(user_id), fingerprint, images)
+            except Exception as e:
+                print(f"[CHART_CACHE] Error escribiendo caché persistente: {e}")
@@ -0,0 +1,457 @@
+"""
+Bulk cohort export for a psychologist's caseload
+Background job writing notes, attendance and risk of every student to Parquet (or Arrow IPC) files
+"""
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.config.settings import settings
+from app.db.repositories import asistencia_repo, notas_repo, usuarios_repo
+from app.services.alert_service import AlertService
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+    print("Warning: pyarrow not installed. Cohort exports will not be available.")
+
+# Job states
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+EXPORT_FORMATS = {"parquet": ".parquet", "arrow": ".arrows"}
+DATASETS = ("notas", "asistencia", "riesgo")
+
+# Job state file inside each job directory
+_STATE_FILE = "job.json"
+# Minimum time between two sweeps of EXPORT_DIR for expired jobs
+_CLEANUP_INTERVAL_SECONDS = 60
+# Job ids are uuid4 hex: anything else never reaches the filesystem
+_JOB_ID_RE = re.compile(r"[0-9a-f]{32}")
+# Chunk size when serving files
+_READ_CHUNK_BYTES = 256 * 1024
+
+ATTENDANCE_EXPORT_COLUMNS = (
+    "id_asistencia, id_usuario, fecha_atencion, nro_sesion, "
+    "modalidad_atencion, motivo_atencion, aprendizaje_obtenido"
+)
+NOTES_EXPORT_COLUMNS = "id, usuario_id, nota, tokens, sentimiento, emocion, emocion_score, created_at"
+
+
+def _schemas() -> Dict[str, "pa.Schema"]:
+    """
+    Output schemas. Emotion, sentiment and risk labels are dictionary-encoded.
+    Encrypted columns (nota, tokens) are exported as stored: the export never
+    writes plaintext that is encrypted at rest.
+    """
+    label = pa.dictionary(pa.int32(), pa.string())
+    return {
+        "notas": pa.schema([
+            ("estudiante_id", pa.string()),
+            ("nota_id", pa.string()),
+            ("created_at", pa.string()),
+            ("sentimiento", label),
+            ("emocion", label),
+            ("emocion_score", pa.float64()),
+            ("nota_cifrada", pa.string()),
+            ("tokens_cifrados", pa.string()),
+        ]),
+        "asistencia": pa.schema([
+            ("estudiante_id", pa.string()),
+            ("id_asistencia", pa.string()),
+            ("fecha_atencion", pa.string()),
+            ("nro_sesion", pa.int64()),
+            ("modalidad_atencion", label),
+            ("motivo_atencion", pa.string()),
+            ("aprendizaje_obtenido", pa.string()),
+        ]),
+        "riesgo": pa.schema([
+            ("estudiante_id", pa.string()),
+            ("codigo_alumno", pa.string()),
+            ("notas_consideradas", pa.int64()),
+            ("notas_tristeza", pa.int64()),
+            ("ratio_tristeza", pa.float64()),
+            ("max_score_tristeza", pa.float64()),
+            ("risk_level", label),
+            ("alerta", pa.bool_()),
+        ]),
+    }
+
+
+class _TableWriter:
+    """Appends record batches to a Parquet file or an Arrow IPC stream"""
+
+    def __init__(self, path: str, schema: "pa.Schema", export_format: str):
+        self.schema = schema
+        if export_format == "parquet":
+            self._writer = pq.ParquetWriter(path, schema, compression="zstd")
+        else:
+            self._sink = pa.OSFile(path, "wb")
+            # Stream format: unlike the IPC file format it allows a new
+            # dictionary per batch for the dictionary-encoded label columns
+            self._writer = pa.ipc.new_stream(self._sink, schema)
+        self.rows = 0
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        if not records:
+            return
+        columns = {name: [r.get(name) for r in records] for name in self.schema.names}
+        self._writer.write_batch(pa.RecordBatch.from_pydict(columns, schema=self.schema))
+        self.rows += len(records)
+
+    def close(self) -> None:
+        self._writer.close()
+        if hasattr(self, "_sink"):
+            self._sink.close()
+
+
+class _ExportJob:
+    """State of one cohort export, mirrored to EXPORT_DIR/<job_id>/job.json"""
+
+    __slots__ = (
+        "job_id", "psychologist_id", "export_format", "status", "students_total",
+        "students_done", "rows", "files", "error", "created_at", "finished_at",
+    )
+
+    def __init__(self, job_id: str, psychologist_id: str, export_format: str):
+        self.job_id = job_id
+        self.psychologist_id = psychologist_id
+        self.export_format = export_format
+        self.status = STATUS_PENDING
+        self.students_total = 0
+        self.students_done = 0
+        self.rows: Dict[str, int] = {}
+        self.files: Dict[str, str] = {}
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "_ExportJob":
+        job = cls(data["job_id"], data["psychologist_id"], data["export_format"])
+        for name in cls.__slots__:
+            if name in data:
+                setattr(job, name, data[name])
+        return job
+
+
+class CohortExportService:
+    """
+    Creates, runs and serves cohort export jobs (files under EXPORT_DIR).
+
+    The job state lives next to its files in EXPORT_DIR/<job_id>/job.json, so
+    any worker sharing EXPORT_DIR (same host, or a shared volume) can report
+    progress and serve downloads, not only the one running the job. EXPORT_DIR
+    must therefore be shared by every worker behind the load balancer.
+    """
+
+    # Jobs being run by this worker (the files on disk are the source of truth)
+    _running: Dict[str, _ExportJob] = {}
+    _last_cleanup = 0.0
+
+    @classmethod
+    def create_job(cls, psychologist_id: str, export_format: str = "parquet") -> str:
+        """
+        Register an export job (run it with `run_job` in the background)
+
+        Raises:
+            HTTPException: 400 on unknown format, 501 when pyarrow is missing
+        """
+        if export_format not in EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"format debe ser uno de: {', '.join(EXPORT_FORMATS)}")
+        if not PYARROW_AVAILABLE:
+            raise HTTPException(status_code=501, detail="Exportación no disponible: instala pyarrow")
+        cls._cleanup()
+        job_id = uuid.uuid4().hex
+        job = _ExportJob(job_id, psychologist_id, export_format)
+        cls._running[job_id] = job
+        cls._save(job)
+        return job_id
+
+    @staticmethod
+    def _job_dir(job_id: str) -> str:
+        return os.path.join(settings.EXPORT_DIR, job_id)
+
+    @classmethod
+    def _save(cls, job: _ExportJob) -> None:
+        """Write the job state atomically (readers never see a partial file)"""
+        directory = cls._job_dir(job.job_id)
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, f".{_STATE_FILE}.{os.getpid()}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job.to_dict(), f)
+        os.replace(tmp_path, os.path.join(directory, _STATE_FILE))
+
+    @classmethod
+    def _load(cls, job_id: str) -> Optional[_ExportJob]:
+        """Job run by this worker, else its state file (None if unknown)"""
+        if not _JOB_ID_RE.fullmatch(job_id or ""):
+            return None
+        job = cls._running.get(job_id)
+        if job is not None:
+            return job
+        try:
+            with open(os.path.join(cls._job_dir(job_id), _STATE_FILE), encoding="utf-8") as f:
+                return _ExportJob.from_dict(json.load(f))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @classmethod
+    def _cleanup(cls, force: bool = False) -> None:
+        """
+        Delete expired jobs with their files (at most once per interval)
+
+        A job expires EXPORT_TTL_SECONDS after it finished. A job whose state
+        was not updated for that long without finishing was abandoned by a
+        worker that stopped, and is deleted as well.
+        """
+        now = time.time()
+        if not force and now - cls._last_cleanup < _CLEANUP_INTERVAL_SECONDS:
+            return
+        cls._last_cleanup = now
+        try:
+            job_ids = os.listdir(settings.EXPORT_DIR)
+        except OSError:
+            return
+        for job_id in job_ids:
+            if not _JOB_ID_RE.fullmatch(job_id) or job_id in cls._running:
+                continue
+            job = cls._load(job_id)
+            directory = cls._job_dir(job_id)
+            try:
+                if job is not None and job.finished_at:
+                    updated_at = job.finished_at
+                else:
+                    # Unfinished job, or no readable state (crash before the first save)
+                    state_path = os.path.join(directory, _STATE_FILE)
+                    updated_at = os.path.getmtime(state_path if job is not None else directory)
+            except OSError:
+                continue
+            if now - updated_at > settings.EXPORT_TTL_SECONDS:
+                shutil.rmtree(directory, ignore_errors=True)
+
+    @staticmethod
+    async def _pages(
+        fetch_page: Callable[[Optional[str]], Awaitable[Tuple[List[Dict[str, Any]], Optional[str]]]]
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Walk a keyset-paginated listing page by page"""
+        cursor = None
+        while True:
+            rows, cursor = await fetch_page(cursor)
+            yield rows
+            if cursor is None:
+                break
+
+    @staticmethod
+    def _note_record(student_id: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        score = row.get("emocion_score")
+        return {
+            "estudiante_id": student_id,
+            "nota_id": str(row.get("id")),
+            "created_at": row.get("created_at"),
+            "sentimiento": row.get("sentimiento"),
+            "emocion": row.get("emocion"),
+            "emocion_score": float(score) if score is not None else None,
+            "nota_cifrada": row.get("nota"),
+            "tokens_cifrados": row.get("tokens"),
+        }
+
+    @staticmethod
+    def _attendance_record(student_id: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        sesion = row.get("nro_sesion")
+        return {
+            "estudiante_id": student_id,
+            "id_asistencia": str(row.get("id_asistencia")),
+            "fecha_atencion": row.get("fecha_atencion"),
+            "nro_sesion": int(sesion) if sesion is not None else None,
+            "modalidad_atencion": row.get("modalidad_atencion"),
+            "motivo_atencion": row.get("motivo_atencion"),
+            "aprendizaje_obtenido": row.get("aprendizaje_obtenido"),
+        }
+
+    @classmethod
+    async def run_job(cls, job_id: str) -> None:
+        """Stream every student's data into the export files"""
+        job = cls._running.get(job_id)
+        if job is None:
+            return
+        job.status = STATUS_RUNNING
+        directory = cls._job_dir(job_id)
+        writers: Dict[str, _TableWriter] = {}
+        try:
+            cls._save(job)
+            extension = EXPORT_FORMATS[job.export_format]
+            for dataset, schema in _schemas().items():
+                path = os.path.join(directory, f"{dataset}{extension}")
+                writers[dataset] = _TableWriter(path, schema, job.export_format)
+                job.files[dataset] = path
+
+            students = await usuarios_repo.list_students(job.psychologist_id, "id, codigo_alumno")
+            job.students_total = len(students)
+            cls._save(job)
+            page_size = settings.PAGE_SIZE_MAX
+
+            for student in students:
+                student_id = str(student.get("id"))
+                recent: List[Dict[str, Any]] = []
+
+                notes_pages = cls._pages(
+                    lambda cursor: notas_repo.page_by_user(student_id, page_size, cursor, NOTES_EXPORT_COLUMNS)
+                )
+                async for rows in notes_pages:
+                    if len(recent) < settings.EXPORT_RISK_RECENT_NOTES:
+                        recent.extend(rows[:settings.EXPORT_RISK_RECENT_NOTES - len(recent)])
+                    writers["notas"].write([cls._note_record(student_id, r) for r in rows])
+
+                attendance_pages = cls._pages(
+                    lambda cursor: asistencia_repo.page_by_user(student_id, page_size, cursor, ATTENDANCE_EXPORT_COLUMNS)
+                )
+                async for rows in attendance_pages:
+                    writers["asistencia"].write([cls._attendance_record(student_id, r) for r in rows])
+
+                risk = AlertService.compute_sadness_risk(recent)
+                writers["riesgo"].write([{
+                    "estudiante_id": student_id,
+                    "codigo_alumno": student.get("codigo_alumno"),
+                    "notas_consideradas": risk["count"],
+                    "notas_tristeza": risk["sad_count"],
+                    "ratio_tristeza": float(risk["ratio"]),
+                    "max_score_tristeza": float(risk["max_sad_score"]),
+                    "risk_level": risk["risk_level"],
+                    "alerta": risk["alert"],
+                }])
+                job.students_done += 1
+                cls._save(job)
+
+            for dataset, writer in writers.items():
+                writer.close()
+                job.rows[dataset] = writer.rows
+            writers = {}
+            job.status = STATUS_DONE
+            print(f"[EXPORT] Cohorte {job_id}: {job.students_done} estudiantes, filas {job.rows}")
+        except Exception as e:
+            job.status = STATUS_FAILED
+            job.error = str(e)
+            print(f"[EXPORT] Error en exportación {job_id}: {e}")
+        finally:
+            for writer in writers.values():
+                try:
+                    writer.close()
+                except Exception:
+                    pass
+            job.finished_at = time.time()
+            try:
+                cls._save(job)
+            except OSError as e:
+                print(f"[EXPORT] No se pudo guardar el estado de {job_id}: {e}")
+            cls._running.pop(job_id, None)
+
+    @classmethod
+    def get_status(cls, job_id: str) -> Optional[Dict[str, Any]]:
+        """Progress of a job plus download paths once done (None if unknown)"""
+        cls._cleanup()
+        job = cls._load(job_id)
+        if job is None:
+            return None
+        payload: Dict[str, Any] = {
+            "job_id": job.job_id,
+            "status": job.status,
+            "format": job.export_format,
+            "students_total": job.students_total,
+            "students_done": job.students_done,
+            "rows": job.rows,
+            "error": job.error,
+        }
+        if job.status == STATUS_DONE:
+            payload["downloads"] = {
+                dataset: f"/exports/cohort/jobs/{job.job_id}/{dataset}" for dataset in job.files
+            }
+        return payload
+
+    @classmethod
+    def file_for(cls, job_id: str, dataset: str) -> Tuple[str, str]:
+        """
+        Path and download name of a finished export file
+
+        Raises:
+            HTTPException: 404 if unknown, 409 if not finished yet
+        """
+        cls._cleanup()
+        job = cls._load(job_id)
+        if job is None or dataset not in DATASETS:
+            raise HTTPException(status_code=404, detail="Exportación no encontrada")
+        if job.status != STATUS_DONE:
+            raise HTTPException(status_code=409, detail=f"La exportación está en estado '{job.status}'")
+        path = job.files.get(dataset)
+        if not path or not os.path.exists(path):
+            raise HTTPException(status_code=404, detail="El archivo de exportación ya no existe")
+        filename = f"cohorte_{job.psychologist_id}_{dataset}{EXPORT_FORMATS[job.export_format]}"
+        return path, filename
+
+    @staticmethod
+    def range_response(path: str, filename: str, range_header: Optional[str]) -> StreamingResponse:
+        """
+        Serve a file with single-range support (resumable downloads)
+
+        Args:
+            path: File to send
+            filename: Name for Content-Disposition
+            range_header: Value of the Range request header, if any
+        """
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        status_code = 200
+        if range_header:
+            match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+            if not match or (not match.group(1) and not match.group(2)):
+                raise HTTPException(status_code=416, detail="Range inválido", headers={"Content-Range": f"bytes */{size}"})
+            if match.group(1):
+                start = int(match.group(1))
+                end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            else:
+                # Suffix range: last N bytes
+                start = max(0, size - int(match.group(2)))
+            if start > end or start >= size:
+                raise HTTPException(status_code=416, detail="Range fuera del archivo", headers={"Content-Range": f"bytes */{size}"})
+            status_code = 206
+
+        def chunks() -> Iterator[bytes]:
+            with open(path, "rb") as f:
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    data = f.read(min(_READ_CHUNK_BYTES, remaining))
+                    if not data:
+                        break
+                    remaining -= len(data)
+                    yield data
+
+        headers = {
+            "Accept-Ranges": "bytes",
+            "Content-Length": str(end - start + 1),
+            "Content-Disposition": f"attachment; filename={filename}",
+        }
+        if status_code == 206:
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return StreamingResponse(
+            chunks(),
+            status_code=status_code,
+            media_type="application/octet-stream",
+            headers=headers,
+        )
@@ -0,0 +1,163 @@
+"""
+Item-item collaborative filtering over likes_recomendaciones
+"Students who liked X also liked Y": top-k neighbour table rebuilt periodically in the background
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from app.config.settings import settings
+from app.db.repositories import likes_repo
+from app.services.metrics_service import metrics
+
+Neighbors = Dict[str, Tuple[Tuple[str, float], ...]]
+
+# Likes per request while rebuilding (below PostgREST's default max-rows of 1000)
+_LIKES_PAGE_SIZE = 500
+
+
+def build_neighbors(pairs: List[Tuple[str, str]], k: int) -> Neighbors:
+    """
+    Top-k most similar items per item from (user, item) like pairs
+
+    Similarity is the cosine between the items' columns of the binary
+    user x item matrix, i.e. co-likes / sqrt(likes_i * likes_j).
+
+    Args:
+        pairs: (user_id, recomendacion_id) pairs
+        k: Neighbours kept per item
+
+    Returns:
+        item id -> ((neighbour id, similarity), ...) sorted by similarity
+    """
+    users: Dict[str, int] = {}
+    items: Dict[str, int] = {}
+    rows, cols = [], []
+    for user_id, item_id in pairs:
+        rows.append(users.setdefault(user_id, len(users)))
+        cols.append(items.setdefault(item_id, len(items)))
+    if not items:
+        return {}
+
+    likes = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, cols)),
+        shape=(len(users), len(items))
+    )
+    # Duplicate likes collapse to 1
+    likes.data[:] = 1.0
+    counts = np.asarray(likes.sum(axis=0)).ravel()
+    inv_norm = sparse.diags(1.0 / np.sqrt(np.maximum(counts, 1.0)))
+    similarity = (inv_norm @ (likes.T @ likes) @ inv_norm).tocsr()
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+
+    ids = list(items)
+    neighbors: Neighbors = {}
+    for i in range(similarity.shape[0]):
+        start, end = similarity.indptr[i], similarity.indptr[i + 1]
+        if start == end:
+            continue
+        scores = similarity.data[start:end]
+        cols_i = similarity.indices[start:end]
+        if scores.size > k:
+            keep = np.argpartition(-scores, k - 1)[:k]
+            scores, cols_i = scores[keep], cols_i[keep]
+        order = np.argsort(-scores, kind="stable")
+        neighbors[ids[i]] = tuple((ids[cols_i[j]], float(scores[j])) for j in order)
+    return neighbors
+
+
+class CollaborativeRecommender:
+    """
+    In-memory item-item neighbour table.
+
+    The table is swapped atomically on each rebuild, so request handlers only
+    do dictionary lookups over the user's liked items.
+    """
+
+    _neighbors: Neighbors = {}
+    _built_at: float = 0.0
+    _likes = 0
+    _task: Optional[asyncio.Task] = None
+
+    @classmethod
+    async def rebuild(cls) -> None:
+        """Reload all likes (page by page) and recompute the neighbour table"""
+        start = time.perf_counter()
+        pairs: List[Tuple[str, str]] = []
+        cursor = None
+        while True:
+            rows, cursor = await likes_repo.page_all(_LIKES_PAGE_SIZE, cursor)
+            pairs.extend(
+                (str(r["user_id"]), str(r["recomendacion_id"]))
+                for r in rows
+                if r.get("user_id") is not None and r.get("recomendacion_id") is not None
+            )
+            if cursor is None:
+                break
+        cls._neighbors = await asyncio.to_thread(build_neighbors, pairs, settings.RECOMMENDATIONS_CF_NEIGHBORS)
+        cls._likes = len(pairs)
+        cls._built_at = time.time()
+        elapsed = time.perf_counter() - start
+        metrics.observe("recommendations_cf_rebuild_seconds", elapsed)
+        print(f"[RECOMMENDATIONS] Vecinos CF: {len(cls._neighbors)} items, {len(pairs)} likes ({elapsed:.2f}s)")
+
+    @classmethod
+    async def _refresh_loop(cls) -> None:
+        while True:
+            try:
+                await cls.rebuild()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[RECOMMENDATIONS] Error reconstruyendo vecinos CF: {e}")
+            await asyncio.sleep(settings.RECOMMENDATIONS_CF_REFRESH_SECONDS)
+
+    @classmethod
+    def start(cls) -> None:
+        """Start the periodic rebuild task (called on application startup)"""
+        if cls._task is None or cls._task.done():
+            cls._task = asyncio.create_task(cls._refresh_loop())
+
+    @classmethod
+    async def stop(cls) -> None:
+        """Cancel the periodic rebuild task"""
+        if cls._task is not None:
+            cls._task.cancel()
+            try:
+                await cls._task
+            except asyncio.CancelledError:
+                pass
+            cls._task = None
+
+    @classmethod
+    def scores(cls, liked_ids: List[Any]) -> Dict[str, float]:
+        """
+        Collaborative score per recommendation for a user's likes
+
+        Args:
+            liked_ids: Ids of recommendations the user liked
+
+        Returns:
+            recommendation id -> summed similarity to the liked items
+            (items already liked are left out)
+        """
+        liked = {str(i) for i in liked_ids}
+        result: Dict[str, float] = {}
+        for item_id in liked:
+            for neighbor_id, similarity in cls._neighbors.get(item_id, ()):
+                if neighbor_id not in liked:
+                    result[neighbor_id] = result.get(neighbor_id, 0.0) + similarity
+        return result
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Neighbour table size and age"""
+        return {
+            "items": len(cls._neighbors),
+            "likes": cls._likes,
+            "age_seconds": round(time.time() - cls._built_at, 1) if cls._built_at else None,
+        }
@@ -0,0 +1,141 @@
+"""
+Content-based recommendation ranking
+TF-IDF over the recommendation texts, user profile from recent note tokens and liked items
+"""
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from app.config.settings import settings
+from app.services.metrics_service import metrics
+from app.services.recommendation_catalog import RecommendationCatalog
+
+try:
+    from nltk.corpus import stopwords
+    _STOP_WORDS: Optional[List[str]] = stopwords.words("spanish")
+except Exception:
+    _STOP_WORDS = None
+
+# Recommendation columns that describe its content
+_TEXT_FIELDS = ("titulo", "descripcion", "emocion_objetivo", "sentimiento_objetivo")
+
+
+def _item_text(row: Dict[str, Any]) -> str:
+    return " ".join(str(row[field]) for field in _TEXT_FIELDS if row.get(field))
+
+
+class ContentRecommender:
+    """
+    Ranks the recommendations catalog against a user profile.
+
+    The TF-IDF matrix (rows L2-normalized) is fitted once per catalog version:
+    it is rebuilt from the `RecommendationCatalog.on_refresh` hook. Scoring a
+    user is one sparse matrix-vector product (cosine similarity, since both
+    sides are normalized) followed by an argpartition top-k.
+    """
+
+    _vectorizer: Optional[TfidfVectorizer] = None
+    _matrix: Optional[sparse.csr_matrix] = None
+    _items: List[Dict[str, Any]] = []
+    _row_by_id: Dict[str, int] = {}
+    _version = -1
+
+    @classmethod
+    def rebuild(cls, rows: List[Dict[str, Any]]) -> None:
+        """Fit the TF-IDF model on the catalog (registered as catalog refresh hook)"""
+        texts = [_item_text(row) for row in rows]
+        if not any(texts):
+            cls._vectorizer, cls._matrix = None, None
+        else:
+            vectorizer = TfidfVectorizer(
+                stop_words=_STOP_WORDS,
+                token_pattern=r"(?u)\b\w\w\w+\b",
+                sublinear_tf=True,
+            )
+            try:
+                matrix = vectorizer.fit_transform(texts).tocsr()
+            except ValueError:
+                # Empty vocabulary (only stop words)
+                vectorizer, matrix = None, None
+            cls._vectorizer, cls._matrix = vectorizer, matrix
+        cls._items = rows
+        cls._row_by_id = {str(row.get("id")): i for i, row in enumerate(rows)}
+        cls._version = RecommendationCatalog.version
+        vocabulary = len(cls._vectorizer.vocabulary_) if cls._vectorizer is not None else 0
+        print(f"[RECOMMENDATIONS] Matriz TF-IDF: {len(rows)} recomendaciones x {vocabulary} términos")
+
+    @classmethod
+    def _profile(cls, note_tokens: List[str], liked_ids: List[Any]) -> Optional[sparse.csr_matrix]:
+        """Normalized user vector: recent note terms plus the centroid of liked items"""
+        profile = None
+        if note_tokens:
+            profile = cls._vectorizer.transform([" ".join(note_tokens)])
+            if profile.nnz:
+                profile = normalize(profile)
+            else:
+                profile = None
+
+        rows = [cls._row_by_id[str(i)] for i in liked_ids if str(i) in cls._row_by_id]
+        if rows:
+            liked = sparse.csr_matrix(cls._matrix[rows].mean(axis=0))
+            liked = normalize(liked) * settings.RECOMMENDATIONS_LIKES_WEIGHT
+            profile = liked if profile is None else profile + liked
+
+        if profile is None or not profile.nnz:
+            return None
+        return normalize(profile).T.tocsc()
+
+    @classmethod
+    async def rank(
+        cls,
+        note_tokens: List[str],
+        liked_ids: List[Any],
+        k: Optional[int] = None,
+        extra_scores: Optional[Dict[str, float]] = None,
+        extra_weight: float = 1.0
+    ) -> List[Dict[str, Any]]:
+        """
+        Top-k recommendations for a user profile
+
+        Args:
+            note_tokens: Tokens from the user's recent notes (plus emotion labels)
+            liked_ids: Ids of recommendations the user liked
+            k: Number of results (defaults to RECOMMENDATIONS_TOP_K)
+            extra_scores: Additional signal per recommendation id (e.g. collaborative)
+            extra_weight: Weight of `extra_scores` relative to content similarity
+
+        Returns:
+            Recommendations sorted by descending score (empty when neither the
+            profile nor the extra signal scores any item)
+        """
+        catalog = await RecommendationCatalog.get_all()
+        if cls._version != RecommendationCatalog.version:
+            cls.rebuild(catalog)
+        if cls._matrix is None:
+            return []
+
+        profile = cls._profile(note_tokens, liked_ids)
+        if profile is None and not extra_scores:
+            metrics.inc("recommendations_content_rank_total", {"result": "empty_profile"})
+            return []
+
+        if profile is not None:
+            scores = (cls._matrix @ profile).toarray().ravel()
+        else:
+            scores = np.zeros(len(cls._items))
+        for item_id, score in (extra_scores or {}).items():
+            row = cls._row_by_id.get(item_id)
+            if row is not None:
+                scores[row] += extra_weight * score
+        k = min(k or settings.RECOMMENDATIONS_TOP_K, scores.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        top = top[scores[top] > 0]
+        metrics.inc("recommendations_content_rank_total", {"result": "ranked" if top.size else "no_match"})
+        return [cls._items[i] for i in top]
+
+
+RecommendationCatalog.on_refresh(ContentRecommender.rebuild)
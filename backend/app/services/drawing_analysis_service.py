@@ -11,13 +11,21 @@ from skimage import morphology
 import warnings
 from app.config.settings import settings
 from app.services.gemini_service import GeminiService
+from app.services.gemini_cache import GeminiResponseCache
+from app.services.gemini_limiter import PRIORITY_BACKGROUND, GeminiQueueTimeout, GeminiRateLimiter
+from app.services.metrics_service import metrics
 import google.generativeai as genai
 
+# Bump when the drawing insight prompt changes so cached answers are not reused
+DRAWING_INSIGHT_PROMPT_VERSION = "drawing-insight-v1"
+DRAWING_INSIGHT_MODEL = 'gemini-2.0-flash-exp'
+
 
 class DrawingAnalysisService:
     """Service for analyzing drawings and providing insights"""
     
     @staticmethod
+    @metrics.timed("opencv")
     def decode_base64_image(image_base64: str) -> Optional[np.ndarray]:
         """
         Decode base64 image string to OpenCV image
@@ -73,6 +81,7 @@ class DrawingAnalysisService:
             return ""
     
     @staticmethod
+    @metrics.timed("opencv")
     def quantify_drawing(img: np.ndarray) -> Optional[Dict]:
         """
         Analyze a drawing and extract quantitative metrics
@@ -136,13 +145,14 @@ class DrawingAnalysisService:
             return metricas
     
     @staticmethod
-    def create_visualization_steps(img: np.ndarray, metrics: Optional[Dict] = None) -> Dict[str, str]:
+    @metrics.timed("opencv")
+    def create_visualization_steps(img: np.ndarray, drawing_metrics: Optional[Dict] = None) -> Dict[str, str]:
         """
         Create visualization steps of the analysis process
         
         Args:
             img: OpenCV image array
-            metrics: Optional metrics dictionary
+            drawing_metrics: Optional metrics dictionary
             
         Returns:
             Dictionary with base64 encoded visualization images
@@ -205,16 +215,27 @@ class DrawingAnalysisService:
             return visualizations
     
     @staticmethod
-    def generate_ai_insights(metrics: Dict) -> str:
+    def generate_ai_insights(drawing_metrics: Dict, use_cache: bool = True) -> str:
         """
         Generate AI insights from drawing metrics using Gemini
         
         Args:
-            metrics: Dictionary with drawing metrics
+            drawing_metrics: Dictionary with drawing metrics
+            use_cache: If False, skip the cache lookup (the fresh answer is still stored)
             
         Returns:
             AI-generated insights text
         """
+        cache_key = GeminiResponseCache.make_key(
+            DRAWING_INSIGHT_PROMPT_VERSION, DRAWING_INSIGHT_MODEL, drawing_metrics
+        )
+        if use_cache:
+            cached = GeminiResponseCache.get(cache_key, "drawing_insight")
+            if cached:
+                return cached
+        else:
+            GeminiResponseCache.record_bypass("drawing_insight")
+
         try:
             genai.configure(api_key=settings.GEMINI_API_KEY)
             
@@ -230,18 +251,25 @@ class DrawingAnalysisService:
             )
 
             USER_PROMPT = (
-                f"Aquí están las métricas del dibujo: {metrics}. "
+                f"Aquí están las métricas del dibujo: {drawing_metrics}. "
                 "Por favor, dame la descripción objetiva y las sugerencias visuales."
             )
 
             model = genai.GenerativeModel(
-                model_name='gemini-2.0-flash-exp',
+                model_name=DRAWING_INSIGHT_MODEL,
                 system_instruction=SYSTEM_PROMPT
             )
             
-            response = model.generate_content(USER_PROMPT)
+            # Same process-wide limiter as the REST calls, below interactive traffic
+            with GeminiRateLimiter.slot_sync(PRIORITY_BACKGROUND):
+                with metrics.span("gemini"):
+                    response = model.generate_content(USER_PROMPT)
+            if response.text:
+                GeminiResponseCache.set(cache_key, response.text)
             return response.text
             
+        except GeminiQueueTimeout:
+            return "Error: Gemini está saturado en este momento. Inténtalo de nuevo en unos minutos."
         except Exception as e:
             error_message = str(e)
             if "API_KEY_INVALID" in error_message:
@@ -252,12 +280,13 @@ class DrawingAnalysisService:
                 return f"Error al contactar la API de Gemini: {e}"
     
     @staticmethod
-    def analyze_drawing(image_base64: str) -> Dict:
+    def analyze_drawing(image_base64: str, use_cache: bool = True) -> Dict:
         """
         Complete analysis pipeline: decode, quantify, visualize, and generate insights
         
         Args:
             image_base64: Base64 encoded image string
+            use_cache: If False, regenerate the AI insights instead of reusing a cached one
             
         Returns:
             Dictionary with complete analysis results
@@ -268,18 +297,18 @@ class DrawingAnalysisService:
             return {"error": "No se pudo decodificar la imagen"}
         
         # Quantify drawing
-        metrics = DrawingAnalysisService.quantify_drawing(img)
-        if metrics is None:
+        drawing_metrics = DrawingAnalysisService.quantify_drawing(img)
+        if drawing_metrics is None:
             return {"error": "No se pudieron calcular las métricas"}
         
         # Create visualizations
-        visualizations = DrawingAnalysisService.create_visualization_steps(img, metrics)
+        visualizations = DrawingAnalysisService.create_visualization_steps(img, drawing_metrics)
         
         # Generate AI insights
-        ai_insights = DrawingAnalysisService.generate_ai_insights(metrics)
+        ai_insights = DrawingAnalysisService.generate_ai_insights(drawing_metrics, use_cache=use_cache)
         
         return {
-            "metrics": metrics,
+            "metrics": drawing_metrics,
             "visualizations": visualizations,
             "ai_insights": ai_insights
         }
@@ -7,20 +7,187 @@ import json
 import base64
 import smtplib
 import ssl
+import threading
+import time
+from collections import deque
 from datetime import datetime
 from email.message import EmailMessage
-from typing import Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from app.config.settings import settings
 
 try:
+    import httplib2
+    import google_auth_httplib2
+    from google.auth.transport.requests import Request as GoogleAuthRequest
     from google.oauth2 import service_account
     from googleapiclient.discovery import build
     GMAIL_API_AVAILABLE = True
 except ImportError:
+    httplib2 = None
+    google_auth_httplib2 = None
+    GoogleAuthRequest = None
     service_account = None
     build = None
     GMAIL_API_AVAILABLE = False
 
+GMAIL_SEND_SCOPES = ["https://www.googleapis.com/auth/gmail.send"]
+
+
+class _LocalResponse(dict):
+    """Minimal httplib2.Response: header dict plus status and reason"""
+
+    def __init__(self, status: int, reason: str = "OK"):
+        super().__init__({"status": str(status), "content-type": "application/json"})
+        self.status = status
+        self.reason = reason
+
+
+class LocalGmailTransport:
+    """
+    Local stand-in for the Gmail API send endpoint.
+
+    Keeps sent messages in memory (bounded) and optionally simulates network
+    latency, so the send path can be benchmarked and tested offline.
+    Enabled with GMAIL_TRANSPORT=local: instances replace the httplib2
+    connection under GmailClientCache, so sends still go through the cached
+    credentials and discovery client; only the send call is local (token
+    refreshes still reach Google, at most once per token lifetime).
+    Without GMAIL_SERVICE_ACCOUNT_JSON messages go straight to the outbox.
+    """
+
+    _lock = threading.Lock()
+    _outbox: deque = deque(maxlen=1000)
+
+    timeout = None
+
+    def request(self, uri: str, method: str = "GET", body: Any = None, headers: Any = None, **kwargs):
+        """httplib2.Http.request: accept users.messages.send, reject anything else"""
+        if method != "POST" or not uri.split("?")[0].endswith("/messages/send"):
+            return _LocalResponse(404, "Not Found"), b'{"error": {"code": 404}}'
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        result = self.send(json.loads(body or "{}").get("raw", ""))
+        return _LocalResponse(200), json.dumps(result).encode("utf-8")
+
+    @classmethod
+    def send(cls, raw: str) -> Dict[str, Any]:
+        """Simulate users.messages.send and return a Gmail-like response"""
+        latency_ms = settings.GMAIL_LOCAL_LATENCY_MS
+        if latency_ms > 0:
+            time.sleep(latency_ms / 1000.0)
+
+        with cls._lock:
+            message_id = f"local-{len(cls._outbox) + 1}-{int(time.time() * 1000)}"
+            cls._outbox.append({"id": message_id, "raw": raw})
+        return {"id": message_id, "labelIds": ["SENT"]}
+
+    @classmethod
+    def sent_messages(cls) -> List[Dict[str, Any]]:
+        """Return a copy of the messages sent through the local transport"""
+        with cls._lock:
+            return list(cls._outbox)
+
+    @classmethod
+    def clear(cls) -> None:
+        """Empty the local outbox"""
+        with cls._lock:
+            cls._outbox.clear()
+
+
+class GmailClientCache:
+    """
+    Process-wide cache of the delegated Gmail API client.
+
+    The service account JSON is parsed, the delegated credentials are built and
+    the discovery client is created only once per (service account, delegated
+    user). The access token is refreshed only when it is missing or expired.
+    httplib2 connections are not thread-safe, so each thread gets its own
+    authorized HTTP object that shares the cached credentials.
+    """
+
+    _lock = threading.Lock()
+    _key: Optional[Tuple[str, str]] = None
+    _credentials = None
+    _service = None
+    _local = threading.local()
+
+    @classmethod
+    def _load_credentials(cls, sa_json: str, delegated_user: str):
+        """Build delegated service-account credentials"""
+        try:
+            # Support JSON string or file path
+            if sa_json.strip().startswith('{'):
+                sa_info = json.loads(sa_json)
+                creds = service_account.Credentials.from_service_account_info(
+                    sa_info,
+                    scopes=GMAIL_SEND_SCOPES
+                )
+            else:
+                creds = service_account.Credentials.from_service_account_file(
+                    sa_json,
+                    scopes=GMAIL_SEND_SCOPES
+                )
+        except Exception as e:
+            raise RuntimeError(f"Error loading service account credentials: {e}")
+
+        return creds.with_subject(delegated_user)
+
+    @classmethod
+    def get_service(cls, sa_json: str, delegated_user: str):
+        """
+        Get the cached Gmail service, building it on first use
+
+        Args:
+            sa_json: Service account JSON string or file path
+            delegated_user: User to impersonate
+
+        Returns:
+            Gmail API service resource
+        """
+        key = (sa_json, delegated_user)
+        with cls._lock:
+            if cls._service is None or cls._key != key:
+                credentials = cls._load_credentials(sa_json, delegated_user)
+                cls._service = build(
+                    'gmail', 'v1',
+                    credentials=credentials,
+                    cache_discovery=False
+                )
+                cls._credentials = credentials
+                cls._key = key
+                cls._local = threading.local()
+            return cls._service
+
+    @classmethod
+    def _ensure_fresh_token(cls) -> None:
+        """Refresh the access token only if it is missing or expired"""
+        with cls._lock:
+            if cls._credentials is not None and not cls._credentials.valid:
+                cls._credentials.refresh(GoogleAuthRequest())
+
+    @classmethod
+    def get_http(cls):
+        """Get this thread's authorized HTTP object bound to the cached credentials"""
+        cls._ensure_fresh_token()
+        http = getattr(cls._local, "http", None)
+        if http is None:
+            connection = LocalGmailTransport() if settings.GMAIL_TRANSPORT == "local" else httplib2.Http()
+            http = google_auth_httplib2.AuthorizedHttp(
+                cls._credentials,
+                http=connection
+            )
+            cls._local.http = http
+        return http
+
+    @classmethod
+    def reset(cls) -> None:
+        """Drop the cached client (e.g. after rotating the service account)"""
+        with cls._lock:
+            cls._key = None
+            cls._credentials = None
+            cls._service = None
+            cls._local = threading.local()
+
 
 class EmailService:
     """Service for sending emails via SMTP or Gmail API"""
@@ -85,44 +252,32 @@ class EmailService:
         Raises:
             RuntimeError: If Gmail API is not available or misconfigured
         """
-        if not GMAIL_API_AVAILABLE:
-            raise RuntimeError("googleapiclient/google-auth not available")
-        
+        msg = EmailMessage()
+        msg['From'] = sender
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        msg.set_content(body)
+        raw = base64.urlsafe_b64encode(msg.as_bytes()).decode('utf-8')
+
         sa_json = settings.GMAIL_SERVICE_ACCOUNT_JSON
         delegated_user = settings.GMAIL_DELEGATED_USER or sender
+
+        if settings.GMAIL_TRANSPORT == "local" and not sa_json:
+            LocalGmailTransport.send(raw)
+            return
+
+        if not GMAIL_API_AVAILABLE:
+            raise RuntimeError("googleapiclient/google-auth not available")
         
         if not sa_json:
             raise RuntimeError(
                 "GMAIL_SERVICE_ACCOUNT_JSON not set in environment variables"
             )
         
-        try:
-            # Support JSON string or file path
-            if sa_json.strip().startswith('{'):
-                sa_info = json.loads(sa_json)
-                creds = service_account.Credentials.from_service_account_info(
-                    sa_info,
-                    scopes=["https://www.googleapis.com/auth/gmail.send"]
-                )
-            else:
-                creds = service_account.Credentials.from_service_account_file(
-                    sa_json,
-                    scopes=["https://www.googleapis.com/auth/gmail.send"]
-                )
-        except Exception as e:
-            raise RuntimeError(f"Error loading service account credentials: {e}")
-        
-        delegated = creds.with_subject(delegated_user)
-        service = build('gmail', 'v1', credentials=delegated, cache_discovery=False)
-        
-        msg = EmailMessage()
-        msg['From'] = sender
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.set_content(body)
-        
-        raw = base64.urlsafe_b64encode(msg.as_bytes()).decode('utf-8')
-        service.users().messages().send(userId='me', body={'raw': raw}).execute()
+        service = GmailClientCache.get_service(sa_json, delegated_user)
+        service.users().messages().send(userId='me', body={'raw': raw}).execute(
+            http=GmailClientCache.get_http()
+        )
     
     @staticmethod
     def send_alert_email(to_email: str, subject: str, body: str) -> None:
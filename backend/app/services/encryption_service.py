@@ -10,6 +10,8 @@ from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+from app.services.metrics_service import metrics
+
 
 class EncryptionService:
     """Servicio para encriptar y desencriptar datos sensibles"""
@@ -95,6 +97,7 @@ class EncryptionService:
             print(f"[ENCRYPTION_ERROR] Error al encriptar: {e}")
             raise ValueError(f"Error al encriptar dato: {e}")
     
+    @metrics.timed("decrypt")
     def decrypt(self, encrypted_data: Optional[str]) -> Optional[Any]:
         """
         Desencripta un dato encriptado
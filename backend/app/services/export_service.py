@@ -0,0 +1,90 @@
+"""
+Streaming exports of student data
+Notes are read page by page, decrypted and written out as they arrive, so memory stays flat
+"""
+import csv
+import io
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.config.settings import settings
+from app.db.repositories import notas_repo
+from app.services.encryption_service import encryption_service
+from app.services.text_analysis_service import TextAnalysisService
+
+# Same columns and separator as the former DataFrame.to_csv export
+NOTES_CSV_COLUMNS = ["nota_original", "texto_procesado", "tokens", "sentimiento", "emocion", "emocion_score"]
+NOTES_EXPORT_COLUMNS = "id, nota, tokens, sentimiento, emocion, emocion_score, created_at"
+
+
+class ExportService:
+    """Builders for report exports"""
+
+    @staticmethod
+    async def analyzed_note(row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Decrypt a stored note and merge its persisted analysis
+
+        Notes saved without analysis (older rows) are analyzed on the fly, off
+        the event loop.
+
+        Args:
+            row: Row from `notas` with encrypted nota/tokens
+
+        Returns:
+            Dictionary with the NOTES_CSV_COLUMNS fields
+        """
+        note = encryption_service.decrypt(row.get("nota")) or ""
+        tokens = encryption_service.decrypt(row.get("tokens")) if row.get("tokens") else None
+        if row.get("sentimiento") is None or not isinstance(tokens, list):
+            analysis = await run_in_threadpool(TextAnalysisService.analyze_single_note, note)
+        else:
+            analysis = {
+                "texto_procesado": " ".join(tokens),
+                "tokens": tokens,
+                "sentimiento": row.get("sentimiento"),
+                "emocion": row.get("emocion"),
+                "emocion_score": row.get("emocion_score"),
+            }
+        return {"nota_original": note, **analysis}
+
+    @staticmethod
+    def _csv_chunk(records: List[Dict[str, Any]], header: bool = False) -> str:
+        buf = io.StringIO()
+        writer = csv.writer(buf, delimiter=";", lineterminator="\n")
+        if header:
+            writer.writerow(NOTES_CSV_COLUMNS)
+        for record in records:
+            writer.writerow([record.get(column) for column in NOTES_CSV_COLUMNS])
+        return buf.getvalue()
+
+    @classmethod
+    async def notes_first_page(cls, user_id: str) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """First page of a student's notes (lets the route answer 404 before streaming)"""
+        return await notas_repo.page_by_user(user_id, settings.PAGE_SIZE_MAX, None, NOTES_EXPORT_COLUMNS)
+
+    @classmethod
+    async def stream_notes_csv(
+        cls,
+        user_id: str,
+        first_page: List[Dict[str, Any]],
+        cursor: Optional[str]
+    ) -> AsyncIterator[str]:
+        """
+        CSV of a student's analyzed notes, one chunk per page of rows
+
+        Args:
+            user_id: Student id
+            first_page: Rows already fetched with `notes_first_page`
+            cursor: Cursor of the next page (None when there is only one)
+        """
+        yield cls._csv_chunk([], header=True)
+        rows = first_page
+        while True:
+            yield cls._csv_chunk([await cls.analyzed_note(row) for row in rows])
+            if cursor is None:
+                break
+            rows, cursor = await notas_repo.page_by_user(
+                user_id, settings.PAGE_SIZE_MAX, cursor, NOTES_EXPORT_COLUMNS
+            )
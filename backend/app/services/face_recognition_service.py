@@ -9,11 +9,14 @@ from datetime import datetime
 from typing import Tuple, Optional
 from fastapi import HTTPException
 
+from app.services.metrics_service import metrics
+
 
 class FaceRecognitionService:
     """Service for face recognition operations"""
     
     @staticmethod
+    @metrics.timed("opencv")
     def decode_base64_image(data_b64: str) -> np.ndarray:
         """
         Decode base64 image string to numpy array
@@ -41,6 +44,7 @@ class FaceRecognitionService:
             )
     
     @staticmethod
+    @metrics.timed("dlib")
     def extract_face_encoding(img_bgr: np.ndarray) -> list:
         """
         Extract face encoding from image
@@ -78,6 +82,7 @@ class FaceRecognitionService:
         return encodings[0].tolist()
     
     @staticmethod
+    @metrics.timed("dlib")
     def compare_face(
         stored_encoding: list, 
         img_bgr: np.ndarray, 
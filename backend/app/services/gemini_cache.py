@@ -0,0 +1,199 @@
+"""
+Response cache for Gemini generations
+Keyed by prompt template version, model and a hash of the inputs, with a TTL,
+LRU size bound and an optional persistent SQLite tier
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from app.config.settings import settings
+from app.services.encryption_service import encryption_service
+from app.services.metrics_service import metrics
+
+
+class GeminiResponseCache:
+    """
+    Two-tier cache of generated texts.
+
+    - Memory tier: LRU bounded by GEMINI_CACHE_MAX_ENTRIES.
+    - Persistent tier (optional): SQLite file at GEMINI_CACHE_DB_PATH, so repeated
+      views survive restarts. Values are stored encrypted, like the rest of the
+      student data.
+    Entries expire after GEMINI_CACHE_TTL_SECONDS.
+    """
+
+    _lock = threading.Lock()
+    _entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+    _db: Optional[sqlite3.Connection] = None
+    _db_path: Optional[str] = None
+
+    @staticmethod
+    def make_key(template_version: str, model: str, inputs: Any) -> str:
+        """
+        Fingerprint of a generation request
+
+        Args:
+            template_version: Version tag of the prompt template
+            model: Requested model name
+            inputs: JSON-serializable inputs of the prompt
+        """
+        raw = json.dumps(
+            [template_version, model, inputs],
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str
+        )
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def _get_db(cls) -> Optional[sqlite3.Connection]:
+        """Open the persistent tier lazily (None when disabled)"""
+        path = settings.GEMINI_CACHE_DB_PATH
+        if not path:
+            return None
+        if cls._db is None or cls._db_path != path:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS gemini_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            db.commit()
+            cls._db = db
+            cls._db_path = path
+        return cls._db
+
+    @classmethod
+    def get(cls, key: str, cache_name: str) -> Optional[str]:
+        """
+        Look up a cached response
+
+        Args:
+            key: Key from make_key
+            cache_name: Logical cache name used as metrics label (e.g. "insight")
+        """
+        value = cls._lookup(key, cache_name)
+        if value is None:
+            metrics.inc("gemini_cache_requests_total", {"cache": cache_name, "result": "miss", "tier": "none"})
+        return value
+
+    @classmethod
+    def get_any(cls, keys: List[str], cache_name: str) -> Optional[str]:
+        """
+        First cached response among several keys (counted as a single lookup)
+
+        Args:
+            keys: Keys from make_key, in order of preference
+            cache_name: Logical cache name used as metrics label
+        """
+        for key in keys:
+            value = cls._lookup(key, cache_name)
+            if value is not None:
+                return value
+        metrics.inc("gemini_cache_requests_total", {"cache": cache_name, "result": "miss", "tier": "none"})
+        return None
+
+    @classmethod
+    def _lookup(cls, key: str, cache_name: str) -> Optional[str]:
+        """Value of a key in either tier (hits are counted, misses are left to the caller)"""
+        now = time.time()
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    cls._entries.move_to_end(key)
+                    metrics.inc("gemini_cache_requests_total", {"cache": cache_name, "result": "hit", "tier": "memory"})
+                    return value
+                cls._entries.pop(key, None)
+
+            try:
+                db = cls._get_db()
+                row = None
+                if db is not None:
+                    row = db.execute(
+                        "SELECT value, expires_at FROM gemini_cache WHERE key = ?", (key,)
+                    ).fetchone()
+            except sqlite3.Error as e:
+                print(f"[GEMINI_CACHE] Error leyendo caché persistente: {e}")
+                row = None
+
+            if row is not None and row[1] > now:
+                value = encryption_service.decrypt(row[0])
+                if isinstance(value, str):
+                    cls._store_memory(key, value, row[1])
+                    metrics.inc("gemini_cache_requests_total", {"cache": cache_name, "result": "hit", "tier": "persistent"})
+                    return value
+        return None
+
+    @classmethod
+    def _store_memory(cls, key: str, value: str, expires_at: float) -> None:
+        """Insert into the LRU tier (caller holds the lock)"""
+        cls._entries[key] = (expires_at, value)
+        cls._entries.move_to_end(key)
+        while len(cls._entries) > settings.GEMINI_CACHE_MAX_ENTRIES:
+            cls._entries.popitem(last=False)
+            metrics.inc("gemini_cache_evictions_total")
+
+    @classmethod
+    def set(cls, key: str, value: str, ttl: Optional[float] = None) -> None:
+        """Store a response in both tiers"""
+        expires_at = time.time() + (ttl if ttl is not None else settings.GEMINI_CACHE_TTL_SECONDS)
+        with cls._lock:
+            cls._store_memory(key, value, expires_at)
+            try:
+                db = cls._get_db()
+                if db is not None:
+                    db.execute(
+                        "INSERT OR REPLACE INTO gemini_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, encryption_service.encrypt(value), expires_at)
+                    )
+                    db.execute("DELETE FROM gemini_cache WHERE expires_at <= ?", (time.time(),))
+                    db.commit()
+            except sqlite3.Error as e:
+                print(f"[GEMINI_CACHE] Error escribiendo caché persistente: {e}")
+
+    @classmethod
+    def record_bypass(cls, cache_name: str) -> None:
+        """Count a lookup skipped on purpose by the caller"""
+        metrics.inc("gemini_cache_requests_total", {"cache": cache_name, "result": "bypass", "tier": "none"})
+
+    @classmethod
+    def clear(cls) -> None:
+        """Drop every cached response (both tiers)"""
+        with cls._lock:
+            cls._entries.clear()
+            try:
+                db = cls._get_db()
+                if db is not None:
+                    db.execute("DELETE FROM gemini_cache")
+                    db.commit()
+            except sqlite3.Error as e:
+                print(f"[GEMINI_CACHE] Error limpiando caché persistente: {e}")
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Hit rate per logical cache plus current memory size"""
+        by_cache: dict = {}
+        for item in metrics.snapshot(prefix="gemini_cache_requests_total").get("gemini_cache_requests_total", []):
+            name = item["labels"].get("cache", "")
+            result = item["labels"].get("result", "")
+            counts = by_cache.setdefault(name, {"hit": 0.0, "miss": 0.0, "bypass": 0.0})
+            counts[result] = counts.get(result, 0.0) + item["value"]
+        for counts in by_cache.values():
+            lookups = counts["hit"] + counts["miss"]
+            counts["hit_rate"] = round(counts["hit"] / lookups, 4) if lookups else 0.0
+        with cls._lock:
+            size = len(cls._entries)
+        return {
+            "memory_entries": size,
+            "persistent": bool(settings.GEMINI_CACHE_DB_PATH),
+            "caches": by_cache,
+        }
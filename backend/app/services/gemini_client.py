@@ -0,0 +1,99 @@
+"""
+Shared HTTP clients for the Gemini REST API
+Reuses pooled keep-alive connections instead of opening a new TLS session per call
+"""
+import threading
+from typing import Optional
+
+import httpx
+import requests
+from app.config.settings import settings
+
+try:
+    import h2  # noqa: F401  (required by httpx for HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def _base_url() -> str:
+    """Gemini API base URL (GEMINI_BASE_URL can point to the local stub server)"""
+    return settings.GEMINI_BASE_URL.rstrip("/")
+
+
+class GeminiHttpClient:
+    """Process-wide pooled HTTP clients for Gemini (async httpx + sync requests)"""
+
+    _async_client: Optional[httpx.AsyncClient] = None
+    _session: Optional[requests.Session] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def generate_url(model: str) -> str:
+        """Build the generateContent URL for a model"""
+        return f"{_base_url()}/v1beta/models/{model}:generateContent"
+
+    @staticmethod
+    def stream_url(model: str) -> str:
+        """Build the streamGenerateContent URL (Server-Sent Events framing)"""
+        return f"{_base_url()}/v1beta/models/{model}:streamGenerateContent?alt=sse"
+
+    @staticmethod
+    def headers(api_key: str) -> dict:
+        """Request headers for Gemini calls"""
+        return {
+            "Content-Type": "application/json",
+            # Docs use lowercase; header names are case-insensitive but we keep consistent
+            "x-goog-api-key": api_key,
+        }
+
+    @classmethod
+    def get_async_client(cls) -> httpx.AsyncClient:
+        """
+        Get the shared async client, creating it on first use
+
+        Keep-alive, HTTP/2 (when `h2` is installed), connection limits and
+        timeouts are configured from Settings.
+        """
+        if cls._async_client is None or cls._async_client.is_closed:
+            with cls._lock:
+                if cls._async_client is None or cls._async_client.is_closed:
+                    cls._async_client = httpx.AsyncClient(
+                        http2=settings.GEMINI_HTTP2 and HTTP2_AVAILABLE,
+                        limits=httpx.Limits(
+                            max_connections=settings.GEMINI_MAX_CONNECTIONS,
+                            max_keepalive_connections=settings.GEMINI_MAX_KEEPALIVE,
+                            keepalive_expiry=settings.GEMINI_KEEPALIVE_EXPIRY,
+                        ),
+                        timeout=httpx.Timeout(
+                            settings.GEMINI_TIMEOUT_SECONDS,
+                            connect=settings.GEMINI_CONNECT_TIMEOUT_SECONDS,
+                        ),
+                    )
+        return cls._async_client
+
+    @classmethod
+    def get_session(cls) -> requests.Session:
+        """Get the shared requests session used by the synchronous code path"""
+        if cls._session is None:
+            with cls._lock:
+                if cls._session is None:
+                    session = requests.Session()
+                    adapter = requests.adapters.HTTPAdapter(
+                        pool_connections=1,
+                        pool_maxsize=settings.GEMINI_MAX_CONNECTIONS,
+                    )
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    cls._session = session
+        return cls._session
+
+    @classmethod
+    async def aclose(cls) -> None:
+        """Close pooled connections (called on application shutdown)"""
+        if cls._async_client is not None:
+            await cls._async_client.aclose()
+            cls._async_client = None
+        if cls._session is not None:
+            cls._session.close()
+            cls._session = None
@@ -0,0 +1,142 @@
+"""
+Per-model health memory and circuit breaker for Gemini calls
+Avoids retrying models that just failed and fails fast while a circuit is open
+"""
+import threading
+import time
+from typing import Dict, Optional
+
+from app.config.settings import settings
+
+
+class _ModelState:
+    """Mutable health state of one model"""
+
+    __slots__ = (
+        "disabled_until", "disabled_reason", "consecutive_failures",
+        "circuit_open_until", "half_open_in_flight",
+    )
+
+    def __init__(self):
+        self.disabled_until = 0.0
+        self.disabled_reason: Optional[str] = None
+        self.consecutive_failures = 0
+        self.circuit_open_until = 0.0
+        self.half_open_in_flight = False
+
+
+class ModelHealthRegistry:
+    """
+    Remembers how each Gemini model behaved recently.
+
+    - 403/404 (model disabled or unknown): the model is skipped for
+      GEMINI_MODEL_COOLDOWN_SECONDS.
+    - 5xx / timeouts: after GEMINI_CIRCUIT_FAILURE_THRESHOLD consecutive
+      failures the circuit opens for GEMINI_CIRCUIT_RESET_SECONDS. Once that
+      elapses a single half-open trial call is allowed; success closes the
+      circuit, failure opens it again.
+    """
+
+    _lock = threading.Lock()
+    _states: Dict[str, _ModelState] = {}
+
+    @classmethod
+    def _state(cls, model: str) -> _ModelState:
+        state = cls._states.get(model)
+        if state is None:
+            state = cls._states[model] = _ModelState()
+        return state
+
+    @classmethod
+    def acquire(cls, model: str) -> Optional[str]:
+        """
+        Check whether a call to `model` may go out now
+
+        Returns:
+            None if the call is allowed, otherwise the reason it is skipped
+            ("cooldown" or "circuit_open")
+        """
+        now = time.monotonic()
+        with cls._lock:
+            state = cls._state(model)
+            if state.disabled_until > now:
+                return "cooldown"
+            if state.circuit_open_until:
+                if state.circuit_open_until > now:
+                    return "circuit_open"
+                # Half-open: allow exactly one trial call
+                if state.half_open_in_flight:
+                    return "circuit_open"
+                state.half_open_in_flight = True
+            return None
+
+    @classmethod
+    def record_success(cls, model: str) -> None:
+        """Model answered correctly: clear failures and close the circuit"""
+        with cls._lock:
+            state = cls._state(model)
+            state.consecutive_failures = 0
+            state.circuit_open_until = 0.0
+            state.half_open_in_flight = False
+            state.disabled_until = 0.0
+            state.disabled_reason = None
+
+    @classmethod
+    def record_unavailable(cls, model: str, status_code: int) -> None:
+        """Model rejected the call with 403/404: skip it for the cooldown period"""
+        with cls._lock:
+            state = cls._state(model)
+            state.disabled_until = time.monotonic() + settings.GEMINI_MODEL_COOLDOWN_SECONDS
+            state.disabled_reason = f"http_{status_code}"
+            state.half_open_in_flight = False
+
+    @classmethod
+    def record_neutral(cls, model: str) -> None:
+        """Call finished without saying anything about model health (e.g. 429)"""
+        with cls._lock:
+            cls._state(model).half_open_in_flight = False
+
+    @classmethod
+    def record_failure(cls, model: str) -> bool:
+        """
+        Record a 5xx or timeout
+
+        Returns:
+            True if this failure opened (or re-opened) the circuit
+        """
+        with cls._lock:
+            state = cls._state(model)
+            state.consecutive_failures += 1
+            was_half_open = state.half_open_in_flight
+            state.half_open_in_flight = False
+            if was_half_open or state.consecutive_failures >= settings.GEMINI_CIRCUIT_FAILURE_THRESHOLD:
+                state.circuit_open_until = time.monotonic() + settings.GEMINI_CIRCUIT_RESET_SECONDS
+                return True
+            return False
+
+    @classmethod
+    def snapshot(cls) -> Dict[str, Dict]:
+        """Current health of every model seen so far"""
+        now = time.monotonic()
+        with cls._lock:
+            result = {}
+            for model, state in cls._states.items():
+                if state.circuit_open_until > now:
+                    circuit = "open"
+                elif state.circuit_open_until:
+                    circuit = "half_open"
+                else:
+                    circuit = "closed"
+                result[model] = {
+                    "circuit": circuit,
+                    "consecutive_failures": state.consecutive_failures,
+                    "cooldown_remaining_seconds": round(max(0.0, state.disabled_until - now), 1),
+                    "cooldown_reason": state.disabled_reason if state.disabled_until > now else None,
+                }
+            return result
+
+    @classmethod
+    def reset(cls) -> None:
+        """Forget all health information"""
+        with cls._lock:
+            cls._states = {}
@@ -0,0 +1,262 @@
+"""
+Process-wide rate limiting and bounded concurrency for outbound Gemini calls
+Token bucket + priority semaphore shared by the sync and async code paths
+"""
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from app.config.settings import settings
+from app.services.metrics_service import metrics
+
+# Priority classes (lower value is served first)
+PRIORITY_INTERACTIVE = "interactive"  # chatbot
+PRIORITY_STANDARD = "standard"        # attendance insight
+PRIORITY_BACKGROUND = "background"    # note accompaniment, drawing insights
+
+_PRIORITY_ORDER = {
+    PRIORITY_INTERACTIVE: 0,
+    PRIORITY_STANDARD: 1,
+    PRIORITY_BACKGROUND: 2,
+}
+
+
+class GeminiQueueTimeout(Exception):
+    """Raised when a call waited longer than GEMINI_QUEUE_TIMEOUT_SECONDS for a slot"""
+
+
+class _Waiter:
+    """A queued caller; `wake` is safe to call from any thread"""
+
+    __slots__ = ("priority", "granted", "cancelled", "_event", "_future", "_loop")
+
+    def __init__(self, priority: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.priority = priority
+        self.granted = False
+        self.cancelled = False
+        self._loop = loop
+        self._event = None if loop else threading.Event()
+        self._future = loop.create_future() if loop else None
+
+    def wake(self) -> None:
+        if self._loop is None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self) -> None:
+        if not self._future.done():
+            self._future.set_result(None)
+
+    def wait_sync(self, timeout: float) -> None:
+        self._event.wait(timeout)
+        self._event.clear()
+
+    async def wait_async(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except asyncio.TimeoutError:
+            return
+        if not self.granted:
+            self._future = self._loop.create_future()
+
+
+class GeminiRateLimiter:
+    """
+    Admission control for outbound Gemini requests.
+
+    - Token bucket: GEMINI_RATE_LIMIT_RPS sustained, GEMINI_RATE_LIMIT_BURST burst.
+    - Concurrency: at most GEMINI_MAX_CONCURRENCY requests in flight; background
+      calls leave GEMINI_INTERACTIVE_RESERVED slots free for higher classes.
+    - Waiters are served by priority class, then FIFO.
+    A 429 from Gemini empties the bucket so the queue backs off instead of
+    cascading through the fallback models.
+    """
+
+    _lock = threading.Lock()
+    _queue: List = []
+    _seq = itertools.count()
+    _in_flight = 0
+    _tokens: Optional[float] = None
+    _last_refill = 0.0
+
+    @classmethod
+    def _refill(cls, now: float) -> None:
+        burst = float(settings.GEMINI_RATE_LIMIT_BURST)
+        if cls._tokens is None:
+            cls._tokens = burst
+        else:
+            cls._tokens = min(burst, cls._tokens + (now - cls._last_refill) * settings.GEMINI_RATE_LIMIT_RPS)
+        cls._last_refill = now
+
+    @staticmethod
+    def _capacity(priority: str) -> int:
+        limit = settings.GEMINI_MAX_CONCURRENCY
+        if priority == PRIORITY_BACKGROUND:
+            return max(1, limit - settings.GEMINI_INTERACTIVE_RESERVED)
+        return limit
+
+    @classmethod
+    def _dispatch(cls) -> None:
+        """Grant slots to queued waiters in priority order (caller holds the lock)"""
+        cls._refill(time.monotonic())
+        while cls._queue:
+            _, _, waiter = cls._queue[0]
+            if waiter.cancelled:
+                heapq.heappop(cls._queue)
+                continue
+            if cls._in_flight >= cls._capacity(waiter.priority) or cls._tokens < 1:
+                break
+            heapq.heappop(cls._queue)
+            cls._in_flight += 1
+            cls._tokens -= 1
+            waiter.granted = True
+            waiter.wake()
+        cls._update_gauges()
+
+    @classmethod
+    def _update_gauges(cls) -> None:
+        depth: Dict[str, int] = {p: 0 for p in _PRIORITY_ORDER}
+        for _, _, waiter in cls._queue:
+            if not waiter.cancelled:
+                depth[waiter.priority] += 1
+        for priority, count in depth.items():
+            metrics.set_gauge("gemini_queue_depth", count, {"priority": priority})
+        metrics.set_gauge("gemini_in_flight", cls._in_flight)
+
+    @classmethod
+    def _next_token_delay(cls) -> float:
+        """Seconds until the bucket has a token again (polling interval for waiters)"""
+        rate = settings.GEMINI_RATE_LIMIT_RPS
+        if rate <= 0:
+            return 1.0
+        missing = max(0.0, 1 - (cls._tokens or 0.0))
+        return max(0.005, missing / rate)
+
+    @classmethod
+    def _enqueue(cls, waiter: _Waiter) -> None:
+        if waiter.priority not in _PRIORITY_ORDER:
+            raise ValueError(f"Unknown Gemini priority class: {waiter.priority}")
+        with cls._lock:
+            heapq.heappush(cls._queue, (_PRIORITY_ORDER[waiter.priority], next(cls._seq), waiter))
+            cls._dispatch()
+
+    @classmethod
+    def _poll(cls, waiter: _Waiter) -> float:
+        """Retry dispatch after a wait; returns the next wait interval"""
+        with cls._lock:
+            if not waiter.granted:
+                cls._dispatch()
+            return cls._next_token_delay()
+
+    @classmethod
+    def _abandon(cls, waiter: _Waiter) -> None:
+        """Leave the queue (timeout / cancellation), giving back a slot granted meanwhile"""
+        with cls._lock:
+            waiter.cancelled = True
+            if waiter.granted:
+                cls._in_flight -= 1
+            cls._dispatch()
+
+    @classmethod
+    def _record_wait(cls, priority: str, started: float) -> None:
+        metrics.observe("gemini_queue_wait_seconds", time.monotonic() - started, {"priority": priority})
+
+    @classmethod
+    def _timed_out(cls, waiter: _Waiter, started: float) -> GeminiQueueTimeout:
+        cls._abandon(waiter)
+        cls._record_wait(waiter.priority, started)
+        metrics.inc("gemini_queue_timeouts_total", {"priority": waiter.priority})
+        return GeminiQueueTimeout(
+            f"Gemini queue wait exceeded {settings.GEMINI_QUEUE_TIMEOUT_SECONDS}s ({waiter.priority})"
+        )
+
+    @classmethod
+    def release(cls) -> None:
+        """Free a concurrency slot"""
+        with cls._lock:
+            cls._in_flight = max(0, cls._in_flight - 1)
+            cls._dispatch()
+
+    @classmethod
+    def penalize(cls) -> None:
+        """Empty the bucket after a 429 so queued calls back off"""
+        with cls._lock:
+            cls._refill(time.monotonic())
+            cls._tokens = min(cls._tokens, 0.0)
+
+    @classmethod
+    async def acquire_async(cls, priority: str) -> None:
+        """Wait (without blocking the event loop) for a token and a concurrency slot"""
+        started = time.monotonic()
+        deadline = started + settings.GEMINI_QUEUE_TIMEOUT_SECONDS
+        waiter = _Waiter(priority, asyncio.get_running_loop())
+        cls._enqueue(waiter)
+        try:
+            delay = cls._next_token_delay()
+            while not waiter.granted:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise cls._timed_out(waiter, started)
+                await waiter.wait_async(min(delay, remaining))
+                delay = cls._poll(waiter)
+        except asyncio.CancelledError:
+            cls._abandon(waiter)
+            raise
+        cls._record_wait(priority, started)
+
+    @classmethod
+    def acquire_sync(cls, priority: str) -> None:
+        """Blocking variant of acquire_async for the synchronous code path"""
+        started = time.monotonic()
+        deadline = started + settings.GEMINI_QUEUE_TIMEOUT_SECONDS
+        waiter = _Waiter(priority)
+        cls._enqueue(waiter)
+        delay = cls._next_token_delay()
+        while not waiter.granted:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise cls._timed_out(waiter, started)
+            waiter.wait_sync(min(delay, remaining))
+            delay = cls._poll(waiter)
+        cls._record_wait(priority, started)
+
+    @classmethod
+    @asynccontextmanager
+    async def slot(cls, priority: str) -> AsyncIterator[None]:
+        """`async with GeminiRateLimiter.slot(priority):` around one outbound request"""
+        await cls.acquire_async(priority)
+        try:
+            yield
+        finally:
+            cls.release()
+
+    @classmethod
+    @contextmanager
+    def slot_sync(cls, priority: str) -> Iterator[None]:
+        """`with GeminiRateLimiter.slot_sync(priority):` around one outbound request"""
+        cls.acquire_sync(priority)
+        try:
+            yield
+        finally:
+            cls.release()
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Current queue depth per class, in-flight calls and available tokens"""
+        with cls._lock:
+            cls._refill(time.monotonic())
+            depth: Dict[str, int] = {p: 0 for p in _PRIORITY_ORDER}
+            for _, _, waiter in cls._queue:
+                if not waiter.cancelled:
+                    depth[waiter.priority] += 1
+            return {
+                "in_flight": cls._in_flight,
+                "max_concurrency": settings.GEMINI_MAX_CONCURRENCY,
+                "tokens": round(cls._tokens, 2),
+                "queued": depth,
+            }
@@ -2,9 +2,32 @@
 Gemini AI service for generating content and insights
 """
 import os
+import json
+import time
+import httpx
 import requests
-from typing import Optional
+from typing import AsyncIterator, Iterator, Optional, Tuple
 from app.config.settings import settings
+from app.services.gemini_client import GeminiHttpClient
+from app.services.gemini_cache import GeminiResponseCache
+from app.services.gemini_health import ModelHealthRegistry
+from app.services.gemini_limiter import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_STANDARD,
+    GeminiQueueTimeout,
+    GeminiRateLimiter,
+)
+from app.services.gemini_singleflight import GeminiSingleFlight
+from app.services.metrics_service import metrics
+from app.services.prompt_builder import InsightPromptBuilder, estimate_tokens
+
+_INVALID_KEY_ACCOMPANIMENT = "No se pudo generar acompañamiento: la API key de Gemini está invalidada. Genera y configura una nueva clave."
+_INVALID_KEY_INSIGHT = "No se pudo generar insight: la API key de Gemini está invalidada. Genera y configura una nueva clave."
+# Bump when the insight prompt template changes so cached answers are not reused
+INSIGHT_PROMPT_VERSION = "insight-v2"
+
+_INVALID_KEY_CHATBOT = "No se pudo generar respuesta: la API key de Gemini está invalidada. Genera y configura una nueva clave."
 
 
 class GeminiService:
@@ -17,19 +40,482 @@ class GeminiService:
     ]
 
     @staticmethod
-    def _post_generate(model: str, payload: dict, api_key: str) -> requests.Response:
+    def _post_generate(
+        model: str,
+        payload: dict,
+        api_key: str,
+        priority: str = PRIORITY_STANDARD
+    ) -> requests.Response:
         """
         Perform POST to Gemini generateContent endpoint.
 
-        Uses v1beta endpoint and `x-goog-api-key` header.
+        Uses v1beta endpoint and `x-goog-api-key` header over the shared
+        keep-alive session, once admitted by the rate limiter.
+        """
+        with GeminiRateLimiter.slot_sync(priority):
+            return GeminiHttpClient.get_session().post(
+                GeminiHttpClient.generate_url(model),
+                json=payload,
+                headers=GeminiHttpClient.headers(api_key),
+                timeout=settings.GEMINI_TIMEOUT_SECONDS
+            )
+
+    @staticmethod
+    async def _post_generate_async(
+        model: str,
+        payload: dict,
+        api_key: str,
+        priority: str = PRIORITY_STANDARD
+    ) -> httpx.Response:
+        """Async POST to generateContent using the shared pooled httpx client"""
+        client = GeminiHttpClient.get_async_client()
+        async with GeminiRateLimiter.slot(priority):
+            return await client.post(
+                GeminiHttpClient.generate_url(model),
+                json=payload,
+                headers=GeminiHttpClient.headers(api_key)
+            )
+
+    @staticmethod
+    def _models_to_try() -> list[str]:
+        """Requested model first, then the fallbacks"""
+        # Usar modelo desde variable de entorno con valor por defecto
+        model = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
+        return [model] + [m for m in GeminiService._FALLBACK_MODELS if m != model]
+
+    @staticmethod
+    def _build_payload(prompt: str) -> dict:
+        """Wrap a prompt in the generateContent request body"""
+        return {
+            "contents": [
+                {"parts": [{"text": prompt}]}
+            ]
+        }
+
+    @staticmethod
+    def _build_accompaniment_prompt(text: str) -> str:
+        """Prompt for the emotional accompaniment of a diary note"""
+        return (
+            "Eres un asistente empático que ofrece acompañamiento emocional breve y respetuoso. "
+            "Después de leer la nota del usuario, responde con un mensaje de apoyo que refleje "
+            "lo que el usuario escribió, ofrece una observación o consejo breve y termina siempre "
+            "con una frase motivadora corta. No ofrezcas diagnóstico médico ni consejos terapéuticos "
+            "detallados; si es necesario, sugiere buscar ayuda profesional. Responde en español.\n\n"
+            f"Nota del usuario: {text}\n\nRespuesta:"
+        )
+
+    @staticmethod
+    def _build_insight_prompt(texts: list[str]) -> str:
+        """Prompt for the attendance insight and action plan (texts most recent first)"""
+        prompt = (
+            "Eres un psicólogo universitario. Analiza brevemente los siguientes "
+            "aprendizajes obtenidos por el estudiante en sus citas y genera:\n"
+            "- Un resumen breve (máximo 3 líneas).\n"
+            "- Una recomendación breve y concreta como plan de acción para la siguiente "
+            "sesión (máximo 2 líneas).\n"
+            "El resultado debe estar en español, estar en prosa, ser breve y ser útil "
+            "para el psicólogo.\n\n"
+        )
+        footer = "\nInsight y plan de acción:"
+
+        # Long histories: recent learnings verbatim, older ones as a rolling summary
+        section, stats = InsightPromptBuilder.build_learnings_section(
+            texts,
+            settings.GEMINI_INSIGHT_TOKEN_BUDGET - estimate_tokens(prompt + footer)
+        )
+        prompt += section + footer
+        InsightPromptBuilder.record_prompt_size(prompt, "insight", stats)
+        return prompt
+
+    @staticmethod
+    def _build_chatbot_prompt(context: dict, question: str) -> str:
+        """Prompt for the psychologist's attendance chatbot"""
+        prompt = (
+            "Eres un asistente psicológico empático y conversacional. "
+            "Responde de forma breve (1 a 3 líneas), con tono cálido, humano y natural. "
+            "Anima a seguir conversando o preguntando. Evita respuestas largas o formales.\n\n"
+            "Contexto del estudiante:\n"
+        )
+
+        if context.get("sentimientos"):
+            prompt += f"Sentimientos: {context['sentimientos']}\n"
+        if context.get("emociones"):
+            prompt += f"Emociones: {context['emociones']}\n"
+
+        prompt += f"\nConsulta del psicólogo: {question}\nRespuesta:"
+        return prompt
+
+    @staticmethod
+    def _handle_response(
+        model: str,
+        status_code: int,
+        body: Optional[dict],
+        raw_text: str,
+        latency: float,
+        log_tag: str
+    ) -> Tuple[str, Optional[str]]:
+        """
+        Classify one HTTP answer from Gemini and update model health/metrics
+
+        Returns:
+            (action, text) where action is "ok", "invalid_key", "next" or "stop"
+        """
+        labels = {"model": model, "status": str(status_code)}
+        metrics.inc("gemini_requests_total", labels)
+        metrics.observe("gemini_request_latency_seconds", latency, {"model": model})
+        metrics.record_span("gemini", latency)
+
+        if status_code < 400:
+            ModelHealthRegistry.record_success(model)
+            print(f"[{log_tag}] Using model '{model}'")
+            result = GeminiService._extract_text_from_response(body)
+            if not result:
+                print(f"[{log_tag}] No text extracted. Full response: {body}")
+            return "ok", result
+
+        err = body if body is not None else {"raw": raw_text}
+        print(f"[{log_tag}] Model '{model}' error {status_code}: {err}")
+        metrics.inc("gemini_errors_total", {"model": model, "kind": f"http_{status_code}"})
+
+        # If the key is leaked or invalid, stop trying and surface message
+        if GeminiService._is_invalid_key_error(err):
+            ModelHealthRegistry.record_neutral(model)
+            return "invalid_key", None
+
+        if 500 <= status_code < 600:
+            if ModelHealthRegistry.record_failure(model):
+                print(f"[{log_tag}] Circuit opened for model '{model}'")
+                metrics.inc("gemini_circuit_opened_total", {"model": model})
+            # Server error: do not hammer the fallbacks
+            return "stop", None
+
+        if status_code == 429:
+            # Quota exhausted: make every queued call back off, not just this one
+            GeminiRateLimiter.penalize()
+
+        if status_code in (403, 404):
+            # Disabled or unknown model (403 PERMISSION_DENIED / 404 NOT_FOUND):
+            # remember it and skip it for a while
+            ModelHealthRegistry.record_unavailable(model, status_code)
+        else:
+            ModelHealthRegistry.record_neutral(model)
+        return "next", None
+
+    @staticmethod
+    def _is_invalid_key_error(err: Optional[dict]) -> bool:
+        """
+        The API key itself was rejected (leaked or API_KEY_INVALID)
+
+        A plain 403 PERMISSION_DENIED is not enough: Gemini also answers that
+        for a model disabled on the project, which only calls for a fallback.
+        """
+        if not isinstance(err, dict) or not isinstance(err.get("error"), dict):
+            return False
+        error = err["error"]
+        if "reported as leaked" in str(error.get("message", "")):
+            return True
+        details = error.get("details")
+        if isinstance(details, list):
+            return any(
+                isinstance(d, dict) and d.get("reason") == "API_KEY_INVALID" for d in details
+            )
+        return False
+
+    @staticmethod
+    def _handle_transport_error(model: str, error: Exception, timed_out: bool, log_tag: str) -> None:
+        """Record a timeout / connection error for a model"""
+        print(f"[{log_tag}] Request error with model '{model}': {error}")
+        kind = "timeout" if timed_out else "connection"
+        metrics.inc("gemini_errors_total", {"model": model, "kind": kind})
+        if ModelHealthRegistry.record_failure(model):
+            print(f"[{log_tag}] Circuit opened for model '{model}'")
+            metrics.inc("gemini_circuit_opened_total", {"model": model})
+
+    @staticmethod
+    def _handle_queue_timeout(error: GeminiQueueTimeout, log_tag: str) -> None:
+        """Give up on a call that could not get a limiter slot in time"""
+        print(f"[{log_tag}] {error}")
+        metrics.inc("gemini_fast_fail_total", {"caller": log_tag})
+
+    @staticmethod
+    def _acquired_models(log_tag: str) -> Iterator[str]:
+        """
+        Models to try in order, skipping those in cooldown or with an open circuit
+
+        Each model is acquired only when the caller asks for it, right before
+        calling it, so stopping early never holds a half-open trial slot of a
+        model that was not called. The caller must resolve every model it
+        receives (see `_release_unresolved`).
+        """
+        yielded = False
+        for m in GeminiService._models_to_try():
+            reason = ModelHealthRegistry.acquire(m)
+            if reason:
+                metrics.inc("gemini_model_skipped_total", {"model": m, "reason": reason})
+                continue
+            yielded = True
+            yield m
+        if not yielded:
+            print(f"[{log_tag}] All models unavailable (cooldown / circuit open); failing fast")
+            metrics.inc("gemini_fast_fail_total", {"caller": log_tag})
+
+    @staticmethod
+    def _release_unresolved(model: str, resolved: bool) -> None:
+        """Release the trial slot of a call interrupted before its outcome was recorded"""
+        if not resolved:
+            ModelHealthRegistry.record_neutral(model)
+
+    @staticmethod
+    def _generate_with_fallback(
+        payload: dict,
+        api_key: str,
+        log_tag: str,
+        invalid_key_message: str,
+        priority: str = PRIORITY_STANDARD,
+        served_by: Optional[list] = None
+    ) -> Optional[str]:
+        """
+        Shared synchronous call layer over the configured models
+
+        Args:
+            served_by: If given, the model that produced the answer is appended to it
+
+        Returns:
+            Extracted text, `invalid_key_message` if the API key was rejected,
+            or None if every model failed or was skipped
+        """
+        for m in GeminiService._acquired_models(log_tag):
+            resolved = False
+            try:
+                start = time.perf_counter()
+                try:
+                    response = GeminiService._post_generate(m, payload, api_key, priority)
+                except GeminiQueueTimeout as e:
+                    GeminiService._handle_queue_timeout(e, log_tag)
+                    return None
+                except requests.exceptions.RequestException as e:
+                    timed_out = isinstance(e, requests.exceptions.Timeout)
+                    GeminiService._handle_transport_error(m, e, timed_out, log_tag)
+                    resolved = True
+                    continue
+                latency = time.perf_counter() - start
+                try:
+                    body = response.json()
+                except ValueError:
+                    body = None
+                action, text = GeminiService._handle_response(
+                    m, response.status_code, body, response.text, latency, log_tag
+                )
+                resolved = True
+            finally:
+                GeminiService._release_unresolved(m, resolved)
+            if action == "ok":
+                if served_by is not None:
+                    served_by.append(m)
+                return text
+            if action == "invalid_key":
+                return invalid_key_message
+            if action == "stop":
+                break
+        return None
+
+    @staticmethod
+    async def _generate_with_fallback_async(
+        payload: dict,
+        api_key: str,
+        log_tag: str,
+        invalid_key_message: str,
+        priority: str = PRIORITY_STANDARD,
+        served_by: Optional[list] = None
+    ) -> Optional[str]:
+        """Async variant of the shared call layer (same semantics as _generate_with_fallback)"""
+        for m in GeminiService._acquired_models(log_tag):
+            resolved = False
+            try:
+                start = time.perf_counter()
+                try:
+                    response = await GeminiService._post_generate_async(m, payload, api_key, priority)
+                except GeminiQueueTimeout as e:
+                    GeminiService._handle_queue_timeout(e, log_tag)
+                    return None
+                except httpx.HTTPError as e:
+                    timed_out = isinstance(e, httpx.TimeoutException)
+                    GeminiService._handle_transport_error(m, e, timed_out, log_tag)
+                    resolved = True
+                    continue
+                latency = time.perf_counter() - start
+                try:
+                    body = response.json()
+                except ValueError:
+                    body = None
+                action, text = GeminiService._handle_response(
+                    m, response.status_code, body, response.text, latency, log_tag
+                )
+                resolved = True
+            finally:
+                # Cancellation or an unexpected error must not leave a half-open slot taken
+                GeminiService._release_unresolved(m, resolved)
+            if action == "ok":
+                if served_by is not None:
+                    served_by.append(m)
+                return text
+            if action == "invalid_key":
+                return invalid_key_message
+            if action == "stop":
+                break
+        return None
+
+    @staticmethod
+    def _extract_chunk_text(data: dict) -> str:
+        """Text of one streamed chunk (quiet: chunks without text are normal)"""
+        try:
+            parts = data["candidates"][0]["content"]["parts"]
+        except (KeyError, IndexError, TypeError):
+            return ""
+        return "".join(p.get("text", "") for p in parts if isinstance(p, dict))
+
+    @staticmethod
+    async def _stream_with_fallback_async(
+        payload: dict,
+        api_key: str,
+        log_tag: str,
+        invalid_key_message: str,
+        priority: str = PRIORITY_STANDARD,
+        served_by: Optional[list] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream text chunks from streamGenerateContent through the shared call layer
+
+        Fallback to the next model is only possible before the first chunk is
+        sent. Time-to-first-token is recorded per model. The limiter slot is
+        held for the whole stream. `served_by` (if given) receives the model
+        once its stream completed.
+        """
+        client = GeminiHttpClient.get_async_client()
+        for m in GeminiService._acquired_models(log_tag):
+            start = time.perf_counter()
+            first_token_at = None
+            resolved = False
+            try:
+                async with GeminiRateLimiter.slot(priority), client.stream(
+                    "POST",
+                    GeminiHttpClient.stream_url(m),
+                    json=payload,
+                    headers=GeminiHttpClient.headers(api_key)
+                ) as response:
+                    if response.status_code >= 400:
+                        raw = (await response.aread()).decode("utf-8", errors="replace")
+                        try:
+                            body = json.loads(raw)
+                        except ValueError:
+                            body = None
+                        action, _ = GeminiService._handle_response(
+                            m, response.status_code, body, raw,
+                            time.perf_counter() - start, log_tag
+                        )
+                        resolved = True
+                        if action == "invalid_key":
+                            yield invalid_key_message
+                            return
+                        if action == "stop":
+                            return
+                        continue
+
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        try:
+                            chunk = json.loads(line[5:].strip())
+                        except ValueError:
+                            continue
+                        text = GeminiService._extract_chunk_text(chunk)
+                        if not text:
+                            continue
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                            metrics.observe(
+                                "gemini_time_to_first_token_seconds",
+                                first_token_at - start,
+                                {"model": m, "caller": log_tag}
+                            )
+                        yield text
+                ModelHealthRegistry.record_success(m)
+                resolved = True
+                if served_by is not None:
+                    served_by.append(m)
+            except GeminiQueueTimeout as e:
+                GeminiService._handle_queue_timeout(e, log_tag)
+                return
+            except httpx.HTTPError as e:
+                GeminiService._handle_transport_error(
+                    m, e, isinstance(e, httpx.TimeoutException), log_tag
+                )
+                resolved = True
+                if first_token_at is not None:
+                    # Part of the answer was already sent: cannot switch models
+                    return
+                continue
+            finally:
+                if not resolved and first_token_at is not None:
+                    # Client went away mid-stream (or the stream was cancelled):
+                    # the model was answering, so it counts as healthy
+                    ModelHealthRegistry.record_success(m)
+                    resolved = True
+                GeminiService._release_unresolved(m, resolved)
+
+            latency = time.perf_counter() - start
+            metrics.inc("gemini_requests_total", {"model": m, "status": str(response.status_code)})
+            metrics.observe("gemini_request_latency_seconds", latency, {"model": m})
+            metrics.record_span("gemini", latency)
+            print(f"[{log_tag}] Streamed with model '{m}'")
+            return
+
+    @staticmethod
+    def _insight_cache_key(texts: list[str], model: Optional[str] = None) -> str:
+        """
+        Cache key of an insight request (template version, model, inputs)
+
+        Answers are stored under the model that actually produced them, so a
+        fallback answer is never labelled as the primary model's; lookups try
+        every model of the chain (see _cached_insight).
+        """
+        return GeminiResponseCache.make_key(
+            INSIGHT_PROMPT_VERSION,
+            model or GeminiService._models_to_try()[0],
+            list(texts)
+        )
+
+    @staticmethod
+    def _store_insight(texts: list[str], result: str, served_by: list) -> None:
+        """Cache a fresh insight under the key of the model that answered"""
+        if result and result != _INVALID_KEY_INSIGHT and served_by:
+            GeminiResponseCache.set(GeminiService._insight_cache_key(texts, served_by[0]), result)
+
+    @staticmethod
+    def _cached_insight(texts: list[str], use_cache: bool) -> Optional[str]:
+        """
+        Cached insight for the texts, or None (always None when bypassing)
+
+        Tries the key of each model in fallback order: an answer stored while
+        the primary model was unavailable is still reused, but a primary
+        model answer is preferred once there is one.
         """
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
-        headers = {
-            "Content-Type": "application/json",
-            # Docs use lowercase; header names are case-insensitive but we keep consistent
-            "x-goog-api-key": api_key,
+        if not use_cache:
+            GeminiResponseCache.record_bypass("insight")
+            return None
+        keys = [GeminiService._insight_cache_key(texts, m) for m in GeminiService._models_to_try()]
+        return GeminiResponseCache.get_any(keys, "insight")
+
+    @staticmethod
+    def get_health() -> dict:
+        """Per-model health plus Gemini latency/error counters"""
+        return {
+            "models": ModelHealthRegistry.snapshot(),
+            "metrics": metrics.snapshot(prefix="gemini_"),
+            "cache": GeminiResponseCache.stats(),
+            "single_flight": GeminiSingleFlight.stats(),
+            "limiter": GeminiRateLimiter.stats(),
         }
-        return requests.post(url, json=payload, headers=headers, timeout=10)
     
     @staticmethod
     def generate_accompaniment(text: str) -> Optional[str]:
@@ -46,67 +532,47 @@ class GeminiService:
         if not api_key:
             return None
         
-        # Usar modelo desde variable de entorno con valor por defecto
-        model = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
-        
-        # Build payload
-        
-        prompt_text = (
-            "Eres un asistente empático que ofrece acompañamiento emocional breve y respetuoso. "
-            "Después de leer la nota del usuario, responde con un mensaje de apoyo que refleje "
-            "lo que el usuario escribió, ofrece una observación o consejo breve y termina siempre "
-            "con una frase motivadora corta. No ofrezcas diagnóstico médico ni consejos terapéuticos "
-            "detallados; si es necesario, sugiere buscar ayuda profesional. Responde en español.\n\n"
-            f"Nota del usuario: {text}\n\nRespuesta:"
+        payload = GeminiService._build_payload(
+            GeminiService._build_accompaniment_prompt(text)
+        )
+        return GeminiService._generate_with_fallback(
+            payload,
+            api_key,
+            "GEMINI_ACCOMPANIMENT",
+            _INVALID_KEY_ACCOMPANIMENT,
+            PRIORITY_BACKGROUND
+        )
+
+    @staticmethod
+    async def generate_accompaniment_async(text: str) -> Optional[str]:
+        """Async variant of generate_accompaniment (does not block the event loop)"""
+        api_key = settings.GEMINI_API_KEY
+        if not api_key:
+            return None
+
+        payload = GeminiService._build_payload(
+            GeminiService._build_accompaniment_prompt(text)
+        )
+        return await GeminiSingleFlight.do(
+            GeminiResponseCache.make_key("accompaniment", GeminiService._models_to_try()[0], text),
+            lambda: GeminiService._generate_with_fallback_async(
+                payload,
+                api_key,
+                "GEMINI_ACCOMPANIMENT",
+                _INVALID_KEY_ACCOMPANIMENT,
+                PRIORITY_BACKGROUND
+            ),
+            "accompaniment"
         )
-        
-        payload = {
-            "contents": [
-                {"parts": [{"text": prompt_text}]}
-            ]
-        }
-        
-        # Try requested model first then fall back if 4xx (e.g., 403 Forbidden for disabled models)
-        try_models = [model] + [m for m in GeminiService._FALLBACK_MODELS if m != model]
-        for m in try_models:
-            try:
-                response = GeminiService._post_generate(m, payload, api_key)
-                if response.status_code >= 400:
-                    # Log structured error for troubleshooting
-                    try:
-                        err = response.json()
-                    except Exception:
-                        err = {"raw": response.text}
-                    print(f"[GEMINI_ACCOMPANIMENT] Model '{m}' error {response.status_code}: {err}")
-                    # If the key is leaked or invalid, stop trying and surface message
-                    if isinstance(err, dict) and isinstance(err.get("error"), dict):
-                        message = err["error"].get("message", "")
-                        status = err["error"].get("status", "")
-                        if "reported as leaked" in message or status in ("PERMISSION_DENIED", "UNAUTHENTICATED"):
-                            return "No se pudo generar acompañamiento: la API key de Gemini está invalidada. Genera y configura una nueva clave."
-                    # If client error, try next fallback; if server error, break
-                    if 500 <= response.status_code < 600:
-                        break
-                    continue
-                data = response.json()
-                print(f"[GEMINI_ACCOMPANIMENT] Using model '{m}'")
-                result = GeminiService._extract_text_from_response(data)
-                if not result:
-                    print(f"[GEMINI_ACCOMPANIMENT] No text extracted. Full response: {data}")
-                return result
-            except requests.exceptions.RequestException as e:
-                print(f"[GEMINI_ACCOMPANIMENT] Request error with model '{m}': {e}")
-                continue
-        # All attempts failed
-        return None
     
     @staticmethod
-    def generate_insight(texts: list[str]) -> str:
+    def generate_insight(texts: list[str], use_cache: bool = True) -> str:
         """
         Generate insight and action plan from learning texts
         
         Args:
             texts: List of learning texts from attendance
+            use_cache: If False, skip the cache lookup (the fresh answer is still stored)
             
         Returns:
             Generated insight text
@@ -114,60 +580,59 @@ class GeminiService:
         api_key = settings.GEMINI_API_KEY
         if not api_key:
             return "No se pudo generar insight: API key no configurada"
+
+        cached = GeminiService._cached_insight(texts, use_cache)
+        if cached:
+            return cached
         
-        # Usar modelo desde variable de entorno con valor por defecto
-        model = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
-        
-        # Build payload
-        
-        prompt = (
-            "Eres un psicólogo universitario. Analiza brevemente los siguientes "
-            "aprendizajes obtenidos por el estudiante en sus citas y genera:\n"
-            "- Un resumen breve (máximo 3 líneas).\n"
-            "- Una recomendación breve y concreta como plan de acción para la siguiente "
-            "sesión (máximo 2 líneas).\n"
-            "El resultado debe estar en español, estar en prosa, ser breve y ser útil "
-            "para el psicólogo.\n\n"
+        payload = GeminiService._build_payload(
+            GeminiService._build_insight_prompt(texts)
         )
-        
-        for idx, text in enumerate(texts, 1):
-            prompt += f"Aprendizaje {idx}: {text}\n"
-        
-        prompt += "\nInsight y plan de acción:"
-        
-        payload = {
-            "contents": [
-                {"parts": [{"text": prompt}]}
-            ]
-        }
-        
-        # Try requested model then fallbacks
-        try_models = [model] + [m for m in GeminiService._FALLBACK_MODELS if m != model]
-        for m in try_models:
-            try:
-                response = GeminiService._post_generate(m, payload, api_key)
-                if response.status_code >= 400:
-                    try:
-                        err = response.json()
-                    except Exception:
-                        err = {"raw": response.text}
-                    print(f"[GEMINI_INSIGHT] Model '{m}' error {response.status_code}: {err}")
-                    if isinstance(err, dict) and isinstance(err.get("error"), dict):
-                        message = err["error"].get("message", "")
-                        status = err["error"].get("status", "")
-                        if "reported as leaked" in message or status in ("PERMISSION_DENIED", "UNAUTHENTICATED"):
-                            return "No se pudo generar insight: la API key de Gemini está invalidada. Genera y configura una nueva clave."
-                    if 500 <= response.status_code < 600:
-                        break
-                    continue
-                data = response.json()
-                print(f"[GEMINI_INSIGHT] Using model '{m}'")
-                result = GeminiService._extract_text_from_response(data)
-                return result.strip() if result else "No se pudo generar insight"
-            except requests.exceptions.RequestException as e:
-                print(f"[GEMINI_INSIGHT] Request error with model '{m}': {e}")
-                continue
-        return "No se pudo generar insight"
+        served_by: list = []
+        result = GeminiService._generate_with_fallback(
+            payload,
+            api_key,
+            "GEMINI_INSIGHT",
+            _INVALID_KEY_INSIGHT,
+            served_by=served_by
+        )
+        if not result:
+            return "No se pudo generar insight"
+        GeminiService._store_insight(texts, result.strip(), served_by)
+        return result.strip()
+
+    @staticmethod
+    async def generate_insight_async(texts: list[str], use_cache: bool = True) -> str:
+        """Async variant of generate_insight (does not block the event loop)"""
+        api_key = settings.GEMINI_API_KEY
+        if not api_key:
+            return "No se pudo generar insight: API key no configurada"
+
+        cached = GeminiService._cached_insight(texts, use_cache)
+        if cached:
+            return cached
+
+        payload = GeminiService._build_payload(
+            GeminiService._build_insight_prompt(texts)
+        )
+        # Concurrent identical requests (same report opened in several tabs) share one call;
+        # only the caller that ran it sees `served_by` filled and stores the answer
+        served_by: list = []
+        result = await GeminiSingleFlight.do(
+            GeminiService._insight_cache_key(texts),
+            lambda: GeminiService._generate_with_fallback_async(
+                payload,
+                api_key,
+                "GEMINI_INSIGHT",
+                _INVALID_KEY_INSIGHT,
+                served_by=served_by
+            ),
+            "insight"
+        )
+        if not result:
+            return "No se pudo generar insight"
+        GeminiService._store_insight(texts, result.strip(), served_by)
+        return result.strip()
     
     @staticmethod
     def generate_chatbot_response(context: dict, question: str) -> str:
@@ -185,58 +650,84 @@ class GeminiService:
         if not api_key:
             return "No se pudo generar respuesta: API key no configurada"
         
-        # Usar modelo desde variable de entorno con valor por defecto
-        model = os.environ.get("GEMINI_MODEL", "gemini-2.0-flash")
-        
-        # Build payload
-        
-        prompt = (
-            "Eres un asistente psicológico empático y conversacional. "
-            "Responde de forma breve (1 a 3 líneas), con tono cálido, humano y natural. "
-            "Anima a seguir conversando o preguntando. Evita respuestas largas o formales.\n\n"
-            "Contexto del estudiante:\n"
+        payload = GeminiService._build_payload(
+            GeminiService._build_chatbot_prompt(context, question)
         )
-        
-        if context.get("sentimientos"):
-            prompt += f"Sentimientos: {context['sentimientos']}\n"
-        if context.get("emociones"):
-            prompt += f"Emociones: {context['emociones']}\n"
-        
-        prompt += f"\nConsulta del psicólogo: {question}\nRespuesta:"
-        
-        payload = {
-            "contents": [
-                {"parts": [{"text": prompt}]}
-            ]
-        }
-        
-        # Try requested model then fallbacks
-        try_models = [model] + [m for m in GeminiService._FALLBACK_MODELS if m != model]
-        for m in try_models:
-            try:
-                response = GeminiService._post_generate(m, payload, api_key)
-                if response.status_code >= 400:
-                    try:
-                        err = response.json()
-                    except Exception:
-                        err = {"raw": response.text}
-                    print(f"[GEMINI_CHATBOT] Model '{m}' error {response.status_code}: {err}")
-                    if isinstance(err, dict) and isinstance(err.get("error"), dict):
-                        message = err["error"].get("message", "")
-                        status = err["error"].get("status", "")
-                        if "reported as leaked" in message or status in ("PERMISSION_DENIED", "UNAUTHENTICATED"):
-                            return "No se pudo generar respuesta: la API key de Gemini está invalidada. Genera y configura una nueva clave."
-                    if 500 <= response.status_code < 600:
-                        break
-                    continue
-                data = response.json()
-                print(f"[GEMINI_CHATBOT] Using model '{m}'")
-                result = GeminiService._extract_text_from_response(data)
-                return result.strip() if result else "No se pudo generar respuesta"
-            except requests.exceptions.RequestException as e:
-                print(f"[GEMINI_CHATBOT] Request error with model '{m}': {e}")
-                continue
-        return "No se pudo generar respuesta"
+        result = GeminiService._generate_with_fallback(
+            payload,
+            api_key,
+            "GEMINI_CHATBOT",
+            _INVALID_KEY_CHATBOT,
+            PRIORITY_INTERACTIVE
+        )
+        return result.strip() if result else "No se pudo generar respuesta"
+
+    @staticmethod
+    async def generate_chatbot_response_async(context: dict, question: str) -> str:
+        """Async variant of generate_chatbot_response (does not block the event loop)"""
+        api_key = settings.GEMINI_API_KEY
+        if not api_key:
+            return "No se pudo generar respuesta: API key no configurada"
+
+        payload = GeminiService._build_payload(
+            GeminiService._build_chatbot_prompt(context, question)
+        )
+        result = await GeminiSingleFlight.do(
+            GeminiResponseCache.make_key(
+                "chatbot", GeminiService._models_to_try()[0], [context, question]
+            ),
+            lambda: GeminiService._generate_with_fallback_async(
+                payload,
+                api_key,
+                "GEMINI_CHATBOT",
+                _INVALID_KEY_CHATBOT,
+                PRIORITY_INTERACTIVE
+            ),
+            "chatbot"
+        )
+        return result.strip() if result else "No se pudo generar respuesta"
+    
+    @staticmethod
+    async def stream_insight(texts: list[str], use_cache: bool = True) -> AsyncIterator[str]:
+        """Stream the attendance insight as text chunks (a cached answer is sent as one chunk)"""
+        api_key = settings.GEMINI_API_KEY
+        if not api_key:
+            yield "No se pudo generar insight: API key no configurada"
+            return
+
+        cached = GeminiService._cached_insight(texts, use_cache)
+        if cached:
+            yield cached
+            return
+
+        payload = GeminiService._build_payload(
+            GeminiService._build_insight_prompt(texts)
+        )
+        collected = []
+        served_by: list = []
+        async for chunk in GeminiService._stream_with_fallback_async(
+            payload, api_key, "GEMINI_INSIGHT_STREAM", _INVALID_KEY_INSIGHT, served_by=served_by
+        ):
+            collected.append(chunk)
+            yield chunk
+
+        GeminiService._store_insight(texts, "".join(collected).strip(), served_by)
+
+    @staticmethod
+    async def stream_chatbot_response(context: dict, question: str) -> AsyncIterator[str]:
+        """Stream the chatbot answer as text chunks"""
+        api_key = settings.GEMINI_API_KEY
+        if not api_key:
+            yield "No se pudo generar respuesta: API key no configurada"
+            return
+
+        payload = GeminiService._build_payload(
+            GeminiService._build_chatbot_prompt(context, question)
+        )
+        async for chunk in GeminiService._stream_with_fallback_async(
+            payload, api_key, "GEMINI_CHATBOT_STREAM", _INVALID_KEY_CHATBOT, PRIORITY_INTERACTIVE
+        ):
+            yield chunk
     
     @staticmethod
     def _extract_text_from_response(data: dict) -> Optional[str]:
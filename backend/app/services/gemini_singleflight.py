@@ -0,0 +1,69 @@
+"""
+Single-flight deduplication of concurrent identical Gemini calls
+Concurrent callers with the same fingerprint share one in-flight request
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from app.services.metrics_service import metrics
+
+
+class GeminiSingleFlight:
+    """
+    Coalesces concurrent calls by fingerprint.
+
+    The first caller starts the request as its own task; later callers with the
+    same fingerprint await that task instead of sending a new request. The task
+    is shielded, so a caller that disconnects does not cancel the request for
+    the others.
+    """
+
+    _in_flight: Dict[str, "asyncio.Task[Any]"] = {}
+
+    @classmethod
+    async def do(cls, key: str, call: Callable[[], Awaitable[Any]], call_name: str) -> Any:
+        """
+        Run `call` once per key among concurrent callers
+
+        Args:
+            key: Fingerprint of the request
+            call: Coroutine factory that performs the request
+            call_name: Logical name used as metrics label (e.g. "insight")
+
+        Returns:
+            The shared result of the request
+        """
+        task = cls._in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            cls._in_flight[key] = task
+            metrics.set_gauge("gemini_singleflight_in_flight", len(cls._in_flight))
+
+            def _done(finished: "asyncio.Task[Any]") -> None:
+                if cls._in_flight.get(key) is finished:
+                    cls._in_flight.pop(key, None)
+                metrics.set_gauge("gemini_singleflight_in_flight", len(cls._in_flight))
+                # Mark the exception as retrieved even if every waiter went away
+                if not finished.cancelled():
+                    finished.exception()
+
+            task.add_done_callback(_done)
+            metrics.inc("gemini_singleflight_leaders_total", {"call": call_name})
+        else:
+            metrics.inc("gemini_singleflight_deduplicated_total", {"call": call_name})
+
+        return await asyncio.shield(task)
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Leaders, deduplicated waiters and current in-flight calls"""
+        snapshot = metrics.snapshot(prefix="gemini_singleflight_")
+        by_call: dict = {}
+        for name, field in (
+            ("gemini_singleflight_leaders_total", "requests"),
+            ("gemini_singleflight_deduplicated_total", "deduplicated_waiters"),
+        ):
+            for item in snapshot.get(name, []):
+                call = item["labels"].get("call", "")
+                by_call.setdefault(call, {"requests": 0.0, "deduplicated_waiters": 0.0})[field] = item["value"]
+        return {"in_flight": len(cls._in_flight), "calls": by_call}
@@ -0,0 +1,252 @@
+"""
+In-process metrics registry
+Thread-safe counters, gauges and histograms with labels, exportable in Prometheus text format
+"""
+import asyncio
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Histogram shared by every named span (Supabase, decrypt, NLP, dlib, OpenCV, ...)
+SPAN_METRIC = "span_duration_seconds"
+
+# ASGI scope of the request being served, bound by the HTTP middleware. Copied
+# into run_in_threadpool / asyncio.to_thread, so spans know their route.
+_request_scope: ContextVar[Optional[Dict[str, Any]]] = ContextVar("request_scope", default=None)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    """Normalize a labels dict into a hashable, ordered key"""
+    if not labels:
+        return ()
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+class _Histogram:
+    """Cumulative histogram with fixed buckets"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+def route_label(scope: Optional[Dict[str, Any]]) -> str:
+    """Route template of a request ("/analyze/{user_id}"), never the raw path"""
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def bind_request(scope: Dict[str, Any]):
+    """Attach spans recorded from now on (in this context) to a request; returns a reset token"""
+    return _request_scope.set(scope)
+
+
+def unbind_request(token) -> None:
+    _request_scope.reset(token)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = key + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class MetricsRegistry:
+    """Registry of named metrics, each one split by label set"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._help: Dict[str, str] = {}
+
+    def describe(self, name: str, help_text: str) -> None:
+        """Attach a help string to a metric name"""
+        self._help[name] = help_text
+
+    def inc(self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1.0) -> None:
+        """Increment a counter"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """Set a gauge to an absolute value"""
+        key = _label_key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def add_gauge(self, name: str, delta: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """Add a delta to a gauge"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._gauges.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + delta
+
+    def gauge_total(self, name: str) -> float:
+        """Sum of a gauge over all its label sets"""
+        with self._lock:
+            return sum(self._gauges.get(name, {}).values())
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        labels: Optional[Dict[str, str]] = None,
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> None:
+        """Record an observation in a histogram"""
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(buckets)
+            histogram.observe(value)
+
+    def record_span(self, name: str, seconds: float, labels: Optional[Dict[str, str]] = None) -> None:
+        """Record the duration of a named span (for call sites that already time themselves)"""
+        span_labels = {"span": name, "route": route_label(_request_scope.get())}
+        if labels:
+            span_labels.update(labels)
+        self.observe(SPAN_METRIC, seconds, span_labels)
+
+    @contextmanager
+    def span(self, name: str, labels: Optional[Dict[str, str]] = None) -> Iterator[None]:
+        """
+        Time a block as a named span
+
+        Usage:
+            with metrics.span("nlp_inference"):
+                ...
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_span(name, time.perf_counter() - start, labels)
+
+    def timed(self, name: str) -> Callable:
+        """Decorator timing every call of a function (sync or async) as a named span"""
+        def decorator(func: Callable) -> Callable:
+            if asyncio.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with self.span(name):
+                        return await func(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def get_counter(self, name: str, labels: Optional[Dict[str, str]] = None) -> float:
+        """Current value of a counter (0 if never incremented)"""
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0.0)
+
+    def snapshot(self, prefix: str = "") -> Dict[str, List[Dict]]:
+        """
+        JSON-friendly view of the metrics
+
+        Args:
+            prefix: Only include metrics whose name starts with this prefix
+
+        Returns:
+            Dictionary of metric name -> list of {labels, value | count/sum/avg}
+        """
+        result: Dict[str, List[Dict]] = {}
+        with self._lock:
+            for store in (self._counters, self._gauges):
+                for name, series in store.items():
+                    if not name.startswith(prefix):
+                        continue
+                    result[name] = [
+                        {"labels": dict(key), "value": value}
+                        for key, value in series.items()
+                    ]
+            for name, series in self._histograms.items():
+                if not name.startswith(prefix):
+                    continue
+                result[name] = [
+                    {
+                        "labels": dict(key),
+                        "count": h.count,
+                        "sum": round(h.sum, 6),
+                        "avg": round(h.sum / h.count, 6) if h.count else 0.0,
+                    }
+                    for key, h in series.items()
+                ]
+        return result
+
+    def render_prometheus(self) -> str:
+        """
+        All metrics in the Prometheus text exposition format (version 0.0.4)
+
+        Returns:
+            Text for a /metrics scrape endpoint
+        """
+        lines: List[str] = []
+        with self._lock:
+            for kind, store in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(store.items()):
+                    if name in self._help:
+                        lines.append(f"# HELP {name} {self._help[name]}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in series.items():
+                        lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+            for name, series in sorted(self._histograms.items()):
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in series.items():
+                    # Bucket counts are already cumulative (see _Histogram.observe)
+                    for bound, count in zip(h.buckets, h.counts):
+                        lines.append(f"{name}_bucket{_format_labels(key, (('le', _format_value(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_format_labels(key, (('le', '+Inf'),))} {h.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {_format_value(h.sum)}")
+                    lines.append(f"{name}_count{_format_labels(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+
+# Instancia global del registro de métricas
+metrics = MetricsRegistry()
+metrics.describe(SPAN_METRIC, "Duration of named spans inside request handling and services")
@@ -0,0 +1,241 @@
+"""
+On-demand profiling of a running worker
+Wall-clock stack sampling of every thread (collapsed stacks / speedscope) and per-request cProfile summaries
+"""
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app.config.settings import settings
+
+PROFILE_OUTPUTS = ("collapsed", "speedscope")
+
+# Request profiles kept for retrieval (oldest dropped first)
+_MAX_REQUEST_PROFILES = 50
+# Lines of the pstats report kept per request
+_SUMMARY_LINES = 40
+
+# Leaf frames of threads that are only waiting (idle pool workers, event loop in select)
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+}
+
+Frame = Tuple[str, str, int]
+
+
+class ProfilingService:
+    """
+    Admin-only profiling hooks, enabled with PROFILING_ENABLED and PROFILING_TOKEN.
+
+    The sampler reads `sys._current_frames()` every interval, so it sees the
+    event loop and the thread pool (NLP, charts, OpenCV) without instrumenting
+    anything. The per-request mode wraps one call in cProfile, which only
+    traces the event loop thread: work offloaded with run_in_threadpool shows
+    up as the awaiting coroutine, use the sampler to look inside it.
+
+    cProfile records everything the event loop runs meanwhile, including other
+    requests. A profiled request is therefore refused while others are in
+    flight; those arriving during it still land in the profile, and the
+    summary records how many were being served when it finished.
+    """
+
+    _sampling_lock = threading.Lock()
+    _request_lock = threading.Lock()
+    _request_profiles: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    @staticmethod
+    def is_authorized(token: Optional[str]) -> bool:
+        """Profiling is enabled and the token matches PROFILING_TOKEN"""
+        if not settings.PROFILING_ENABLED or not settings.PROFILING_TOKEN:
+            return False
+        return hmac.compare_digest((token or "").encode(), settings.PROFILING_TOKEN.encode())
+
+    @classmethod
+    def check_access(cls, token: Optional[str]) -> None:
+        """
+        Guard for the admin endpoints
+
+        Raises:
+            HTTPException: 404 while profiling is disabled, 403 on a wrong token
+        """
+        if not settings.PROFILING_ENABLED or not settings.PROFILING_TOKEN:
+            raise HTTPException(status_code=404, detail="Not Found")
+        if not cls.is_authorized(token):
+            raise HTTPException(status_code=403, detail="Token de perfilado inválido")
+
+    @staticmethod
+    def _frame_key(frame) -> Frame:
+        code = frame.f_code
+        return code.co_name, code.co_filename, code.co_firstlineno
+
+    @classmethod
+    def _collect(cls, seconds: float, interval: float, include_idle: bool) -> Dict[str, Counter]:
+        """Sample all other threads; returns {thread name: Counter(stack tuple, root first)}"""
+        me = threading.get_ident()
+        samples: Dict[str, Counter] = {}
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                leaf = frame.f_code
+                if not include_idle and (os.path.basename(leaf.co_filename), leaf.co_name) in _IDLE_LEAVES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(cls._frame_key(frame))
+                    frame = frame.f_back
+                stack.reverse()
+                thread_name = names.get(thread_id, str(thread_id))
+                samples.setdefault(thread_name, Counter())[tuple(stack)] += 1
+            time.sleep(interval)
+        return samples
+
+    @staticmethod
+    def _frame_label(frame: Frame) -> str:
+        name, filename, line = frame
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    @classmethod
+    def to_collapsed(cls, samples: Dict[str, Counter]) -> str:
+        """Brendan Gregg's collapsed format (flamegraph.pl, speedscope, inferno): `a;b;c count`"""
+        lines = []
+        for thread_name, stacks in samples.items():
+            for stack, count in stacks.most_common():
+                labels = [thread_name] + [cls._frame_label(f).replace(";", ",") for f in stack]
+                lines.append(f"{';'.join(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def to_speedscope(samples: Dict[str, Counter], interval: float) -> Dict[str, Any]:
+        """speedscope.app file format: one sampled profile per thread, weights in milliseconds"""
+        frames: list = []
+        frame_index: Dict[Frame, int] = {}
+        profiles = []
+        weight = round(interval * 1000, 3)
+        for thread_name, stacks in samples.items():
+            profile_samples, weights = [], []
+            for stack, count in stacks.items():
+                indexes = []
+                for frame in stack:
+                    if frame not in frame_index:
+                        frame_index[frame] = len(frames)
+                        name, filename, line = frame
+                        frames.append({"name": name, "file": filename, "line": line})
+                    indexes.append(frame_index[frame])
+                profile_samples.append(indexes)
+                weights.append(weight * count)
+            profiles.append({
+                "type": "sampled",
+                "name": thread_name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": profile_samples,
+                "weights": weights,
+            })
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+            "name": f"worker {os.getpid()}",
+            "exporter": "profiling_service",
+        }
+
+    @classmethod
+    def sample(
+        cls,
+        seconds: float,
+        interval_ms: Optional[float] = None,
+        output: str = "collapsed",
+        include_idle: bool = False
+    ) -> Any:
+        """
+        Sample the stacks of this worker for a while (blocking: run it off the event loop)
+
+        Args:
+            seconds: Duration, capped at PROFILING_MAX_SECONDS
+            interval_ms: Time between samples (defaults to PROFILING_SAMPLE_INTERVAL_MS)
+            output: "collapsed" (text) or "speedscope" (JSON-ready dict)
+            include_idle: Keep samples of threads that are only waiting
+
+        Returns:
+            Collapsed stacks text or speedscope document
+
+        Raises:
+            HTTPException: 400 on bad arguments, 409 if another sampling is running
+        """
+        if output not in PROFILE_OUTPUTS:
+            raise HTTPException(status_code=400, detail=f"output debe ser uno de: {', '.join(PROFILE_OUTPUTS)}")
+        if seconds <= 0 or seconds > settings.PROFILING_MAX_SECONDS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"seconds debe estar entre 0 y {settings.PROFILING_MAX_SECONDS:g}"
+            )
+        interval = max(interval_ms or settings.PROFILING_SAMPLE_INTERVAL_MS, 1.0) / 1000
+        if not cls._sampling_lock.acquire(blocking=False):
+            raise HTTPException(status_code=409, detail="Ya hay un muestreo en curso en este worker")
+        try:
+            print(f"[PROFILING] Muestreando worker {os.getpid()} durante {seconds:g}s")
+            samples = cls._collect(seconds, interval, include_idle)
+        finally:
+            cls._sampling_lock.release()
+        if output == "speedscope":
+            return cls.to_speedscope(samples, interval)
+        return cls.to_collapsed(samples)
+
+    @classmethod
+    def start_request_profile(cls) -> Optional[cProfile.Profile]:
+        """Start cProfile for one request (None if another request is being profiled)"""
+        if not cls._request_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    @classmethod
+    def finish_request_profile(cls, profiler: cProfile.Profile, info: Dict[str, Any]) -> str:
+        """
+        Stop a request profile and keep its summary
+
+        Args:
+            profiler: Value returned by start_request_profile
+            info: Request details stored with the summary (method, route, status, ...)
+
+        Returns:
+            Id to fetch the summary with `get_request_profile`
+        """
+        try:
+            profiler.disable()
+        finally:
+            cls._request_lock.release()
+        out = io.StringIO()
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats("cumulative").print_stats(_SUMMARY_LINES)
+        profile_id = uuid.uuid4().hex
+        cls._request_profiles[profile_id] = {
+            **info,
+            "total_calls": stats.total_calls,
+            "summary": out.getvalue(),
+        }
+        while len(cls._request_profiles) > _MAX_REQUEST_PROFILES:
+            cls._request_profiles.popitem(last=False)
+        return profile_id
+
+    @classmethod
+    def get_request_profile(cls, profile_id: str) -> Optional[Dict[str, Any]]:
+        return cls._request_profiles.get(profile_id)
@@ -0,0 +1,199 @@
+"""
+Token-budgeted prompt construction for long attendance histories
+Keeps the most recent learnings verbatim and folds older ones into a cached,
+incrementally updated rolling summary
+"""
+import hashlib
+import math
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.config.settings import settings
+from app.services.metrics_service import metrics
+
+# Roughly 4 characters per token for Spanish prose
+_CHARS_PER_TOKEN = 4
+# Maximum number of rolling summaries kept in memory
+_MAX_CACHED_SUMMARIES = 1024
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (no tokenizer round trip)"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / _CHARS_PER_TOKEN)
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to about `max_tokens`, on a word boundary"""
+    max_chars = max_tokens * _CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(" ", 1)[0]
+    return cut + "…"
+
+
+class InsightPromptBuilder:
+    """
+    Builds the learnings section of the insight prompt within a token budget.
+
+    Input texts are ordered most recent first (as /analyze-asistencia returns
+    them). Recent entries are kept verbatim while they fit; the remaining older
+    entries are compressed into a rolling summary. Summaries are cached by a
+    hash chain over the chronological prefix, so when a new session is added
+    only the entries that just aged out are folded into the previous summary.
+    """
+
+    _lock = threading.Lock()
+    _summaries: "OrderedDict[str, List[str]]" = OrderedDict()
+
+    @staticmethod
+    def _compress_entry(text: str) -> str:
+        """Extractive compression: first sentence, capped in words"""
+        text = " ".join(text.split())
+        first = _SENTENCE_END.split(text, 1)[0]
+        words = first.split(" ")
+        limit = settings.GEMINI_INSIGHT_SUMMARY_WORDS
+        if len(words) > limit:
+            return " ".join(words[:limit]) + "…"
+        return first
+
+    @staticmethod
+    def _prefix_hashes(chronological: List[str]) -> List[str]:
+        """h[k] identifies chronological[:k + 1] (hash chain, O(n) for all prefixes)"""
+        seed = f"{settings.GEMINI_INSIGHT_SUMMARY_WORDS}|{settings.GEMINI_INSIGHT_SUMMARY_TOKEN_BUDGET}"
+        current = hashlib.sha256(seed.encode("utf-8")).hexdigest()
+        hashes = []
+        for text in chronological:
+            current = hashlib.sha256((current + "\x00" + text).encode("utf-8")).hexdigest()
+            hashes.append(current)
+        return hashes
+
+    @staticmethod
+    def _compact(lines: List[str], budget: int) -> List[str]:
+        """
+        Keep the summary within its budget by dropping the oldest lines
+
+        The first line is an "earlier sessions" counter that absorbs dropped lines.
+        """
+        dropped = 0
+        if lines and lines[0].startswith("(+"):
+            dropped = int(lines[0][2:].split(" ", 1)[0])
+            lines = lines[1:]
+        while lines and estimate_tokens("\n".join(lines)) > budget:
+            lines = lines[1:]
+            dropped += 1
+        if dropped:
+            lines = [f"(+{dropped} sesiones anteriores resumidas)"] + lines
+        return lines
+
+    @classmethod
+    def _rolling_summary(cls, older_chronological: List[str]) -> Tuple[List[str], int]:
+        """
+        Summary lines for the older entries and how many entries had to be folded now
+
+        Reuses the longest cached prefix summary and folds only the new entries.
+        """
+        if not older_chronological:
+            return [], 0
+
+        hashes = cls._prefix_hashes(older_chronological)
+        budget = settings.GEMINI_INSIGHT_SUMMARY_TOKEN_BUDGET
+        with cls._lock:
+            start = 0
+            lines: List[str] = []
+            for k in range(len(hashes) - 1, -1, -1):
+                cached = cls._summaries.get(hashes[k])
+                if cached is not None:
+                    cls._summaries.move_to_end(hashes[k])
+                    lines = list(cached)
+                    start = k + 1
+                    break
+
+        for text in older_chronological[start:]:
+            lines.append("- " + cls._compress_entry(text))
+            lines = cls._compact(lines, budget)
+
+        with cls._lock:
+            cls._summaries[hashes[-1]] = list(lines)
+            cls._summaries.move_to_end(hashes[-1])
+            while len(cls._summaries) > _MAX_CACHED_SUMMARIES:
+                cls._summaries.popitem(last=False)
+
+        return lines, len(older_chronological) - start
+
+    @classmethod
+    def build_learnings_section(
+        cls,
+        texts: List[str],
+        budget_tokens: Optional[int] = None
+    ) -> Tuple[str, Dict]:
+        """
+        Build the learnings section of the insight prompt
+
+        Args:
+            texts: Learning texts, most recent first
+            budget_tokens: Token budget for this section (defaults to Settings)
+
+        Returns:
+            Tuple of (section text, stats dict)
+        """
+        if budget_tokens is None:
+            budget_tokens = settings.GEMINI_INSIGHT_TOKEN_BUDGET
+        texts = [t for t in texts if t and str(t).strip()]
+
+        # 1. Recent entries verbatim while they fit, reserving room for the summary
+        recent_budget = budget_tokens
+        if len(texts) > settings.GEMINI_INSIGHT_MIN_RECENT:
+            recent_budget -= settings.GEMINI_INSIGHT_SUMMARY_TOKEN_BUDGET
+        recent: List[str] = []
+        used = 0
+        for text in texts:
+            cost = estimate_tokens(text) + 5  # "Aprendizaje N: " + newline
+            if used + cost > recent_budget and len(recent) >= settings.GEMINI_INSIGHT_MIN_RECENT:
+                break
+            if used + cost > recent_budget:
+                # Guaranteed recent entries are truncated rather than dropped
+                text = _truncate_to_tokens(text, max(1, (recent_budget - used) // 2))
+                cost = estimate_tokens(text) + 5
+            recent.append(text)
+            used += cost
+
+        # 2. Older entries -> rolling summary (chronological order, oldest first)
+        older = texts[len(recent):]
+        summary_lines, folded = cls._rolling_summary(list(reversed(older)))
+
+        section = ""
+        if summary_lines:
+            section += f"Resumen de {len(older)} sesiones anteriores:\n"
+            section += "\n".join(summary_lines) + "\n\n"
+        for idx, text in enumerate(recent, 1):
+            section += f"Aprendizaje {idx}: {text}\n"
+
+        stats = {
+            "entries": len(texts),
+            "verbatim_entries": len(recent),
+            "summarized_entries": len(older),
+            "newly_folded_entries": folded,
+            "section_tokens": estimate_tokens(section),
+        }
+        return section, stats
+
+    @staticmethod
+    def record_prompt_size(prompt: str, caller: str, stats: Optional[Dict] = None) -> int:
+        """Record the estimated prompt size of a call and return it"""
+        tokens = estimate_tokens(prompt)
+        metrics.observe(
+            "gemini_prompt_tokens",
+            tokens,
+            {"caller": caller},
+            buckets=(128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+        )
+        if stats and stats.get("summarized_entries"):
+            metrics.inc("gemini_prompt_summarized_entries_total", {"caller": caller}, stats["summarized_entries"])
+        print(f"[PROMPT_BUILDER] {caller}: ~{tokens} tokens {stats or ''}")
+        return tokens
@@ -0,0 +1,141 @@
+"""
+In-process read-through cache of the recomendaciones catalog
+Keeps the table in memory with a TTL and prebuilt indexes by target emotion and sentiment
+"""
+import asyncio
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional
+
+from app.config.settings import settings
+from app.db.repositories import recomendaciones_repo
+from app.services.metrics_service import metrics
+
+
+def most_common_label(labels: List[Any]) -> Optional[Any]:
+    """
+    Most frequent label, ties broken by sort order (same result as pandas Series.mode()[0])
+    """
+    counts = Counter(label for label in labels if label is not None)
+    if not counts:
+        return None
+    top = max(counts.values())
+    return min(label for label, count in counts.items() if count == top)
+
+
+class RecommendationCatalog:
+    """
+    Catalog of recommendations cached per process.
+
+    The table is loaded on first use and reloaded after
+    RECOMMENDATIONS_CACHE_TTL_SECONDS or when `invalidate()` is called (e.g.
+    after editing the catalog). Concurrent misses share one reload. `version`
+    increases on every reload so derived models can tell when to rebuild;
+    callbacks registered with `on_refresh` run after each reload.
+    """
+
+    _items: List[Dict[str, Any]] = []
+    _by_id: Dict[Any, Dict[str, Any]] = {}
+    _by_emotion: Dict[Any, List[Dict[str, Any]]] = {}
+    _by_sentiment: Dict[Any, List[Dict[str, Any]]] = {}
+    _position: Dict[int, int] = {}
+    _loaded_at: float = 0.0
+    _stale = True
+    _lock: Optional[asyncio.Lock] = None
+    _listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+    version = 0
+
+    @classmethod
+    def _is_fresh(cls) -> bool:
+        return (
+            not cls._stale
+            and time.monotonic() - cls._loaded_at < settings.RECOMMENDATIONS_CACHE_TTL_SECONDS
+        )
+
+    @classmethod
+    def _build(cls, rows: List[Dict[str, Any]]) -> None:
+        """Swap in a freshly loaded catalog and its indexes"""
+        by_id: Dict[Any, Dict[str, Any]] = {}
+        by_emotion: Dict[Any, List[Dict[str, Any]]] = {}
+        by_sentiment: Dict[Any, List[Dict[str, Any]]] = {}
+        position: Dict[int, int] = {}
+        for i, row in enumerate(rows):
+            position[id(row)] = i
+            by_id[str(row.get("id"))] = row
+            by_emotion.setdefault(row.get("emocion_objetivo"), []).append(row)
+            by_sentiment.setdefault(row.get("sentimiento_objetivo"), []).append(row)
+        cls._items, cls._by_id = rows, by_id
+        cls._by_emotion, cls._by_sentiment = by_emotion, by_sentiment
+        cls._position = position
+        cls._loaded_at = time.monotonic()
+        cls._stale = False
+        cls.version += 1
+
+    @classmethod
+    async def _ensure_loaded(cls) -> None:
+        if cls._is_fresh():
+            metrics.inc("recommendations_catalog_requests_total", {"result": "hit"})
+            return
+        if cls._lock is None:
+            cls._lock = asyncio.Lock()
+        async with cls._lock:
+            if cls._is_fresh():
+                metrics.inc("recommendations_catalog_requests_total", {"result": "hit"})
+                return
+            metrics.inc("recommendations_catalog_requests_total", {"result": "miss"})
+            rows = await recomendaciones_repo.list_all()
+            cls._build(rows)
+            print(f"[RECOMMENDATIONS] Catálogo cargado: {len(rows)} recomendaciones (v{cls.version})")
+            for listener in list(cls._listeners):
+                try:
+                    listener(rows)
+                except Exception as e:
+                    print(f"[RECOMMENDATIONS] Error en callback de recarga: {e}")
+
+    @classmethod
+    async def get_all(cls) -> List[Dict[str, Any]]:
+        """Every recommendation (shared list: do not mutate)"""
+        await cls._ensure_loaded()
+        return cls._items
+
+    @classmethod
+    async def get_by_ids(cls, ids: List[Any]) -> List[Dict[str, Any]]:
+        """Recommendations for the given ids, in the given order (unknown ids skipped)"""
+        await cls._ensure_loaded()
+        keys = (str(i) for i in ids)
+        return [cls._by_id[k] for k in keys if k in cls._by_id]
+
+    @classmethod
+    async def match(cls, emocion: Any, sentimiento: Any) -> List[Dict[str, Any]]:
+        """
+        Recommendations targeting the emotion OR the sentiment, in catalog order
+
+        Args:
+            emocion: Target emotion label
+            sentimiento: Target sentiment label
+        """
+        await cls._ensure_loaded()
+        matched = {id(r): r for r in cls._by_emotion.get(emocion, [])}
+        matched.update((id(r), r) for r in cls._by_sentiment.get(sentimiento, []))
+        return sorted(matched.values(), key=lambda r: cls._position[id(r)])
+
+    @classmethod
+    def invalidate(cls) -> None:
+        """Force a reload on the next access (call after the catalog changes)"""
+        cls._stale = True
+        print("[RECOMMENDATIONS] Catálogo invalidado")
+
+    @classmethod
+    def on_refresh(cls, callback: Callable[[List[Dict[str, Any]]], None]) -> None:
+        """Register a callback run with the new rows after every reload"""
+        cls._listeners.append(callback)
+
+    @classmethod
+    def stats(cls) -> dict:
+        """Catalog size, age and version"""
+        return {
+            "items": len(cls._items),
+            "version": cls.version,
+            "age_seconds": round(time.monotonic() - cls._loaded_at, 1) if cls._loaded_at else None,
+            "fresh": cls._is_fresh(),
+        }
@@ -13,6 +13,8 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.decomposition import NMF
 import numpy as np
 
+from app.services.metrics_service import metrics
+
 # Download NLTK resources if not available
 try:
     nltk.data.find('corpora/stopwords')
@@ -74,6 +76,12 @@ class TextAnalysisService:
         ]
         return " ".join(clean_tokens), clean_tokens
     
+    @staticmethod
+    @metrics.timed("nlp_inference")
+    def _classify(text: str) -> Tuple[Dict, Dict]:
+        """Sentiment and emotion model outputs (top label and score) for one text"""
+        return sentiment_classifier(text)[0], emotion_classifier(text)[0]
+
     @staticmethod
     def analyze_diary_complete(diary_df: pd.DataFrame) -> pd.DataFrame:
         """
@@ -91,8 +99,7 @@ class TextAnalysisService:
         for note in diary_df['note']:
             try:
                 processed_text, tokens = TextAnalysisService.preprocess_text(note)
-                sentiment_result = sentiment_classifier(note)[0]
-                emotion_result = emotion_classifier(note)[0]
+                sentiment_result, emotion_result = TextAnalysisService._classify(note)
 
                 analysis.append({
                     'nota_original': note,
@@ -134,8 +141,7 @@ class TextAnalysisService:
         for note in diary_df['note']:
             try:
                 processed_text, tokens = TextAnalysisService.preprocess_text(note)
-                sentiment_result = sentiment_classifier(note)[0]
-                emotion_result = emotion_classifier(note)[0]
+                sentiment_result, emotion_result = TextAnalysisService._classify(note)
 
                 analysis.append({
                     'nota_original': note,
@@ -180,8 +186,7 @@ class TextAnalysisService:
             Dictionary with analysis results
         """
         processed_text, tokens = TextAnalysisService.preprocess_text(note_text)
-        sentiment_result = sentiment_classifier(note_text)[0]
-        emotion_result = emotion_classifier(note_text)[0]
+        sentiment_result, emotion_result = TextAnalysisService._classify(note_text)
         
         return {
             'texto_procesado': processed_text,
@@ -1,90 +1,206 @@
 """
 Visualization service for creating charts and graphs
+Renders with the object-oriented Figure/Agg API (no pyplot global state), safe under a thread pool
 """
 import io
 import base64
-import matplotlib.pyplot as plt
+import threading
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from wordcloud import WordCloud
 from collections import Counter
 import pandas as pd
-from typing import Dict
+from typing import Any, Dict, List, Optional
+
+from app.config.settings import settings
+from app.services.metrics_service import metrics
+
+COLORS = ['#6366F1', '#EC4899', '#34D399', '#F97316', '#A855F7']
+WORDCLOUD_SIZE = (800, 400)
+WORDCLOUD_MAX_WORDS = 200
+
+
+class _BarTemplate:
+    """Bar chart figure with static styling built once; only the bars change per render"""
+
+    def __init__(self, figsize, title: str, xlabel: str):
+        self.figure = Figure(figsize=figsize)
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.ax.set_title(title)
+        self.ax.set_xlabel(xlabel)
+        self.ax.set_ylabel('Frecuencia')
+        self.ax.set_axisbelow(True)
+        self.ax.grid(axis='y', linestyle='--', alpha=0.7)
+        self._bars = None
+
+    def render(self, labels: List[str], values: List[int]) -> Figure:
+        if self._bars is not None:
+            self._bars.remove()
+        positions = range(len(labels))
+        # Numeric positions + tick labels: categorical units would keep old categories around
+        self._bars = self.ax.bar(positions, values, color=COLORS)
+        self.ax.set_xticks(list(positions), labels)
+        self.ax.relim()
+        self.ax.autoscale_view()
+        return self.figure
+
+
+class _WordCloudTemplate:
+    """Word cloud figure; the image artist is created once and its pixels replaced"""
+
+    def __init__(self):
+        self.figure = Figure(figsize=(10, 5))
+        FigureCanvasAgg(self.figure)
+        self.ax = self.figure.add_subplot()
+        self.ax.axis('off')
+        self.ax.set_title('Nube de Palabras')
+        self._image = None
+
+    def render(self, pixels) -> Figure:
+        if self._image is None:
+            self._image = self.ax.imshow(pixels, interpolation='bilinear')
+        else:
+            self._image.set_data(pixels)
+        return self.figure
 
 
 class VisualizationService:
     """Service for creating data visualizations"""
-    
+
+    # One set of figure templates per thread: figures are never shared between threads
+    _local = threading.local()
+
+    @classmethod
+    def _templates(cls) -> Dict[str, Any]:
+        templates = getattr(cls._local, "templates", None)
+        if templates is None:
+            templates = {
+                'sentiments': _BarTemplate((8, 6), 'Distribución de Sentimientos', 'Sentimiento'),
+                'emotions': _BarTemplate((10, 6), 'Distribución de Emociones', 'Emoción'),
+                'wordcloud': _WordCloudTemplate(),
+            }
+            cls._local.templates = templates
+        return templates
+
+    @staticmethod
+    def image_format(image_format: Optional[str] = None) -> str:
+        """Image format used for the charts (defaults to CHART_IMAGE_FORMAT)"""
+        return (image_format or settings.CHART_IMAGE_FORMAT).lower()
+
     @staticmethod
-    def create_visualizations(df_analyzed: pd.DataFrame) -> Dict[str, str]:
+    def _encode(figure: Figure, image_format: str, dpi: int) -> str:
+        """Rasterize a figure to base64 (PNG or WebP)"""
+        buf = io.BytesIO()
+        figure.savefig(buf, format=image_format, dpi=dpi)
+        return base64.b64encode(buf.getvalue()).decode('utf-8')
+
+    @staticmethod
+    def token_frequencies(df_analyzed: pd.DataFrame) -> Counter:
+        """Token counts from the `tokens` column (lists of tokens per row)"""
+        counter = Counter()
+        if 'tokens' in df_analyzed.columns:
+            for tokens_list in df_analyzed['tokens']:
+                if isinstance(tokens_list, list):
+                    counter.update(tokens_list)
+        return counter
+
+    @classmethod
+    def create_visualizations(
+        cls,
+        df_analyzed: pd.DataFrame,
+        image_format: str = None,
+        dpi: int = None,
+        token_frequencies: Optional[Counter] = None
+    ) -> Dict[str, str]:
         """
         Create visualizations from analyzed diary data
-        
+
         Args:
             df_analyzed: DataFrame with analysis results
-            
+            image_format: "png" or "webp" (defaults to CHART_IMAGE_FORMAT)
+            dpi: Output resolution (defaults to CHART_DPI)
+            token_frequencies: Precomputed token counts for the word cloud
+                (e.g. from WordFrequencyStore); counted from `tokens` otherwise
+
         Returns:
-            Dictionary with base64 encoded images (sentiments, emotions, wordcloud)
+            Dictionary with base64 encoded images (sentiments, emotions, wordcloud);
+            their format is `image_format(image_format)`
         """
+        image_format = cls.image_format(image_format)
+        dpi = dpi or settings.CHART_DPI
+        templates = cls._templates()
         images = {}
-        colors = ['#6366F1', '#EC4899', '#34D399', '#F97316', '#A855F7']
-        
+
         # 1. Sentiment distribution chart
         if 'sentimiento' in df_analyzed.columns:
             sentiment_counts = df_analyzed['sentimiento'].value_counts()
-            plt.figure(figsize=(8, 6))
-            plt.bar(sentiment_counts.index, sentiment_counts.values, color=colors)
-            plt.title('Distribución de Sentimientos')
-            plt.xlabel('Sentimiento')
-            plt.ylabel('Frecuencia')
-            plt.grid(axis='y', linestyle='--', alpha=0.7)
-            
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png')
-            buf.seek(0)
-            images['sentiments'] = base64.b64encode(buf.getvalue()).decode('utf-8')
-            plt.close()
-        
+            with metrics.span("matplotlib", {"chart": "sentiments"}):
+                figure = templates['sentiments'].render(
+                    [str(label) for label in sentiment_counts.index], sentiment_counts.values
+                )
+                images['sentiments'] = cls._encode(figure, image_format, dpi)
+
         # 2. Emotion distribution chart
         if 'emocion' in df_analyzed.columns:
             emotion_counts = df_analyzed['emocion'].value_counts()
-            plt.figure(figsize=(10, 6))
-            plt.bar(emotion_counts.index, emotion_counts.values, color=colors)
-            plt.title('Distribución de Emociones')
-            plt.xlabel('Emoción')
-            plt.ylabel('Frecuencia')
-            plt.grid(axis='y', linestyle='--', alpha=0.7)
-            
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png')
-            buf.seek(0)
-            images['emotions'] = base64.b64encode(buf.getvalue()).decode('utf-8')
-            plt.close()
-        
-        # 3. Word cloud
-        if 'tokens' in df_analyzed.columns:
-            all_tokens = []
-            for tokens_list in df_analyzed['tokens']:
-                if isinstance(tokens_list, list):
-                    all_tokens.extend(tokens_list)
-            
-            if all_tokens:
-                wordcloud_data = " ".join(all_tokens)
+            with metrics.span("matplotlib", {"chart": "emotions"}):
+                figure = templates['emotions'].render(
+                    [str(label) for label in emotion_counts.index], emotion_counts.values
+                )
+                images['emotions'] = cls._encode(figure, image_format, dpi)
+
+        # 3. Word cloud (from token counts: cost no longer grows with the text volume)
+        if token_frequencies is None:
+            token_frequencies = cls.token_frequencies(df_analyzed)
+        if token_frequencies:
+            with metrics.span("wordcloud"):
                 wordcloud = WordCloud(
-                    width=800,
-                    height=400,
+                    width=WORDCLOUD_SIZE[0],
+                    height=WORDCLOUD_SIZE[1],
                     background_color='white',
-                    colormap='viridis'
-                ).generate(wordcloud_data)
-                
-                plt.figure(figsize=(10, 5))
-                plt.imshow(wordcloud, interpolation='bilinear')
-                plt.axis('off')
-                plt.title('Nube de Palabras')
-                
-                buf = io.BytesIO()
-                plt.savefig(buf, format='png')
-                buf.seek(0)
-                images['wordcloud'] = base64.b64encode(buf.getvalue()).decode('utf-8')
-                plt.close()
-        
+                    colormap='viridis',
+                    max_words=WORDCLOUD_MAX_WORDS
+                ).generate_from_frequencies(dict(token_frequencies.most_common(WORDCLOUD_MAX_WORDS)))
+
+            with metrics.span("matplotlib", {"chart": "wordcloud"}):
+                figure = templates['wordcloud'].render(wordcloud.to_array())
+                images['wordcloud'] = cls._encode(figure, image_format, dpi)
+
         return images
 
+    @classmethod
+    def chart_data(
+        cls,
+        df_analyzed: pd.DataFrame,
+        top_terms: int = 30,
+        token_frequencies: Optional[Counter] = None
+    ) -> Dict[str, Any]:
+        """
+        Chart inputs as plain counts, for client-side rendering (Charts.jsx)
+
+        Args:
+            df_analyzed: DataFrame with analysis results (sentimiento, emocion, tokens)
+            top_terms: Number of most frequent tokens to return
+            token_frequencies: Precomputed token counts (counted from `tokens` otherwise)
+
+        Returns:
+            Dictionary with sentiments and emotions ({label: count}) and
+            termFrequency ([{"term", "count"}], most frequent first)
+        """
+        data: Dict[str, Any] = {}
+        if 'sentimiento' in df_analyzed.columns:
+            data['sentiments'] = {
+                str(label): int(count) for label, count in df_analyzed['sentimiento'].value_counts().items()
+            }
+        if 'emocion' in df_analyzed.columns:
+            data['emotions'] = {
+                str(label): int(count) for label, count in df_analyzed['emocion'].value_counts().items()
+            }
+        if token_frequencies is None and 'tokens' in df_analyzed.columns:
+            token_frequencies = cls.token_frequencies(df_analyzed)
+        if token_frequencies is not None:
+            data['termFrequency'] = [
+                {"term": term, "count": count} for term, count in token_frequencies.most_common(top_terms)
+            ]
+        return data
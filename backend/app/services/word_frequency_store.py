@@ -0,0 +1,120 @@
+"""
+Per-student token frequencies for the word cloud
+Updated incrementally when a note is saved instead of re-tokenizing every note on each render
+"""
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config.settings import settings
+from app.services.metrics_service import metrics
+
+
+class WordFrequencyStore:
+    """
+    Token counters per student, kept in memory (LRU bounded by WORD_FREQ_MAX_USERS).
+
+    Each counter remembers how many notes it covers and their latest
+    created_at. Saving a note adds its tokens and advances both; a reader whose
+    rows no longer match (note saved by another worker, note deleted, evicted
+    entry) rebuilds the counter once from the notes' tokens.
+
+    Counters handed out are never mutated afterwards (a render may still be
+    iterating one in a worker thread): adding a note stores an updated copy.
+    """
+
+    _lock = threading.Lock()
+    _entries: "OrderedDict[str, Tuple[int, str, Counter]]" = OrderedDict()
+
+    @staticmethod
+    def _latest(rows: List[Dict[str, Any]], time_field: str) -> str:
+        timestamps = [str(r[time_field]) for r in rows if r.get(time_field) is not None]
+        return max(timestamps) if timestamps else ""
+
+    @classmethod
+    def _store(cls, user_id: str, notes: int, latest: str, counter: Counter) -> None:
+        """Insert into the LRU (caller holds the lock)"""
+        cls._entries[user_id] = (notes, latest, counter)
+        cls._entries.move_to_end(user_id)
+        while len(cls._entries) > settings.WORD_FREQ_MAX_USERS:
+            cls._entries.popitem(last=False)
+
+    @classmethod
+    def add_note(cls, user_id: Any, tokens: Optional[List[str]], created_at: Any) -> None:
+        """
+        Count the tokens of a newly saved note
+
+        Args:
+            user_id: Student id
+            tokens: Tokens produced by TextAnalysisService.analyze_single_note
+            created_at: created_at of the inserted row
+        """
+        key = str(user_id)
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is None:
+                # Not seeded yet: the next reader builds it from all rows
+                return
+            notes, latest, counter = entry
+            # Copy-on-write: readers may hold the previous counter
+            counter = counter.copy()
+            counter.update(tokens or [])
+            cls._store(key, notes + 1, max(latest, str(created_at or "")), counter)
+
+    @classmethod
+    def lookup(cls, user_id: Any, rows: List[Dict[str, Any]], time_field: str = "created_at") -> Optional[Counter]:
+        """
+        Stored counter if it still matches the notes, without reading their tokens
+
+        Args:
+            user_id: Student id
+            rows: The student's notes (only the time_field column is needed)
+            time_field: Timestamp column of the rows
+
+        Returns:
+            Counter (shared: do not mutate) or None when it must be rebuilt
+        """
+        key = str(user_id)
+        latest = cls._latest(rows, time_field)
+        with cls._lock:
+            entry = cls._entries.get(key)
+            if entry is not None and entry[0] == len(rows) and entry[1] == latest:
+                cls._entries.move_to_end(key)
+                metrics.inc("word_frequency_requests_total", {"result": "hit"})
+                return entry[2]
+        return None
+
+    @classmethod
+    def frequencies(
+        cls,
+        user_id: Any,
+        rows: List[Dict[str, Any]],
+        tokens_field: str = "tokens",
+        time_field: str = "created_at"
+    ) -> Counter:
+        """
+        Token frequencies for a student's notes
+
+        Args:
+            user_id: Student id
+            rows: The student's notes (with decrypted tokens), used to check the
+                counter is current and to rebuild it when it is not
+            tokens_field: Column holding the token list
+            time_field: Timestamp column of the rows
+
+        Returns:
+            Counter of token -> occurrences (shared: do not mutate)
+        """
+        cached = cls.lookup(user_id, rows, time_field)
+        if cached is not None:
+            return cached
+
+        counter = Counter()
+        for row in rows:
+            tokens = row.get(tokens_field)
+            if isinstance(tokens, list):
+                counter.update(tokens)
+        with cls._lock:
+            cls._store(str(user_id), len(rows), cls._latest(rows, time_field), counter)
+        metrics.inc("word_frequency_requests_total", {"result": "rebuild"})
+        return counter
@@ -1,15 +1,20 @@
 import sys
+import asyncio
 import pandas as pd
 import io
+import json
 import base64
 import os
 import requests
+import random
 from typing import List, Dict, Any
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi import BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 import traceback
+import time
 from datetime import datetime
 import numpy as np
 import cv2
@@ -28,6 +33,17 @@ from app.config.settings import settings
 
 # Base de datos
 from app.db.supabase_client import supabase
+from app.db.postgrest_client import PostgrestClient
+from app.db.repositories import (
+    usuarios_repo,
+    notas_repo,
+    asistencia_repo,
+    drawings_repo,
+    likes_repo,
+    recomendaciones_repo,
+    project_columns,
+    resolve_page_size,
+)
 
 # Modelos Pydantic
 from app.models.schemas import (
@@ -41,15 +57,22 @@ from app.services.text_analysis_service import TextAnalysisService
 from app.services.alert_service import AlertService
 from app.services.email_service import EmailService
 from app.services.gemini_service import GeminiService
+from app.services.gemini_client import GeminiHttpClient
 from app.services.face_recognition_service import FaceRecognitionService
 from app.services.visualization_service import VisualizationService
+from app.services.chart_cache import ChartCache
+from app.services.word_frequency_store import WordFrequencyStore
+from app.services.export_service import ExportService
+from app.services.cohort_export_service import CohortExportService
 from app.services.drawing_analysis_service import DrawingAnalysisService
 from app.services.appointments_service import AppointmentsService
 from app.services.encryption_service import encryption_service
-
-# Recomendaciones
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from app.services.accompaniment_service import AccompanimentService
+from app.services.recommendation_catalog import RecommendationCatalog, most_common_label
+from app.services.content_recommender import ContentRecommender
+from app.services.collaborative_recommender import CollaborativeRecommender
+from app.services.metrics_service import metrics, bind_request, unbind_request, route_label
+from app.services.profiling_service import ProfilingService
 # Los modelos Pydantic ahora están en app/models/schemas.py
 # Importados arriba desde app.models.schemas
 
@@ -67,6 +90,120 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+metrics.describe("http_request_duration_seconds", "Latency of HTTP requests by route template")
+metrics.describe("http_requests_in_progress", "HTTP requests currently being served")
+
+@app.middleware("http")
+async def medir_peticiones(request: Request, call_next):
+    """
+    Latencia por ruta (plantilla, no la URL con ids) y peticiones en curso.
+    Los spans registrados dentro de los servicios quedan asociados a la ruta.
+    En respuestas en streaming se mide hasta el envío de los encabezados.
+    """
+    metrics.add_gauge("http_requests_in_progress", 1, {"method": request.method})
+    token = bind_request(request.scope)
+    start = time.perf_counter()
+    status_code = "500"
+    try:
+        response = await call_next(request)
+        status_code = str(response.status_code)
+        return response
+    finally:
+        metrics.observe(
+            "http_request_duration_seconds",
+            time.perf_counter() - start,
+            {"method": request.method, "route": route_label(request.scope), "status": status_code}
+        )
+        unbind_request(token)
+        metrics.add_gauge("http_requests_in_progress", -1, {"method": request.method})
+
+@app.middleware("http")
+async def perfilar_peticion(request: Request, call_next):
+    """
+    Con ?profile=1 (perfilado activado en Settings y encabezado X-Profiling-Token)
+    la llamada se ejecuta bajo cProfile; la respuesta no cambia y trae
+    X-Profile-Id para leer el resumen en /admin/profile/requests/{profile_id}
+    y Server-Timing con la duración perfilada.
+    En respuestas en streaming se perfila hasta el envío de los encabezados.
+
+    cProfile captura todo lo que corre en el event loop: se rechaza (409) si el
+    worker atiende otras peticiones, y las que lleguen durante el perfilado
+    quedan contadas en `other_requests_at_end` del resumen.
+    """
+    if not settings.PROFILING_ENABLED or request.query_params.get("profile") != "1":
+        return await call_next(request)
+    if not ProfilingService.is_authorized(request.headers.get("x-profiling-token")):
+        return JSONResponse(status_code=403, content={"detail": "Token de perfilado inválido"})
+    # Este middleware envuelve a medir_peticiones: el gauge aún no cuenta esta petición
+    if metrics.gauge_total("http_requests_in_progress") > 0:
+        return JSONResponse(
+            status_code=409,
+            content={"detail": "Hay otras peticiones en curso en este worker; el perfil las mezclaría"}
+        )
+    profiler = ProfilingService.start_request_profile()
+    if profiler is None:
+        return JSONResponse(status_code=409, content={"detail": "Ya se está perfilando otra petición"})
+
+    start = time.perf_counter()
+    info = {"method": request.method, "path": request.url.path, "status": 500}
+    try:
+        response = await call_next(request)
+        info["status"] = response.status_code
+    finally:
+        info["route"] = route_label(request.scope)
+        info["elapsed_seconds"] = round(time.perf_counter() - start, 6)
+        info["other_requests_at_end"] = int(metrics.gauge_total("http_requests_in_progress"))
+        profile_id = ProfilingService.finish_request_profile(profiler, info)
+        print(f"[PROFILING] {request.method} {info['route']} perfilada en {info['elapsed_seconds']}s (id {profile_id})")
+    response.headers["X-Profile-Id"] = profile_id
+    response.headers["Server-Timing"] = f'profile;dur={info["elapsed_seconds"] * 1000:.1f};desc="{profile_id}"'
+    return response
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Todas las métricas del proceso en formato de texto de Prometheus."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/admin/profile/sample")
+async def muestrear_worker(
+    seconds: float = Query(10, description="Duración del muestreo en segundos"),
+    interval_ms: float | None = Query(None, description="Intervalo entre muestras (ms)"),
+    output: str = Query("collapsed", description="collapsed (flamegraph) o speedscope (JSON)"),
+    include_idle: bool = Query(False, description="Incluir hilos que solo están esperando"),
+    x_profiling_token: str | None = Header(None)
+):
+    """
+    Muestrea las pilas de todos los hilos de este worker durante `seconds` y
+    devuelve las pilas colapsadas (flamegraph.pl / speedscope) o un JSON de speedscope.
+    Solo con PROFILING_ENABLED y el encabezado X-Profiling-Token.
+    """
+    ProfilingService.check_access(x_profiling_token)
+    result = await run_in_threadpool(ProfilingService.sample, seconds, interval_ms, output, include_idle)
+    if output == "speedscope":
+        return JSONResponse(content=result)
+    return PlainTextResponse(result)
+
+@app.get("/admin/profile/requests/{profile_id}")
+async def obtener_perfil_peticion(profile_id: str, x_profiling_token: str | None = Header(None)):
+    """Resumen de cProfile de una petición hecha con ?profile=1 (id en X-Profile-Id)."""
+    ProfilingService.check_access(x_profiling_token)
+    profile = ProfilingService.get_request_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Perfil no encontrado")
+    return profile
+
+@app.on_event("startup")
+async def start_background_jobs():
+    """Arranca la reconstrucción periódica del modelo colaborativo de recomendaciones."""
+    CollaborativeRecommender.start()
+
+@app.on_event("shutdown")
+async def close_http_clients():
+    """Cierra las conexiones HTTP compartidas al apagar el servidor."""
+    await CollaborativeRecommender.stop()
+    await GeminiHttpClient.aclose()
+    await PostgrestClient.aclose()
+
 # --- Lógica de Procesamiento del Código Python ---
 # Los servicios de análisis de texto ya manejan la inicialización de NLTK y modelos
 # TextAnalysisService se inicializa automáticamente cuando se importa
@@ -76,8 +213,8 @@ app.add_middleware(
 async def registrar_asistencia(asistencia: AsistenciaRequest):
     try:
         data = asistencia.dict()
-        response = supabase.table("asistencia").insert(data).execute()
-        return {"message": "Asistencia registrada con éxito", "data": response.data}
+        rows = await asistencia_repo.insert(data)
+        return {"message": "Asistencia registrada con éxito", "data": rows}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error al registrar asistencia: {e}")
 
@@ -92,13 +229,12 @@ async def crear_estudiante(estudiante: Estudiante):
         data = encryption_service.encrypt_dict_fields(data, campos_sensibles_usuarios)
         
         # 🔑 Supabase usa el ID proporcionado para la clave foránea
-        response = supabase.table("usuarios").insert(data).execute()
+        rows = await usuarios_repo.insert(data)
         
         # 🔓 Desencriptar datos en la respuesta
-        if response.data:
-            response.data = [encryption_service.decrypt_dict_fields(item, campos_sensibles_usuarios) for item in response.data]
+        rows = [encryption_service.decrypt_dict_fields(item, campos_sensibles_usuarios) for item in rows]
         
-        return {"message": "Estudiante creado con éxito", "data": response.data}
+        return {"message": "Estudiante creado con éxito", "data": rows}
     except Exception as e:
         # Esto atrapará el error si el ID ya existe o es inválido
         raise HTTPException(status_code=500, detail=str(e))
@@ -113,13 +249,12 @@ async def crear_psicologo(psicologo: Psicologo):
         campos_sensibles_usuarios = ["nombre", "apellido", "dni", "edad", "direccion", "foto_perfil_url", "face_encoding"]
         data = encryption_service.encrypt_dict_fields(data, campos_sensibles_usuarios)
         
-        response = supabase.table("usuarios").insert(data).execute()
+        rows = await usuarios_repo.insert(data)
         
         # 🔓 Desencriptar datos en la respuesta
-        if response.data:
-            response.data = [encryption_service.decrypt_dict_fields(item, campos_sensibles_usuarios) for item in response.data]
+        rows = [encryption_service.decrypt_dict_fields(item, campos_sensibles_usuarios) for item in rows]
         
-        return {"message": "Psicólogo creado con éxito", "data": response.data}
+        return {"message": "Psicólogo creado con éxito", "data": rows}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -128,11 +263,11 @@ async def crear_psicologo(psicologo: Psicologo):
 @app.post("/login")
 async def login_user(credentials: LoginRequest):
     try:
-        # 1️⃣ Verificar credenciales
-        auth_response = supabase.auth.sign_in_with_password({
-            "email": credentials.email,
-            "password": credentials.password
-        })
+        # 1️⃣ Verificar credenciales (Supabase Auth; cliente síncrono en un hilo)
+        auth_response = await run_in_threadpool(
+            supabase.auth.sign_in_with_password,
+            {"email": credentials.email, "password": credentials.password}
+        )
 
         if not auth_response.user:
             raise HTTPException(status_code=401, detail="Credenciales inválidas")
@@ -140,13 +275,11 @@ async def login_user(credentials: LoginRequest):
         user_id = auth_response.user.id
 
         # 2️⃣ Obtener el rol desde tu tabla 'usuarios'
-        profile_response = supabase.table("usuarios").select("*").eq("id", user_id).single().execute()
+        user_profile = await usuarios_repo.get_by_id(user_id)
 
-        if not profile_response.data:
+        if not user_profile:
             raise HTTPException(status_code=404, detail="Usuario no encontrado en tabla 'usuarios'")
 
-        user_profile = profile_response.data
-
         # 🔓 Desencriptar campos sensibles del usuario
         campos_sensibles_usuarios = ["nombre", "apellido", "dni", "edad", "direccion", "foto_perfil_url", "face_encoding"]
         user_profile = encryption_service.decrypt_dict_fields(user_profile, campos_sensibles_usuarios)
@@ -198,34 +331,32 @@ async def guardar_nota(note_data: Note, background_tasks: BackgroundTasks):
         tokens_encriptados = encryption_service.encrypt(analysis['tokens'])
         
         # Insertar en la tabla notas
-        response = supabase.table("notas").insert([{
+        rows = await notas_repo.insert([{
             "usuario_id": user_id,
             "nota": nota_encriptada,
             "sentimiento": analysis['sentimiento'],
             "emocion": analysis['emocion'],
             "emocion_score": analysis['emocion_score'],
             "tokens": tokens_encriptados
-        }]).execute()
+        }])
         
         # 🔓 Desencriptar datos en la respuesta
-        if response.data:
-            for item in response.data:
-                if item.get("nota"):
-                    item["nota"] = encryption_service.decrypt(item["nota"])
-                if item.get("tokens"):
-                    item["tokens"] = encryption_service.decrypt(item["tokens"])
+        for item in rows:
+            if item.get("nota"):
+                item["nota"] = encryption_service.decrypt(item["nota"])
+            if item.get("tokens"):
+                item["tokens"] = encryption_service.decrypt(item["tokens"])
         
-        # GENERATIVE AI: usar servicio de Gemini
-        accompaniment_text = None
-        try:
-            accompaniment_text = GeminiService.generate_accompaniment(nota_texto)
-            if accompaniment_text:
-                print(f"[GUARDAR_NOTA] Acompañamiento generado exitosamente (length: {len(accompaniment_text)})")
-            else:
-                print(f"[GUARDAR_NOTA] Acompañamiento no se pudo generar (retornó None)")
-        except Exception as e:
-            print(f"Error generando acompañamiento con Gemini: {e}")
-            traceback.print_exc()
+        # Frecuencias de palabras del estudiante: se suman los tokens de la nota nueva
+        if rows:
+            WordFrequencyStore.add_note(user_id, analysis['tokens'], rows[0].get("created_at"))
+
+        # GENERATIVE AI: el acompañamiento se genera en background (no bloquea la respuesta)
+        # El frontend lo obtiene con GET /notas/{job_id}/acompanamiento (o /stream vía SSE)
+        accompaniment_job_id = None
+        if rows and rows[0].get("id") is not None:
+            accompaniment_job_id = AccompanimentService.create_job(str(rows[0]["id"]))
+            background_tasks.add_task(AccompanimentService.run_job, accompaniment_job_id, nota_texto)
 
         # Lanzar alerta por palabras severas en background (no bloquea la respuesta)
         try:
@@ -234,11 +365,55 @@ async def guardar_nota(note_data: Note, background_tasks: BackgroundTasks):
             print(f"No se pudo agendar tarea de alerta: {e}")
 
         # Devolver los datos recién insertados (para que el frontend actualice la lista)
-        # Incluimos el acompañamiento en la respuesta para que el frontend lo muestre si lo desea
-        return {"message": "Nota guardada con éxito", "data": response.data, "accompaniment": accompaniment_text}
+        # "accompaniment" se mantiene (None) por compatibilidad con clientes anteriores
+        return {
+            "message": "Nota guardada con éxito",
+            "data": rows,
+            "accompaniment": None,
+            "accompaniment_job_id": accompaniment_job_id,
+            "accompaniment_status": "pending" if accompaniment_job_id else None,
+        }
     except Exception as e:
         print(f"Error al guardar nota: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/notas/{job_id}/acompanamiento")
+async def get_acompanamiento_nota(job_id: str):
+    """Consulta (poll) el estado del acompañamiento generado para una nota."""
+    try:
+        status = await AccompanimentService.get_status(job_id)
+    except Exception as e:
+        print(f"Error al consultar acompañamiento: {e}")
+        raise HTTPException(status_code=500, detail="Error interno al consultar acompañamiento")
+    if status is None:
+        raise HTTPException(status_code=404, detail="Nota no encontrada")
+    return status
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Formatea un evento Server-Sent Events con payload JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.get("/notas/{job_id}/acompanamiento/stream")
+async def stream_acompanamiento_nota(job_id: str, timeout: float = Query(30.0, ge=1.0, le=120.0)):
+    """Entrega el acompañamiento por Server-Sent Events en cuanto esté listo."""
+    async def event_stream():
+        status = await AccompanimentService.get_status(job_id)
+        if status is None:
+            yield _sse_event("error", {"detail": "Nota no encontrada"})
+            return
+        if status["status"] == "pending":
+            yield _sse_event("status", status)
+            status = await AccompanimentService.wait_for(job_id, timeout)
+        yield _sse_event("accompaniment", status)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 # La función crear_visualizaciones ahora está en VisualizationService
 # Usar: VisualizationService.create_visualizations(df_analizado)
 
@@ -260,43 +435,76 @@ async def analyze_notes(notes: List[Note]):
     if df_analizado.empty:
         return {"message": "Análisis completado sin datos", "data": {}}
         
-    analysis_images = VisualizationService.create_visualizations(df_analizado)
+    analysis_images = await run_in_threadpool(VisualizationService.create_visualizations, df_analizado)
     
     return analysis_images
 
+# Formato del análisis: "png" = gráficos Base64 (exportes/PDF), "data" = conteos JSON para Charts.jsx
+_ANALYSIS_FORMATS = ("png", "data")
+_FORMAT_QUERY = Query("png", alias="format", description="png (gráficos Base64) o data (conteos JSON para graficar en el cliente)")
+
+
+def _analysis_format_or_400(formato: str) -> str:
+    """Valida el parámetro `format` de los endpoints de análisis."""
+    if formato not in _ANALYSIS_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format debe ser uno de: {', '.join(_ANALYSIS_FORMATS)}")
+    return formato
+
+
 @app.get("/analyze-asistencia/{user_id}")
-async def analyze_asistencia_aprendizaje(user_id: str):
+async def analyze_asistencia_aprendizaje(user_id: str, formato: str = _FORMAT_QUERY):
     """
     Obtiene todos los aprendizajes obtenidos de la tabla ASISTENCIA para un usuario,
     los analiza y devuelve gráficos Base64 igual que el reporte de diario.
+    Con `format=data` devuelve los conteos en JSON en lugar de imágenes.
     """
+    formato = _analysis_format_or_400(formato)
     # 1. Obtener aprendizajes de la tabla ASISTENCIA
-    response = supabase.table("asistencia").select("id_asistencia, aprendizaje_obtenido, fecha_atencion").eq("id_usuario", user_id).order("fecha_atencion", desc=True).execute()
-    data = response.data or []
+    data = await asistencia_repo.list_by_user(user_id)
 
     if not data:
         return {"message": "No hay registros de asistencia para este usuario", "analysis": {}, "notes": []}
 
-    # 2. Convertir a DataFrame y renombrar columna para reutilizar la lógica
-    df = pd.DataFrame(data).rename(columns={'aprendizaje_obtenido': 'note'})
+    # 2. Caché primero: mientras no cambien los registros no se repite el NLP ni el render
+    #    (la entrada guarda gráficos o conteos, topics globales y el análisis de cada registro)
+    fingerprint = ChartCache.fingerprint(data, "fecha_atencion")
+    cache_kind = "asistencia" if formato == "png" else "asistencia_data"
+    cached = await ChartCache.get(cache_kind, user_id, fingerprint)
 
-    # 3. Analizar los aprendizajes usando servicio con topics
-    df_analizado, global_topics = TextAnalysisService.analyze_diary_complete_with_topics(df)
+    if cached is None:
+        # 3. Convertir a DataFrame y analizar los aprendizajes usando servicio con topics
+        df = pd.DataFrame(data).rename(columns={'aprendizaje_obtenido': 'note'})
+        df_analizado, global_topics = TextAnalysisService.analyze_diary_complete_with_topics(df)
 
-    # 4. Crear visualizaciones usando servicio
-    analysis_images = VisualizationService.create_visualizations(df_analizado)
+        # 4. Crear visualizaciones (o conteos con format=data)
+        if formato == "data":
+            analysis_images = VisualizationService.chart_data(df_analizado)
+        else:
+            analysis_images = await run_in_threadpool(VisualizationService.create_visualizations, df_analizado)
+
+        notes_analysis = [
+            {
+                'sentimiento': row['sentimiento'],
+                'emocion': row['emocion'],
+                'emocion_score': float(row['emocion_score']),
+                'topics': list(row['topics']) if 'topics' in row else []
+            }
+            for _, row in df_analizado.iterrows()
+        ]
+        cached = {**analysis_images, "topics": global_topics, "notes_analysis": notes_analysis}
+        await ChartCache.set(cache_kind, user_id, fingerprint, cached)
+
+    analysis_images = {k: v for k, v in cached.items() if k != "notes_analysis"}
+    notes_analysis = cached.get("notes_analysis", [])
 
     # 5. Mergear resultados del análisis con las notas originales
+    #    (los topics globales ya van en analysis["topics"])
     analyzed_notes = []
     for i, note in enumerate(data):
-        if i < len(df_analizado):
-            analysis_result = df_analizado.iloc[i]
+        if i < len(notes_analysis):
             analyzed_notes.append({
                 **note,  # Mantener todos los campos originales
-                'sentimiento': analysis_result['sentimiento'],
-                'emocion': analysis_result['emocion'],
-                'emocion_score': analysis_result['emocion_score'],
-                'topics': analysis_result['topics'] if 'topics' in analysis_result else []
+                **notes_analysis[i]
             })
         else:
             analyzed_notes.append({
@@ -304,24 +512,24 @@ async def analyze_asistencia_aprendizaje(user_id: str):
                 'topics': []
             })
 
-    # 6. Agregar topics globales al analysis
-    analysis_images['topics'] = global_topics
-
-    return {
+    response = {
         "message": "Análisis de aprendizajes completado con éxito",
         "analysis": analysis_images,
         "notes": analyzed_notes
     }
+    if formato == "png":
+        response["image_format"] = VisualizationService.image_format()
+    return response
 
 @app.post("/attendance-insight")
-async def generate_attendance_insight(payload: dict):
+async def generate_attendance_insight(payload: dict, use_cache: bool = Query(True, description="False para ignorar la caché y regenerar")):
     texts = payload.get("texts", [])
     if not texts:
         raise HTTPException(status_code=400, detail="No se proporcionaron aprendizajes.")
 
     try:
         # Usar servicio de Gemini
-        summary = GeminiService.generate_insight(texts)
+        summary = await GeminiService.generate_insight_async(texts, use_cache=use_cache)
         return {"summary": summary}
     except Exception as e:
         print(f"Error en Gemini: {e}")
@@ -336,35 +544,79 @@ async def attendance_chatbot(payload: dict):
 
     # Usar servicio de Gemini
     try:
-        answer = GeminiService.generate_chatbot_response(context, question)
+        answer = await GeminiService.generate_chatbot_response_async(context, question)
         return {"answer": answer}
     except Exception as e:
         print(f"Error en Gemini chatbot: {e}")
         raise HTTPException(status_code=500, detail=f"Error generando respuesta: {e}")
 
+async def _relay_gemini_stream(chunks, result_key: str, fallback_text: str):
+    """Reenvía los fragmentos de Gemini como eventos 'token' y cierra con el texto completo."""
+    collected = []
+    try:
+        async for chunk in chunks:
+            collected.append(chunk)
+            yield _sse_event("token", {"text": chunk})
+        full_text = "".join(collected).strip() or fallback_text
+        yield _sse_event("done", {result_key: full_text})
+    except Exception as e:
+        print(f"Error en streaming de Gemini: {e}")
+        yield _sse_event("error", {"detail": "Error generando respuesta"})
+
+
+@app.post("/attendance-insight/stream")
+async def stream_attendance_insight(payload: dict, use_cache: bool = Query(True, description="False para ignorar la caché y regenerar")):
+    """Igual que /attendance-insight pero transmite el texto por SSE a medida que se genera."""
+    texts = payload.get("texts", [])
+    if not texts:
+        raise HTTPException(status_code=400, detail="No se proporcionaron aprendizajes.")
+
+    return StreamingResponse(
+        _relay_gemini_stream(GeminiService.stream_insight(texts, use_cache=use_cache), "summary", "No se pudo generar insight"),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/attendance-chatbot/stream")
+async def stream_attendance_chatbot(payload: dict):
+    """Igual que /attendance-chatbot pero transmite la respuesta por SSE a medida que se genera."""
+    context = payload.get("context", {})
+    question = payload.get("question", "")
+    if not question:
+        raise HTTPException(status_code=400, detail="No se proporcionó pregunta.")
+
+    return StreamingResponse(
+        _relay_gemini_stream(
+            GeminiService.stream_chatbot_response(context, question),
+            "answer",
+            "No se pudo generar respuesta"
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/gemini/metrics")
+async def get_gemini_metrics():
+    """Salud por modelo (enfriamiento / circuito) y contadores de latencia y errores de Gemini."""
+    return GeminiService.get_health()
+
 # 🔑 NUEVO ENDPOINT: Listar estudiantes
 @app.get("/psychologist/students")
 async def get_students(psychologist_id: str | None = None):
     """Obtiene la lista de todos los usuarios con rol 'estudiante'."""
     try:
-        query = supabase.table("usuarios").select("id, nombre, apellido, codigo_alumno")\
-            .eq("rol", "estudiante")
-
-        if psychologist_id:
-            query = query.eq("psicologo_id", psychologist_id)
-
-        response = query.execute()
+        students = await usuarios_repo.list_students(psychologist_id)
         
         # 🔓 Desencriptar campos sensibles
         campos_sensibles_usuarios = ["nombre", "apellido"]
-        if response.data:
-            response.data = [encryption_service.decrypt_dict_fields(item, campos_sensibles_usuarios) for item in response.data]
+        students = [encryption_service.decrypt_dict_fields(item, campos_sensibles_usuarios) for item in students]
         
         # Corrección: Asegurar indentación de 4 espacios
-        if not response.data:
+        if not students:
             return {"message": "No se encontraron estudiantes", "data": []}
             
-        return {"message": "Estudiantes recuperados con éxito", "data": response.data}
+        return {"message": "Estudiantes recuperados con éxito", "data": students}
     except Exception as e:
         print(f"Error al listar estudiantes: {e}")
         # Corrección: Asegurar indentación de 4 espacios
@@ -372,23 +624,70 @@ async def get_students(psychologist_id: str | None = None):
 
 # ---
 
+def _page_size_or_400(cursor: str | None, page_size: int | None) -> int | None:
+    """Tamaño de página efectivo (None = lista completa, clientes antiguos); 400 si el cursor es inválido."""
+    try:
+        return resolve_page_size(cursor, page_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+_CURSOR_QUERY = Query(None, description="next_cursor devuelto por la página anterior")
+_PAGE_SIZE_QUERY = Query(None, ge=1, description="Tamaño de página; sin cursor ni page_size se devuelve todo")
+_FIELDS_QUERY = Query(None, description="Columnas separadas por comas (ver whitelist del endpoint); sin fields se devuelve la fila completa")
+
+# Proyecciones permitidas por endpoint: columnas pesadas (tokens, drawing_data) solo si se piden
+NOTAS_FIELDS = (
+    "id", "usuario_id", "nota", "sentimiento", "emocion", "emocion_score",
+    "tokens", "acompanamiento", "created_at",
+)
+DRAWINGS_FIELDS = (
+    "id", "usuario_id", "titulo", "descripcion", "imagen_url",
+    "drawing_data", "tipo_dibujo", "created_at",
+)
+
+
+def _columns_or_400(fields: str | None, allowed: tuple) -> str:
+    """Lista de columnas para el parámetro `fields`; 400 si pide columnas fuera de la whitelist."""
+    try:
+        return project_columns(fields, allowed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @app.get("/notas/{user_id}")
-async def get_notas_by_user(user_id: str):
-    """Obtiene todas las notas para un usuario específico desde Supabase."""
+async def get_notas_by_user(
+    user_id: str,
+    cursor: str | None = _CURSOR_QUERY,
+    page_size: int | None = _PAGE_SIZE_QUERY,
+    fields: str | None = _FIELDS_QUERY
+):
+    """
+    Obtiene las notas de un usuario (más recientes primero), paginadas si se envía cursor o page_size.
+    `fields` limita las columnas (p. ej. nota,emocion) y evita traer y desencriptar `tokens`.
+    """
+    limit = _page_size_or_400(cursor, page_size)
+    columnas = _columns_or_400(fields, NOTAS_FIELDS)
     try:
-        response = supabase.table("notas").select("*").eq("usuario_id", user_id).order("created_at", desc=True).execute()
+        next_cursor = None
+        if limit is None:
+            notas = await notas_repo.list_by_user(user_id, columnas)
+        else:
+            notas, next_cursor = await notas_repo.page_by_user(user_id, limit, cursor, columnas)
         # Corrección: Asegurar indentación de 4 espacios
-        if not response or not getattr(response, 'data', None):
-            return {"message": "No se encontraron notas para este usuario", "data": []}
+        if not notas:
+            return {"message": "No se encontraron notas para este usuario", "data": [], "next_cursor": None}
 
         # 🔓 Desencriptar campos sensibles
-        for item in response.data:
+        for item in notas:
             if item.get("nota"):
                 item["nota"] = encryption_service.decrypt(item["nota"])
             if item.get("tokens"):
                 item["tokens"] = encryption_service.decrypt(item["tokens"])
+            if item.get("acompanamiento"):
+                item["acompanamiento"] = encryption_service.decrypt(item["acompanamiento"])
 
-        return {"message": "Notas recuperadas con éxito", "data": response.data}
+        return {"message": "Notas recuperadas con éxito", "data": notas, "next_cursor": next_cursor}
     except Exception as e:
         print(f"Error al recuperar notas: {e}")
         traceback.print_exc()
@@ -397,19 +696,60 @@ async def get_notas_by_user(user_id: str):
 
 # ---
 
+# Columnas de notas que usa /analyze: las que lee el análisis (nota, sentimiento, emocion),
+# created_at para validar cachés y las que muestra el reporte (id, emocion_score).
+# Sin `tokens` (solo se leen para reconstruir frecuencias) ni `acompanamiento`
+_ANALYZE_NOTE_FIELDS = "id,nota,sentimiento,emocion,emocion_score,created_at"
+
 # 🔑 RUTA DE ANÁLISIS MEJORADA: Ahora recibe el user_id y usa la ruta GET /notas/{user_id}
 @app.get("/analyze/{user_id}")
-async def analyze_student_notes(user_id: str):
+async def analyze_student_notes(user_id: str, formato: str = _FORMAT_QUERY):
     """
     Obtiene todas las notas de un estudiante, las analiza y devuelve gráficos Base64.
+    Con `format=data` devuelve los conteos en JSON (sentimientos, emociones, términos).
     """
-    # 1. Obtener notas
-    notes_response = await get_notas_by_user(user_id)
+    formato = _analysis_format_or_400(formato)
+
+    # 1. Obtener solo las columnas del análisis: el número de notas y su created_at más
+    #    reciente bastan para validar la caché de gráficos y las frecuencias de palabras
+    notes_response = await get_notas_by_user(
+        user_id, cursor=None, page_size=None, fields=_ANALYZE_NOTE_FIELDS
+    )
     notes_data = notes_response.get("data", [])
     
     if not notes_data:
         # Corrección: Asegurar indentación de 4 espacios
         return {"message": "Análisis completado sin datos", "analysis": {}, "notes": []}
+
+    # Sin notas nuevas desde el último análisis: gráficos cacheados (sin análisis ni matplotlib)
+    fingerprint = ChartCache.fingerprint(notes_data, "created_at")
+    if formato == "png":
+        analysis_images = await ChartCache.get("notas", user_id, fingerprint)
+        if analysis_images is not None:
+            return {
+                "message": "Análisis completado con éxito",
+                "analysis": analysis_images,
+                "image_format": VisualizationService.image_format(),
+                "notes": notes_data,
+            }
+
+    # Frecuencias de palabras mantenidas de forma incremental (entrada de la nube de palabras);
+    # los tokens solo se leen y desencriptan si hay que reconstruirlas
+    token_frequencies = WordFrequencyStore.lookup(user_id, notes_data)
+    if token_frequencies is None:
+        token_rows = await notas_repo.list_by_user(user_id, "id, tokens, created_at")
+        for item in token_rows:
+            if item.get("tokens"):
+                item["tokens"] = encryption_service.decrypt(item["tokens"])
+        token_frequencies = WordFrequencyStore.frequencies(user_id, token_rows)
+
+    # format=data: las notas ya guardan sentimiento y emoción (calculados al insertarlas)
+    if formato == "data":
+        df = pd.DataFrame(notes_data)
+        if not {"sentimiento", "emocion"}.issubset(df.columns) or df["sentimiento"].isna().any():
+            df = TextAnalysisService.analyze_diary_complete(df.rename(columns={'nota': 'note'}))
+        chart_data = VisualizationService.chart_data(df, token_frequencies=token_frequencies)
+        return {"message": "Análisis completado con éxito", "analysis": chart_data, "notes": notes_data}
         
     # 2. Convertir a DataFrame
     df = pd.DataFrame(notes_data)
@@ -420,9 +760,20 @@ async def analyze_student_notes(user_id: str):
     df_analizado = TextAnalysisService.analyze_diary_complete(df)
     
     # 4. Crear visualizaciones usando servicio
-    analysis_images = VisualizationService.create_visualizations(df_analizado)
+    analysis_images = await run_in_threadpool(
+        VisualizationService.create_visualizations,
+        df_analizado,
+        token_frequencies=token_frequencies or None
+    )
+    await ChartCache.set("notas", user_id, fingerprint, analysis_images)
     
-    return {"message": "Análisis completado con éxito", "analysis": analysis_images, "notes": notes_data}
+    # El formato va aparte: "analysis" solo contiene gráficos (la clave de caché incluye el formato)
+    return {
+        "message": "Análisis completado con éxito",
+        "analysis": analysis_images,
+        "image_format": VisualizationService.image_format(),
+        "notes": notes_data,
+    }
 
 # ---
 
@@ -430,30 +781,62 @@ async def analyze_student_notes(user_id: str):
 @app.get("/export/{user_id}")
 async def export_student_report(user_id: str):
     """
-    Obtiene las notas de un estudiante, las analiza y devuelve un archivo CSV.
+    Obtiene las notas de un estudiante y devuelve un archivo CSV con su análisis.
+
+    Se transmite de verdad: las notas se leen por páginas, se desencriptan, se
+    combinan con el análisis ya guardado y cada bloque CSV se envía al generarse.
     """
-    # 1. Obtener notas
-    notes_response = await get_notas_by_user(user_id)
-    notes_data = notes_response.get("data", [])
+    # 1. Primera página (para poder responder 404 antes de empezar a transmitir)
+    first_page, cursor = await ExportService.notes_first_page(user_id)
     
-    if not notes_data:
-        # Corrección: Asegurar indentación de 4 espacios
+    if not first_page:
         raise HTTPException(status_code=404, detail="No hay notas para exportar.")
-        
-    # 2. Convertir a DataFrame para análisis y exportación
-    df = pd.DataFrame(notes_data).rename(columns={'nota': 'note', 'usuario_id': 'user_id'})
-    df_analizado = TextAnalysisService.analyze_diary_complete(df)
     
-    # 3. Preparar CSV
-    output = io.StringIO()
-    df_analizado.to_csv(output, index=False, sep=';', encoding='utf-8')
-    
-    # 4. Devolver como StreamingResponse
+    # 2. Devolver como StreamingResponse (una página de notas por bloque)
     return StreamingResponse(
-        iter([output.getvalue()]),
+        ExportService.stream_notes_csv(user_id, first_page, cursor),
         media_type="text/csv",
         headers={"Content-Disposition": f"attachment; filename=reporte_diario_{user_id}.csv"}
     )
+
+# ---
+
+# Exportación masiva de la cohorte de un psicólogo (Parquet / Arrow IPC)
+@app.post("/exports/cohort/{psychologist_id}")
+async def crear_exportacion_cohorte(
+    psychologist_id: str,
+    background_tasks: BackgroundTasks,
+    formato: str = Query("parquet", alias="format", description="parquet o arrow")
+):
+    """
+    Inicia en segundo plano la exportación de notas, asistencia y riesgo de
+    todos los estudiantes del psicólogo. Devuelve el id del trabajo para
+    consultar su progreso.
+    """
+    job_id = CohortExportService.create_job(psychologist_id, formato)
+    background_tasks.add_task(CohortExportService.run_job, job_id)
+    return {"job_id": job_id, "status": CohortExportService.get_status(job_id)["status"]}
+
+
+@app.get("/exports/cohort/jobs/{job_id}")
+async def estado_exportacion_cohorte(job_id: str):
+    """Progreso de una exportación y enlaces de descarga cuando termina"""
+    status = CohortExportService.get_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Exportación no encontrada")
+    return status
+
+
+@app.get("/exports/cohort/jobs/{job_id}/{dataset}")
+async def descargar_exportacion_cohorte(job_id: str, dataset: str, request: Request):
+    """
+    Descarga uno de los archivos (notas, asistencia o riesgo). Admite el
+    encabezado Range para reanudar descargas interrumpidas.
+    """
+    path, filename = CohortExportService.file_for(job_id, dataset)
+    return CohortExportService.range_response(path, filename, request.headers.get("range"))
+
+
 # =========================================================
 # 🎯 ENDPOINT: Obtener TODAS las Recomendaciones
 # Corresponde a la ruta: GET http://127.0.0.1:8000/recomendaciones/todas
@@ -464,17 +847,17 @@ async def obtener_todas_las_recomendaciones():
     Recupera todas las entradas de la tabla 'recomendaciones' para mostrarlas.
     """
     try:
-        # 1. Realizar la consulta a la tabla 'recomendaciones'
-        recs_response = supabase.table("recomendaciones").select("*").execute()
+        # 1. Leer el catálogo (en memoria; se recarga tras el TTL)
+        recs = await RecommendationCatalog.get_all()
         
         # 2. Verificar si hay datos
-        if not recs_response.data:
+        if not recs:
             return {"message": "No se encontraron recomendaciones", "data": []}
             
         # 3. Devolver los datos de manera estructurada
         return {
             "message": "Todas las recomendaciones recuperadas con éxito",
-            "data": recs_response.data
+            "data": recs
         }
 
     except Exception as e:
@@ -487,45 +870,51 @@ async def obtener_recomendaciones(user_id: str):
     Genera recomendaciones personalizadas considerando emociones recientes y gustos del usuario.
     """
     try:
-        # 🧠 1️⃣ Últimas emociones del usuario (por sus notas)
-        notas_response = supabase.table("notas")\
-            .select("emocion, sentimiento")\
-            .eq("usuario_id", user_id)\
-            .order("created_at", desc=True)\
-            .limit(5).execute()
+        # 🧠 1️⃣ Últimas emociones y tokens del usuario (por sus notas)
+        notas_data = await notas_repo.list_by_user(user_id, "emocion, sentimiento, tokens", limit=5)
 
-        notas_data = notas_response.data or []
-
-        # 🧡 2️⃣ Emociones frecuentes en los likes
-        likes_response = supabase.table("likes_recomendaciones")\
-            .select("recomendaciones:recomendacion_id(emocion_objetivo, sentimiento_objetivo)")\
-            .eq("user_id", user_id).execute()
-
-        likes_data = [r["recomendaciones"] for r in likes_response.data if r.get("recomendaciones")]
+        # 🧡 2️⃣ Emociones frecuentes en los likes (ids + catálogo en memoria, sin JOIN)
+        likes_rows = await likes_repo.list_by_user(user_id)
+        likes_data = await RecommendationCatalog.get_by_ids([r["recomendacion_id"] for r in likes_rows])
 
         # 🧮 Combinar ambas fuentes de emoción
-        emociones = [n["emocion"] for n in notas_data] + [l["emocion_objetivo"] for l in likes_data]
-        sentimientos = [n["sentimiento"] for n in notas_data] + [l["sentimiento_objetivo"] for l in likes_data]
+        emociones = [n.get("emocion") for n in notas_data] + [l.get("emocion_objetivo") for l in likes_data]
+        sentimientos = [n.get("sentimiento") for n in notas_data] + [l.get("sentimiento_objetivo") for l in likes_data]
 
         if not emociones:
-            recs = supabase.table("recomendaciones").select("*").execute()
-            return {"message": "Recomendaciones generales", "data": recs.data}
-
-        emocion_principal = pd.Series(emociones).mode()[0]
-        sentimiento_principal = pd.Series(sentimientos).mode()[0]
+            recs = await RecommendationCatalog.get_all()
+            return {"message": "Recomendaciones generales", "data": recs}
+
+        emocion_principal = most_common_label(emociones)
+        sentimiento_principal = most_common_label(sentimientos)
+
+        # 🎯 3️⃣ Ranking por contenido: perfil TF-IDF (tokens de las notas + etiquetas + likes)
+        note_tokens = []
+        for n in notas_data:
+            tokens = encryption_service.decrypt(n["tokens"]) if n.get("tokens") else None
+            if isinstance(tokens, list):
+                note_tokens.extend(str(t) for t in tokens)
+            note_tokens.extend(str(label) for label in (n.get("emocion"), n.get("sentimiento")) if label)
+        # + señal colaborativa: vecinos de lo que le gustó ("quien marcó X también marcó Y")
+        liked_ids = [r["recomendacion_id"] for r in likes_rows]
+        recomendadas = await ContentRecommender.rank(
+            note_tokens,
+            liked_ids,
+            extra_scores=CollaborativeRecommender.scores(liked_ids),
+            extra_weight=settings.RECOMMENDATIONS_CF_WEIGHT,
+        )
 
-        # 🎯 3️⃣ Buscar coincidencias
-        recs_response = supabase.table("recomendaciones").select("*").execute()
-        df = pd.DataFrame(recs_response.data)
-        mask = (df["emocion_objetivo"] == emocion_principal) | (df["sentimiento_objetivo"] == sentimiento_principal)
-        recomendadas = df[mask]
+        # Sin términos en común: coincidencia por emoción/sentimiento dominante
+        if not recomendadas:
+            recomendadas = await RecommendationCatalog.match(emocion_principal, sentimiento_principal)
 
-        if recomendadas.empty:
-            recomendadas = df.sample(min(3, len(df)))
+        if not recomendadas:
+            catalogo = await RecommendationCatalog.get_all()
+            recomendadas = random.sample(catalogo, min(3, len(catalogo)))
 
         return {
             "message": "Recomendaciones personalizadas con éxito",
-            "data": recomendadas.to_dict(orient="records"),
+            "data": recomendadas,
             "emocion_detectada": emocion_principal,
             "sentimiento_detectado": sentimiento_principal
         }
@@ -533,14 +922,28 @@ async def obtener_recomendaciones(user_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error generando recomendaciones: {e}")
 
+
+# =========================================================
+# 🔄 Invalidar la caché del catálogo de recomendaciones
+# Llamar tras insertar/editar filas en la tabla 'recomendaciones'
+# =========================================================
+@app.post("/recomendaciones/cache/invalidate")
+async def invalidar_cache_recomendaciones():
+    """
+    Fuerza la recarga del catálogo de recomendaciones en la siguiente petición.
+    """
+    RecommendationCatalog.invalidate()
+    return {
+        "message": "Caché de recomendaciones invalidada",
+        "cache": RecommendationCatalog.stats(),
+        "collaborative": CollaborativeRecommender.stats(),
+    }
+
 # 1️⃣ Agregar like
 @app.post("/likes/{user_id}/{recomendacion_id}")
 async def agregar_like(user_id: str, recomendacion_id: str):
     try:
-        supabase.table("likes_recomendaciones").insert({
-            "user_id": user_id,
-            "recomendacion_id": recomendacion_id
-        }).execute()
+        await likes_repo.add(user_id, recomendacion_id)
         return {"message": "Like agregado"}
     except Exception as e:
         # Si ya existe, ignoramos el error de duplicado
@@ -550,21 +953,60 @@ async def agregar_like(user_id: str, recomendacion_id: str):
 # 2️⃣ Quitar like
 @app.delete("/likes/{user_id}/{recomendacion_id}")
 async def eliminar_like(user_id: str, recomendacion_id: str):
-    supabase.table("likes_recomendaciones")\
-        .delete()\
-        .eq("user_id", user_id)\
-        .eq("recomendacion_id", recomendacion_id)\
-        .execute()
+    await likes_repo.remove(user_id, recomendacion_id)
     return {"message": "Like eliminado"}
 
 
 # 3️⃣ Obtener likes del usuario
 @app.get("/likes/{user_id}")
 async def obtener_likes_usuario(user_id: str):
-    res = supabase.table("likes_recomendaciones")\
-        .select("recomendacion_id")\
-        .eq("user_id", user_id).execute()
-    return [r["recomendacion_id"] for r in res.data]
+    rows = await likes_repo.list_by_user(user_id)
+    return [r["recomendacion_id"] for r in rows]
+
+
+# 4️⃣ Resumen de likes para un lote de recomendaciones (tarjetas del catálogo)
+@app.get("/likes/{user_id}/resumen")
+async def obtener_resumen_likes(
+    user_id: str,
+    ids: str = Query(None, description="IDs de recomendaciones separados por comas (vacío = todo el catálogo)")
+):
+    """
+    Devuelve, para cada recomendación, su número de likes y si el usuario la marcó.
+
+    Los conteos salen de la columna recomendaciones.likes_count, mantenida por un
+    trigger en la base de datos (igual en todos los workers, sin contar filas), y
+    los likes del usuario se leen en una sola consulta filtrada por los ids pedidos.
+    Ambas consultas se hacen en paralelo.
+    """
+    try:
+        if ids:
+            rec_ids = [i.strip() for i in ids.split(",") if i.strip()]
+            if not rec_ids:
+                return {"data": []}
+            rows, count_rows = await asyncio.gather(
+                likes_repo.list_by_user_for_items(user_id, rec_ids),
+                recomendaciones_repo.like_counts(rec_ids),
+            )
+        else:
+            rows, count_rows = await asyncio.gather(
+                likes_repo.list_by_user(user_id),
+                recomendaciones_repo.like_counts(),
+            )
+            rec_ids = [r.get("id") for r in count_rows]
+        if not rec_ids:
+            return {"data": []}
+
+        liked = {str(r["recomendacion_id"]) for r in rows}
+        counts = {str(r.get("id")): r.get("likes_count") or 0 for r in count_rows}
+
+        return {
+            "data": [
+                {"recomendacion_id": i, "likes": counts.get(str(i), 0), "liked_by_user": str(i) in liked}
+                for i in rec_ids
+            ]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error obteniendo el resumen de likes: {e}")
 
 
 # =========================================================
@@ -576,23 +1018,14 @@ async def obtener_recomendaciones_favoritas(user_id: str):
     """
     Obtiene los detalles completos de las recomendaciones que un usuario ha marcado como favoritas.
     
-    Utiliza una selección con JOIN (dot notation) para traer los datos de la tabla 'recomendaciones'.
-    Supone que 'likes_recomendaciones' tiene una FK 'recomendacion_id' a 'recomendaciones'.
+    Solo se consultan los ids en 'likes_recomendaciones'; los detalles salen del
+    catálogo de recomendaciones en memoria (sin JOIN por petición).
     """
     try:
-        # Consulta a Supabase:
-        # 1. Selecciona la columna 'recomendaciones' (el nombre de la tabla relacionada).
-        # 2. El asterisco '*' indica que traiga todos los campos de la recomendación.
-        # 3. Filtra por el 'user_id'.
-        response = supabase.table("likes_recomendaciones")\
-            .select("recomendaciones(*)")\
-            .eq("user_id", user_id)\
-            .execute()
-
-        # Los datos vienen anidados en un objeto { "recomendaciones": {...} }
-        if response.data:
-            # Extraer solo el objeto de la recomendación
-            favoritas = [item["recomendaciones"] for item in response.data if item.get("recomendaciones")]
+        rows = await likes_repo.list_by_user(user_id)
+
+        if rows:
+            favoritas = await RecommendationCatalog.get_by_ids([item["recomendacion_id"] for item in rows])
             return {
                 "message": "Favoritos recuperados con éxito",
                 "data": favoritas
@@ -625,11 +1058,7 @@ async def get_students_with_alerts(limit_notes: int = 5, psychologist_id: str |
     """
     try:
         # 1) Listar estudiantes
-        q = supabase.table("usuarios").select("id, nombre, apellido, codigo_alumno").eq("rol", "estudiante")
-        if psychologist_id:
-            q = q.eq("psicologo_id", psychologist_id)
-        users_res = q.execute()
-        students = users_res.data or []
+        students = await usuarios_repo.list_students(psychologist_id)
 
         # 🔓 Desencriptar campos sensibles
         campos_sensibles_usuarios = ["nombre", "apellido"]
@@ -643,8 +1072,7 @@ async def get_students_with_alerts(limit_notes: int = 5, psychologist_id: str |
         # 2) Por simplicidad, consultar por estudiante (dataset pequeño). Optimizable con IN si es grande.
         for s in students:
             uid = s.get("id")
-            notas_res = supabase.table("notas").select("emocion, emocion_score, created_at").eq("usuario_id", uid).order("created_at", desc=True).limit(limit_notes).execute()
-            notes = notas_res.data or []
+            notes = await notas_repo.list_by_user(uid, "emocion, emocion_score, created_at", limit=limit_notes)
             risk = AlertService.compute_sadness_risk(notes)
             alert_message = AlertService.get_alert_message(risk)
 
@@ -672,15 +1100,14 @@ async def get_students_with_alerts(limit_notes: int = 5, psychologist_id: str |
 # - EmailService.send_alert_email()
 # - EmailService.build_alert_email()
 
-def trigger_alert_if_keywords(user_id: str, note_text: str) -> None:
+async def trigger_alert_if_keywords(user_id: str, note_text: str) -> None:
     """Trigger alert if keywords are detected - using services"""
     try:
         if not AlertService.contains_severe_keywords(note_text):
             return
 
         # 1) Buscar estudiante para obtener psicologo_id
-        u_res = supabase.table('usuarios').select('id, nombre, apellido, psicologo_id').eq('id', user_id).single().execute()
-        student = u_res.data or {}
+        student = await usuarios_repo.get_by_id(user_id, 'id, nombre, apellido, psicologo_id') or {}
         
         # 🔓 Desencriptar campos sensibles del estudiante
         if student:
@@ -692,12 +1119,12 @@ def trigger_alert_if_keywords(user_id: str, note_text: str) -> None:
         # 2) Obtener correo del psicólogo
         to_email = None
         if psicologo_id:
-            p_res = supabase.table('usuarios').select('correo_institucional, nombre, apellido').eq('id', psicologo_id).single().execute()
-            if p_res and getattr(p_res, 'data', None):
+            psicologo = await usuarios_repo.get_by_id(psicologo_id, 'correo_institucional, nombre, apellido')
+            if psicologo:
                 # 🔓 Desencriptar campos sensibles del psicólogo
                 campos_sensibles_usuarios = ["nombre", "apellido"]
-                p_res.data = encryption_service.decrypt_dict_fields(p_res.data, campos_sensibles_usuarios)
-                to_email = p_res.data.get('correo_institucional')
+                psicologo = encryption_service.decrypt_dict_fields(psicologo, campos_sensibles_usuarios)
+                to_email = psicologo.get('correo_institucional')
 
         # Fallback a correo de alerta general
         if not to_email:
@@ -709,7 +1136,7 @@ def trigger_alert_if_keywords(user_id: str, note_text: str) -> None:
 
         # Usar servicios para construir y enviar email
         subject, body = EmailService.build_alert_email(student, note_text)
-        EmailService.send_alert_email(to_email, subject, body)
+        await run_in_threadpool(EmailService.send_alert_email, to_email, subject, body)
         print(f"Alerta enviada a {to_email} por palabras severas.")
     except Exception as e:
         print(f"Error al procesar/enviar alerta: {e}")
@@ -733,8 +1160,7 @@ async def face_register(payload: FaceRegisterRequest):
     """Registra la foto y encoding del rostro del usuario (post-onboarding)."""
     try:
         # Verificar existencia usuario
-        u_res = supabase.table("usuarios").select("id").eq("id", payload.user_id).single().execute()
-        if not u_res.data:
+        if not await usuarios_repo.get_by_id(payload.user_id, "id"):
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
 
         img = FaceRecognitionService.decode_base64_image(payload.image_base64)
@@ -747,10 +1173,11 @@ async def face_register(payload: FaceRegisterRequest):
             filename = f"faces/{payload.user_id}.jpg"  # carpeta lógica para organización
             img_bytes = FaceRecognitionService.encode_image_to_base64(img)
             # 🟢 ESTO ESTÁ BIEN (el cambio: pon comillas al true)
-            upload_res = supabase.storage.from_("profile_photos").upload(
+            upload_res = await run_in_threadpool(
+                supabase.storage.from_("profile_photos").upload,
                 filename,
                 img_bytes,
-                {"content-type": "image/jpeg", "upsert": "true"} 
+                {"content-type": "image/jpeg", "upsert": "true"}
             )
             if getattr(upload_res, 'error', None):
                 raise HTTPException(status_code=500, detail=f"Fallo al subir imagen: {upload_res.error}")
@@ -784,11 +1211,10 @@ async def face_register(payload: FaceRegisterRequest):
                 else:
                     print(f"[FACE_REGISTER] Advertencia: No se pudo encriptar foto_perfil_url")
             
-            supabase.table("usuarios").update(update_fields).eq("id", payload.user_id).execute()
+            updated = await usuarios_repo.update_by_id(payload.user_id, update_fields)
             
             # Verificar que se guardó correctamente (opcional, para debugging)
-            verify_res = supabase.table("usuarios").select("face_encoding").eq("id", payload.user_id).single().execute()
-            if verify_res.data and verify_res.data.get("face_encoding"):
+            if updated and updated[0].get("face_encoding"):
                 print(f"[FACE_REGISTER] Face encoding guardado correctamente (encriptado)")
             
             return {"message": "Rostro registrado con éxito", "foto_perfil_url": foto_url, "encoding_len": len(encoding)}
@@ -806,8 +1232,7 @@ async def face_register(payload: FaceRegisterRequest):
 async def face_verify(payload: FaceVerifyRequest):
     """Verifica si el frame enviado coincide con el rostro almacenado."""
     try:
-        u_res = supabase.table("usuarios").select("face_encoding").eq("id", payload.user_id).single().execute()
-        data = u_res.data
+        data = await usuarios_repo.get_by_id(payload.user_id, "face_encoding")
         if not data or not data.get("face_encoding"):
             raise HTTPException(status_code=404, detail="Usuario sin rostro registrado")
         
@@ -880,8 +1305,7 @@ async def upload_drawing(payload: dict):
             raise HTTPException(status_code=400, detail="user_id es requerido")
         
         # Verificar que el usuario existe
-        u_res = supabase.table("usuarios").select("id").eq("id", user_id).single().execute()
-        if not u_res.data:
+        if not await usuarios_repo.get_by_id(user_id, "id"):
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         
         image_base64 = payload.get("image_base64")
@@ -906,7 +1330,8 @@ async def upload_drawing(payload: dict):
         filename = f"{user_id}/{drawing_id}.{file_extension}"
         
         # Subir a Supabase Storage
-        upload_res = supabase.storage.from_("student_drawings").upload(
+        upload_res = await run_in_threadpool(
+            supabase.storage.from_("student_drawings").upload,
             filename,
             image_bytes,
             {"content-type": f"image/{file_extension}", "upsert": "false"}
@@ -930,19 +1355,19 @@ async def upload_drawing(payload: dict):
             "tipo_dibujo": payload.get("tipo_dibujo", "uploaded")
         }
         
-        insert_res = supabase.table("drawings").insert(drawing_record).execute()
+        inserted = await drawings_repo.insert(drawing_record)
         
         # 🔓 Desencriptar datos en la respuesta
-        if insert_res.data and len(insert_res.data) > 0:
+        if inserted:
             campos_sensibles_drawings = ["titulo", "descripcion", "imagen_url"]
             # Modificar directamente los campos en lugar de crear nueva referencia
             for field in campos_sensibles_drawings:
-                if field in insert_res.data[0] and insert_res.data[0][field] is not None:
-                    insert_res.data[0][field] = encryption_service.decrypt(insert_res.data[0][field])
+                if field in inserted[0] and inserted[0][field] is not None:
+                    inserted[0][field] = encryption_service.decrypt(inserted[0][field])
         
         return {
             "message": "Dibujo subido con éxito",
-            "data": insert_res.data[0] if insert_res.data else drawing_record
+            "data": inserted[0] if inserted else drawing_record
         }
     except HTTPException:
         raise
@@ -952,66 +1377,77 @@ async def upload_drawing(payload: dict):
         raise HTTPException(status_code=500, detail=f"Error interno al subir dibujo: {e}")
 
 @app.get("/drawings/student/{user_id}")
-async def get_student_drawings(user_id: str):
-    """Obtiene todos los dibujos de un estudiante."""
+async def get_student_drawings(
+    user_id: str,
+    cursor: str | None = _CURSOR_QUERY,
+    page_size: int | None = _PAGE_SIZE_QUERY,
+    fields: str | None = _FIELDS_QUERY
+):
+    """
+    Obtiene los dibujos de un estudiante (más recientes primero), paginados si se envía cursor o page_size.
+    `fields` permite omitir `drawing_data` (trazos) en la galería.
+    """
+    limit = _page_size_or_400(cursor, page_size)
+    columnas = _columns_or_400(fields, DRAWINGS_FIELDS)
     try:
-        response = supabase.table("drawings")\
-            .select("*")\
-            .eq("usuario_id", user_id)\
-            .order("created_at", desc=True)\
-            .execute()
+        next_cursor = None
+        if limit is None:
+            drawings = await drawings_repo.list_by_user(user_id, columnas)
+        else:
+            drawings, next_cursor = await drawings_repo.page_by_user(user_id, limit, cursor, columnas)
         
         # 🔓 Desencriptar campos sensibles
         campos_sensibles_drawings = ["titulo", "descripcion", "imagen_url"]
-        if response.data:
-            response.data = [encryption_service.decrypt_dict_fields(item, campos_sensibles_drawings) for item in response.data]
+        drawings = [encryption_service.decrypt_dict_fields(item, campos_sensibles_drawings) for item in drawings]
         
         return {
             "message": "Dibujos recuperados con éxito",
-            "data": response.data or []
+            "data": drawings,
+            "next_cursor": next_cursor
         }
     except Exception as e:
         print(f"Error al recuperar dibujos: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno al buscar dibujos: {e}")
 
 @app.get("/drawings/psychologist/{psychologist_id}")
-async def get_psychologist_students_drawings(psychologist_id: str):
+async def get_psychologist_students_drawings(
+    psychologist_id: str,
+    cursor: str | None = _CURSOR_QUERY,
+    page_size: int | None = _PAGE_SIZE_QUERY,
+    fields: str | None = _FIELDS_QUERY
+):
     """
-    Obtiene todos los dibujos de los estudiantes asignados a un psicólogo.
-    Incluye información del estudiante.
+    Obtiene los dibujos de los estudiantes asignados a un psicólogo.
+    Incluye información del estudiante. Paginado si se envía cursor o page_size;
+    `fields` limita las columnas del dibujo.
     """
+    limit = _page_size_or_400(cursor, page_size)
+    columnas = _columns_or_400(fields, DRAWINGS_FIELDS) + ", usuarios:usuario_id(id, nombre, apellido, codigo_alumno)"
     try:
         # Primero obtener los estudiantes del psicólogo
-        students_res = supabase.table("usuarios")\
-            .select("id, nombre, apellido, codigo_alumno")\
-            .eq("rol", "estudiante")\
-            .eq("psicologo_id", psychologist_id)\
-            .execute()
-        
-        # 🔓 Desencriptar campos sensibles de estudiantes
+        students = await usuarios_repo.list_students(psychologist_id, "id")
         campos_sensibles_usuarios = ["nombre", "apellido"]
-        if students_res.data:
-            students_res.data = [encryption_service.decrypt_dict_fields(item, campos_sensibles_usuarios) for item in students_res.data]
         
-        student_ids = [s["id"] for s in (students_res.data or [])]
+        student_ids = [s["id"] for s in students]
         
         if not student_ids:
             return {
                 "message": "No se encontraron estudiantes asignados",
-                "data": []
+                "data": [],
+                "next_cursor": None
             }
         
         # Obtener dibujos de esos estudiantes
-        drawings_res = supabase.table("drawings")\
-            .select("*, usuarios:usuario_id(id, nombre, apellido, codigo_alumno)")\
-            .in_("usuario_id", student_ids)\
-            .order("created_at", desc=True)\
-            .execute()
+        next_cursor = None
+        if limit is None:
+            drawings = await drawings_repo.list_by_users(student_ids, columnas)
+        else:
+            drawings, next_cursor = await drawings_repo.page_by_users(student_ids, limit, cursor, columnas)
         
         # 🔓 Desencriptar campos sensibles de dibujos y usuarios relacionados
         campos_sensibles_drawings = ["titulo", "descripcion", "imagen_url"]
-        if drawings_res.data:
-            for item in drawings_res.data:
+        if drawings:
+            for item in drawings:
                 # Desencriptar campos del dibujo (modificar directamente)
                 for field in campos_sensibles_drawings:
                     if field in item and item[field] is not None:
@@ -1024,7 +1460,8 @@ async def get_psychologist_students_drawings(psychologist_id: str):
         
         return {
             "message": "Dibujos recuperados con éxito",
-            "data": drawings_res.data or []
+            "data": drawings,
+            "next_cursor": next_cursor
         }
     except Exception as e:
         print(f"Error al recuperar dibujos del psicólogo: {e}")
@@ -1032,24 +1469,18 @@ async def get_psychologist_students_drawings(psychologist_id: str):
         raise HTTPException(status_code=500, detail=f"Error interno al buscar dibujos: {e}")
 
 @app.post("/drawings/analyze/{drawing_id}")
-async def analyze_drawing(drawing_id: str):
+async def analyze_drawing(drawing_id: str, use_cache: bool = Query(True, description="False para regenerar los insights de IA")):
     """
     Analiza un dibujo existente y devuelve métricas, visualizaciones e insights de IA.
     Descarga la imagen desde Supabase Storage, la analiza y devuelve los resultados.
     """
     try:
         # Obtener el registro del dibujo
-        drawing_res = supabase.table("drawings")\
-            .select("id, imagen_url, usuario_id")\
-            .eq("id", drawing_id)\
-            .single()\
-            .execute()
+        drawing = await drawings_repo.get_by_id(drawing_id, "id, imagen_url, usuario_id")
         
-        if not drawing_res.data:
+        if not drawing:
             raise HTTPException(status_code=404, detail="Dibujo no encontrado")
         
-        drawing = drawing_res.data
-        
         # 🔓 Desencriptar imagen_url
         imagen_url = encryption_service.decrypt(drawing.get("imagen_url"))
         
@@ -1057,8 +1488,7 @@ async def analyze_drawing(drawing_id: str):
             raise HTTPException(status_code=400, detail="El dibujo no tiene URL de imagen")
         
         # Descargar la imagen desde la URL
-        import requests
-        img_response = requests.get(imagen_url, timeout=10)
+        img_response = await run_in_threadpool(requests.get, imagen_url, timeout=10)
         img_response.raise_for_status()
         
         # Convertir a base64 para el servicio de análisis
@@ -1066,7 +1496,10 @@ async def analyze_drawing(drawing_id: str):
         image_base64 = base64.b64encode(img_response.content).decode('utf-8')
         
         # Analizar el dibujo
-        analysis_result = DrawingAnalysisService.analyze_drawing(image_base64)
+        # En un hilo: el análisis es CPU y la llamada a Gemini puede esperar turno en el limitador
+        analysis_result = await run_in_threadpool(
+            DrawingAnalysisService.analyze_drawing, image_base64, use_cache=use_cache
+        )
         
         if "error" in analysis_result:
             raise HTTPException(status_code=500, detail=analysis_result["error"])
@@ -1094,26 +1527,36 @@ async def crear_cita(
     id_usuario: str = Query(..., description="ID del usuario que crea la cita")
 ):
     """Crea una nueva cita. Solo estudiantes pueden crear citas."""
-    return AppointmentsService.crear_cita(cita_data, id_usuario)
+    return await AppointmentsService.crear_cita(cita_data, id_usuario)
 
 
 @app.get("/citas/pendientes")
-async def obtener_citas_pendientes():
-    """Obtiene citas sin psicólogo asignado."""
-    citas = AppointmentsService.obtener_citas_pendientes()
+async def obtener_citas_pendientes(
+    cursor: str | None = _CURSOR_QUERY,
+    page_size: int | None = _PAGE_SIZE_QUERY
+):
+    """Obtiene citas sin psicólogo asignado (paginadas si se envía cursor o page_size)."""
+    limit = _page_size_or_400(cursor, page_size)
+    citas, next_cursor = await AppointmentsService.obtener_citas_pendientes(limit, cursor)
     return {
         "message": "Citas pendientes recuperadas con éxito",
-        "data": citas
+        "data": citas,
+        "next_cursor": next_cursor
     }
 
 
 @app.get("/citas/todas")
-async def obtener_todas_las_citas():
-    """Obtiene todas las citas del sistema."""
-    citas = AppointmentsService.obtener_todas_las_citas()
+async def obtener_todas_las_citas(
+    cursor: str | None = _CURSOR_QUERY,
+    page_size: int | None = _PAGE_SIZE_QUERY
+):
+    """Obtiene todas las citas del sistema (paginadas si se envía cursor o page_size)."""
+    limit = _page_size_or_400(cursor, page_size)
+    citas, next_cursor = await AppointmentsService.obtener_todas_las_citas(limit, cursor)
     return {
         "message": "Todas las citas recuperadas con éxito",
-        "data": citas
+        "data": citas,
+        "next_cursor": next_cursor
     }
 
 
@@ -1124,7 +1567,7 @@ async def obtener_citas_usuario(id_usuario: str):
     - Estudiante: citas creadas
     - Psicólogo: citas asignadas
     """
-    citas = AppointmentsService.obtener_citas_usuario(id_usuario)
+    citas = await AppointmentsService.obtener_citas_usuario(id_usuario)
     return {
         "message": "Citas del usuario recuperadas con éxito",
         "data": citas
@@ -1134,7 +1577,7 @@ async def obtener_citas_usuario(id_usuario: str):
 @app.get("/citas/{id_cita}", response_model=CitaResponse)
 async def obtener_cita_por_id(id_cita: int):
     """Obtiene una cita por ID."""
-    return AppointmentsService.obtener_cita_por_id(id_cita)
+    return await AppointmentsService.obtener_cita_por_id(id_cita)
 
 
 @app.put("/citas/{id_cita}/asignar-psicologo", response_model=CitaResponse)
@@ -1143,7 +1586,7 @@ async def asignar_psicologo(
     asignacion: CitaAsignarPsicologo
 ):
     """Asigna un psicólogo a una cita."""
-    return AppointmentsService.asignar_psicologo(id_cita, asignacion)
+    return await AppointmentsService.asignar_psicologo(id_cita, asignacion)
 
 
 @app.put("/citas/{id_cita}", response_model=CitaResponse)
@@ -1153,7 +1596,7 @@ async def actualizar_cita(
     id_usuario: str = Query(..., description="ID del usuario que actualiza")
 ):
     """Actualiza una cita. Solo el creador puede actualizar."""
-    return AppointmentsService.actualizar_cita(id_cita, cita_update, id_usuario)
+    return await AppointmentsService.actualizar_cita(id_cita, cita_update, id_usuario)
 
 
 @app.delete("/citas/{id_cita}")
@@ -1162,13 +1605,13 @@ async def eliminar_cita(
     id_usuario: str = Query(..., description="ID del usuario que elimina")
 ):
     """Elimina una cita. Solo el creador puede eliminar."""
-    return AppointmentsService.eliminar_cita(id_cita, id_usuario)
+    return await AppointmentsService.eliminar_cita(id_cita, id_usuario)
 
 
 @app.get("/citas/psicologos/disponibles")
 async def obtener_psicologos_disponibles():
     """Obtiene lista de psicólogos disponibles."""
-    psicologos = AppointmentsService.obtener_psicologos_disponibles()
+    psicologos = await AppointmentsService.obtener_psicologos_disponibles()
     return {
         "message": "Psicólogos disponibles recuperados con éxito",
         "data": psicologos
@@ -0,0 +1,89 @@
+"""
+Benchmark del renderizado de gráficos de análisis (VisualizationService)
+Mide renders por segundo con datos sintéticos, en un hilo y con un pool de hilos,
+para cada formato de salida.
+
+Ejecuta:
+    python benchmark_charts.py --renders 50 --workers 4 --formats png webp --dpi 100
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.visualization_service import VisualizationService
+
+SENTIMIENTOS = ["POS", "NEU", "NEG"]
+EMOCIONES = ["joy", "sadness", "anger", "fear", "surprise", "others"]
+PALABRAS = [
+    "examen", "estrés", "amigos", "familia", "tarea", "cansancio", "alegría", "clase",
+    "proyecto", "deporte", "música", "sueño", "profesor", "nervios", "logro", "tiempo",
+]
+
+
+def synthetic_notes(n: int, seed: int) -> pd.DataFrame:
+    """Notas analizadas sintéticas con la forma que produce TextAnalysisService"""
+    rng = random.Random(seed)
+    return pd.DataFrame({
+        "sentimiento": [rng.choice(SENTIMIENTOS) for _ in range(n)],
+        "emocion": [rng.choice(EMOCIONES) for _ in range(n)],
+        "tokens": [rng.sample(PALABRAS, rng.randint(3, 8)) for _ in range(n)],
+    })
+
+
+def run(renders: int, workers: int, image_format: str, dpi: int, notes: int, wordcloud: bool) -> dict:
+    frames = [synthetic_notes(notes, seed) for seed in range(renders)]
+    if not wordcloud:
+        frames = [df.drop(columns=["tokens"]) for df in frames]
+
+    def render(df: pd.DataFrame) -> int:
+        images = VisualizationService.create_visualizations(df, image_format=image_format, dpi=dpi)
+        return sum(len(v) for v in images.values())
+
+    # Calentamiento: crea las plantillas de figura del hilo principal
+    render(frames[0])
+
+    start = time.perf_counter()
+    if workers <= 1:
+        sizes = [render(df) for df in frames]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            sizes = list(pool.map(render, frames))
+    elapsed = time.perf_counter() - start
+    return {
+        "format": image_format,
+        "workers": workers,
+        "renders_per_second": renders / elapsed,
+        "ms_per_render": elapsed / renders * 1000,
+        "avg_base64_kb": sum(sizes) / len(sizes) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del renderizado de gráficos")
+    parser.add_argument("--renders", type=int, default=50, help="Conjuntos de gráficos por prueba")
+    parser.add_argument("--workers", type=int, default=4, help="Hilos para la prueba concurrente")
+    parser.add_argument("--formats", nargs="+", default=["png", "webp"], choices=["png", "webp"])
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--notes", type=int, default=60, help="Notas por estudiante sintético")
+    parser.add_argument("--no-wordcloud", action="store_true", help="Solo gráficos de barras")
+    args = parser.parse_args()
+
+    print(f"{'formato':<8} {'hilos':>5} {'renders/s':>10} {'ms/render':>10} {'KB base64':>10}")
+    for image_format in args.formats:
+        for workers in sorted({1, args.workers}):
+            r = run(args.renders, workers, image_format, args.dpi, args.notes, not args.no_wordcloud)
+            print(
+                f"{r['format']:<8} {r['workers']:>5} {r['renders_per_second']:>10.1f} "
+                f"{r['ms_per_render']:>10.1f} {r['avg_base64_kb']:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+Servidor local que imita la API REST de Gemini para pruebas de carga offline
+Implementa v1beta/models/{model}:generateContent y :streamGenerateContent (alt=sse)
+con latencia configurable, inyección de errores (403, 429, 5xx, timeouts) y
+respuestas predefinidas.
+
+Ejecuta:
+    python gemini_stub_server.py --port 8090 --latency-ms 800 --error-rate-429 0.05
+
+Y apunta el backend al stub en tu .env:
+    GEMINI_BASE_URL=http://127.0.0.1:8090
+    GEMINI_API_KEY=stub
+
+La configuración también se puede cambiar en caliente con POST /_stub/config.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import threading
+import zlib
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+DEFAULT_RESPONSES = [
+    "Gracias por compartir cómo te sientes. Lo que describes es importante y es valioso "
+    "que lo pongas en palabras. Date un momento para respirar y reconocer tu esfuerzo. "
+    "¡Cada paso cuenta!",
+    "El estudiante muestra avances en la identificación de sus emociones y en la "
+    "organización de su tiempo. Para la siguiente sesión se sugiere trabajar estrategias "
+    "concretas de afrontamiento ante la presión académica.",
+    "Parece que el estudiante ha tenido una semana exigente. Podrías preguntarle qué "
+    "actividades le ayudaron a sentirse mejor y reforzarlas.",
+]
+
+# Cuerpos de error con la misma forma que la API de Google
+ERROR_BODIES = {
+    403: ("PERMISSION_DENIED", "Method doesn't allow unregistered callers (stub)."),
+    404: ("NOT_FOUND", "models/{model} is not found for API version v1beta (stub)."),
+    429: ("RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota) (stub)."),
+    500: ("INTERNAL", "An internal error has occurred (stub)."),
+    503: ("UNAVAILABLE", "The model is overloaded. Please try again later (stub)."),
+}
+
+
+class StubConfig:
+    """Configuración mutable del stub (protegida por lock)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # Latencia: fixed | uniform | normal | lognormal
+        self.latency_distribution = os.getenv("STUB_LATENCY_DISTRIBUTION", "lognormal")
+        self.latency_ms = float(os.getenv("STUB_LATENCY_MS", "600"))
+        self.latency_jitter_ms = float(os.getenv("STUB_LATENCY_JITTER_MS", "200"))
+        self.chunk_delay_ms = float(os.getenv("STUB_CHUNK_DELAY_MS", "40"))
+        self.chunk_words = int(os.getenv("STUB_CHUNK_WORDS", "4"))
+        # Probabilidades de error (0.0 - 1.0)
+        self.error_rate_403 = float(os.getenv("STUB_ERROR_RATE_403", "0"))
+        self.error_rate_429 = float(os.getenv("STUB_ERROR_RATE_429", "0"))
+        self.error_rate_5xx = float(os.getenv("STUB_ERROR_RATE_5XX", "0"))
+        self.timeout_rate = float(os.getenv("STUB_TIMEOUT_RATE", "0"))
+        self.timeout_seconds = float(os.getenv("STUB_TIMEOUT_SECONDS", "30"))
+        # Modelos que responden 404 (simula modelos deshabilitados)
+        self.disabled_models: List[str] = [
+            m for m in os.getenv("STUB_DISABLED_MODELS", "").split(",") if m
+        ]
+        self.responses: List[str] = list(DEFAULT_RESPONSES)
+        responses_file = os.getenv("STUB_RESPONSES_FILE", "")
+        if responses_file:
+            self.load_responses(responses_file)
+
+    def load_responses(self, path: str) -> None:
+        """Carga respuestas predefinidas desde un JSON con una lista de strings"""
+        with open(path, encoding="utf-8") as f:
+            responses = json.load(f)
+        if not isinstance(responses, list) or not responses:
+            raise ValueError("El archivo de respuestas debe contener una lista no vacía de textos")
+        self.responses = [str(r) for r in responses]
+
+    def update(self, values: Dict) -> None:
+        with self.lock:
+            for key, value in values.items():
+                if key == "responses_file":
+                    self.load_responses(value)
+                elif hasattr(self, key) and key != "lock":
+                    setattr(self, key, value)
+
+    def as_dict(self) -> Dict:
+        with self.lock:
+            return {k: v for k, v in self.__dict__.items() if k != "lock"}
+
+    def sample_latency(self) -> float:
+        """Latencia simulada en segundos según la distribución configurada"""
+        mean = self.latency_ms
+        jitter = self.latency_jitter_ms
+        if self.latency_distribution == "fixed":
+            value = mean
+        elif self.latency_distribution == "uniform":
+            value = random.uniform(mean - jitter, mean + jitter)
+        elif self.latency_distribution == "normal":
+            value = random.gauss(mean, jitter)
+        else:
+            # lognormal: cola larga, parecida a la latencia real de un LLM
+            sigma = 0.5
+            value = random.lognormvariate(0, sigma) * mean / math.exp(sigma ** 2 / 2)
+        return max(0.0, value) / 1000.0
+
+
+config = StubConfig()
+stats: Dict[str, int] = {}
+app = FastAPI(title="Gemini stub (pruebas de carga)")
+
+
+def _count(key: str) -> None:
+    stats[key] = stats.get(key, 0) + 1
+
+
+def _error_response(status_code: int, model: str) -> JSONResponse:
+    status, message = ERROR_BODIES[status_code]
+    return JSONResponse(
+        status_code=status_code,
+        content={"error": {"code": status_code, "message": message.format(model=model), "status": status}},
+    )
+
+
+def _pick_error(model: str) -> Optional[int]:
+    """Decide si la petición debe fallar y con qué código"""
+    if model in config.disabled_models:
+        return 404
+    roll = random.random()
+    for status_code, rate in (
+        (403, config.error_rate_403),
+        (429, config.error_rate_429),
+        (random.choice((500, 503)), config.error_rate_5xx),
+    ):
+        if roll < rate:
+            return status_code
+        roll -= rate
+    return None
+
+
+def _candidate(text: str, finished: bool) -> Dict:
+    candidate = {"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}
+    if finished:
+        candidate["finishReason"] = "STOP"
+    return {"candidates": [candidate]}
+
+
+def _prompt_text(body: Dict) -> str:
+    try:
+        return " ".join(
+            part.get("text", "")
+            for content in body.get("contents", [])
+            for part in content.get("parts", [])
+        )
+    except (AttributeError, TypeError):
+        return ""
+
+
+def _canned_response(prompt: str) -> str:
+    # Misma respuesta para el mismo prompt (útil para probar cachés)
+    return config.responses[zlib.crc32(prompt.encode("utf-8")) % len(config.responses)]
+
+
+@app.post("/v1beta/models/{model_action}")
+async def generate(model_action: str, request: Request):
+    """generateContent y streamGenerateContent en una sola ruta (`modelo:acción`)"""
+    model, _, action = model_action.partition(":")
+    if action not in ("generateContent", "streamGenerateContent"):
+        return _error_response(404, model)
+    _count(f"{action}:{model}")
+
+    if not request.headers.get("x-goog-api-key"):
+        return JSONResponse(
+            status_code=401,
+            content={"error": {"code": 401, "message": "API key missing (stub).", "status": "UNAUTHENTICATED"}},
+        )
+
+    body = await request.json()
+    if random.random() < config.timeout_rate:
+        _count("timeout")
+        await asyncio.sleep(config.timeout_seconds)
+
+    await asyncio.sleep(config.sample_latency())
+
+    error_code = _pick_error(model)
+    if error_code:
+        _count(f"error_{error_code}")
+        return _error_response(error_code, model)
+
+    text = _canned_response(_prompt_text(body))
+    if action == "generateContent":
+        return _candidate(text, finished=True)
+
+    words = text.split(" ")
+    size = max(1, config.chunk_words)
+    chunks = [" ".join(words[i:i + size]) + " " for i in range(0, len(words), size)]
+
+    async def event_stream():
+        for i, chunk in enumerate(chunks):
+            if i:
+                await asyncio.sleep(config.chunk_delay_ms / 1000.0)
+            payload = _candidate(chunk, finished=i == len(chunks) - 1)
+            yield f"data: {json.dumps(payload, ensure_ascii=False)}\r\n\r\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
+@app.get("/_stub/config")
+async def get_config():
+    return config.as_dict()
+
+
+@app.post("/_stub/config")
+async def set_config(values: dict):
+    """Actualiza la configuración en caliente (mismos nombres que los atributos)"""
+    config.update(values)
+    return config.as_dict()
+
+
+@app.get("/_stub/stats")
+async def get_stats():
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub local de la API de Gemini")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms)
+    parser.add_argument("--latency-jitter-ms", type=float, default=config.latency_jitter_ms)
+    parser.add_argument(
+        "--latency-distribution",
+        choices=["fixed", "uniform", "normal", "lognormal"],
+        default=config.latency_distribution,
+    )
+    parser.add_argument("--error-rate-403", type=float, default=config.error_rate_403)
+    parser.add_argument("--error-rate-429", type=float, default=config.error_rate_429)
+    parser.add_argument("--error-rate-5xx", type=float, default=config.error_rate_5xx)
+    parser.add_argument("--timeout-rate", type=float, default=config.timeout_rate)
+    parser.add_argument("--disabled-models", default=",".join(config.disabled_models))
+    parser.add_argument("--responses-file", default="")
+    args = parser.parse_args()
+
+    config.latency_ms = args.latency_ms
+    config.latency_jitter_ms = args.latency_jitter_ms
+    config.latency_distribution = args.latency_distribution
+    config.error_rate_403 = args.error_rate_403
+    config.error_rate_429 = args.error_rate_429
+    config.error_rate_5xx = args.error_rate_5xx
+    config.timeout_rate = args.timeout_rate
+    config.disabled_models = [m for m in args.disabled_models.split(",") if m]
+    if args.responses_file:
+        config.load_responses(args.responses_file)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
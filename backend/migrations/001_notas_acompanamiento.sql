@@ -0,0 +1,3 @@
+-- Acompañamiento de Gemini generado en segundo plano (AccompanimentService)
+-- Se guarda encriptado junto a la nota para generarlo una sola vez.
+ALTER TABLE public.notas ADD COLUMN IF NOT EXISTS acompanamiento text;
@@ -0,0 +1,50 @@
+-- Conteo de likes por recomendación mantenido por la base de datos
+-- (lo lee GET /likes/{user_id}/resumen en la misma consulta del lote; sin contadores en memoria)
+
+-- 1. Un like por usuario y recomendación (se eliminan duplicados previos)
+DELETE FROM public.likes_recomendaciones a
+USING public.likes_recomendaciones b
+WHERE a.ctid > b.ctid
+  AND a.user_id = b.user_id
+  AND a.recomendacion_id = b.recomendacion_id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS likes_recomendaciones_user_item_idx
+    ON public.likes_recomendaciones (user_id, recomendacion_id);
+
+-- 2. Columna agregada y carga inicial
+ALTER TABLE public.recomendaciones ADD COLUMN IF NOT EXISTS likes_count integer NOT NULL DEFAULT 0;
+
+UPDATE public.recomendaciones r
+SET likes_count = COALESCE(l.total, 0)
+FROM (
+    SELECT recomendacion_id, count(*) AS total
+    FROM public.likes_recomendaciones
+    GROUP BY recomendacion_id
+) l
+WHERE l.recomendacion_id = r.id;
+
+-- 3. Trigger: cada like / unlike ajusta el conteo en la misma transacción
+CREATE OR REPLACE FUNCTION public.recomendaciones_likes_count_sync()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE public.recomendaciones
+        SET likes_count = likes_count + 1
+        WHERE id = NEW.recomendacion_id;
+        RETURN NEW;
+    ELSIF TG_OP = 'DELETE' THEN
+        UPDATE public.recomendaciones
+        SET likes_count = GREATEST(likes_count - 1, 0)
+        WHERE id = OLD.recomendacion_id;
+        RETURN OLD;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS likes_recomendaciones_count_trg ON public.likes_recomendaciones;
+CREATE TRIGGER likes_recomendaciones_count_trg
+AFTER INSERT OR DELETE ON public.likes_recomendaciones
+FOR EACH ROW EXECUTE FUNCTION public.recomendaciones_likes_count_sync();
@@ -0,0 +1,10 @@
+"""
+Pytest setup: make the `app` package importable from any working directory
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The services encrypt cached data at import time; tests never touch real data
+os.environ.setdefault("ENCRYPTION_KEY", "clave-de-pruebas")
@@ -0,0 +1,84 @@
+"""
+Accompaniment jobs of notes whose job is not tracked by this worker
+A lost job must not leave clients waiting on "pending" forever
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.services import accompaniment_service
+from app.services.accompaniment_service import (
+    STATUS_DONE,
+    STATUS_PENDING,
+    AccompanimentService,
+)
+from app.services.encryption_service import encryption_service
+
+
+class _FakeNotes:
+    """notas table with a single note and no stored accompaniment"""
+
+    def __init__(self, created_at: datetime):
+        self.row = {
+            "id": "n1",
+            "nota": encryption_service.encrypt("Hoy me fue bien en el examen"),
+            "acompanamiento": None,
+            "created_at": created_at.isoformat(),
+        }
+        self.writes = 0
+
+    async def get_by_id(self, note_id, columns="*"):
+        return dict(self.row) if note_id == self.row["id"] else None
+
+    async def set_accompaniment_if_missing(self, note_id, value):
+        if self.row["acompanamiento"] is not None:
+            return []
+        self.writes += 1
+        self.row["acompanamiento"] = value
+        return [dict(self.row)]
+
+
+@pytest.fixture(autouse=True)
+def _untracked(monkeypatch):
+    monkeypatch.setattr(AccompanimentService, "_jobs", accompaniment_service.OrderedDict())
+    generated = []
+
+    async def generate(text):
+        generated.append(text)
+        return "Qué bueno leer esto"
+
+    monkeypatch.setattr(accompaniment_service.GeminiService, "generate_accompaniment_async", generate)
+    return generated
+
+
+def _use_notes(monkeypatch, age_seconds: float) -> _FakeNotes:
+    notes = _FakeNotes(datetime.now(timezone.utc) - timedelta(seconds=age_seconds))
+    monkeypatch.setattr(accompaniment_service, "notas_repo", notes)
+    return notes
+
+
+def test_lost_job_is_restarted_once(monkeypatch, _untracked):
+    notes = _use_notes(monkeypatch, age_seconds=600)
+
+    async def scenario():
+        first = await AccompanimentService.get_status("n1")
+        second = await AccompanimentService.get_status("n1")
+        final = await AccompanimentService.wait_for("n1", timeout=1)
+        return first, second, final
+
+    first, second, final = asyncio.run(scenario())
+    assert first["status"] == STATUS_PENDING and second["status"] == STATUS_PENDING
+    assert final["status"] == STATUS_DONE
+    assert final["accompaniment"] == "Qué bueno leer esto"
+    assert _untracked == ["Hoy me fue bien en el examen"]
+    assert notes.writes == 1
+
+
+def test_recent_untracked_note_is_left_to_its_worker(monkeypatch, _untracked):
+    _use_notes(monkeypatch, age_seconds=5)
+
+    status = asyncio.run(AccompanimentService.get_status("n1"))
+    assert status["status"] == STATUS_PENDING
+    assert "n1" not in AccompanimentService._jobs
+    assert _untracked == []
@@ -0,0 +1,57 @@
+"""
+Cohort export job state shared through EXPORT_DIR
+Status and downloads must work from a worker that did not run the job
+"""
+import asyncio
+import os
+import time
+
+import pytest
+
+from app.config.settings import settings
+from app.services import cohort_export_service
+from app.services.cohort_export_service import STATUS_DONE, CohortExportService
+
+
+@pytest.fixture(autouse=True)
+def _export_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "EXPORT_DIR", str(tmp_path))
+    monkeypatch.setattr(CohortExportService, "_running", {})
+    monkeypatch.setattr(CohortExportService, "_last_cleanup", 0.0)
+
+    async def no_students(psychologist_id, columns):
+        return []
+
+    monkeypatch.setattr(cohort_export_service.usuarios_repo, "list_students", no_students)
+
+
+def _finished_job() -> str:
+    job_id = CohortExportService.create_job("psico-1", "parquet")
+    asyncio.run(CohortExportService.run_job(job_id))
+    return job_id
+
+
+def test_other_worker_reads_status_and_files():
+    job_id = _finished_job()
+    # Another worker: nothing about the job in memory
+    assert CohortExportService._running == {}
+
+    status = CohortExportService.get_status(job_id)
+    assert status["status"] == STATUS_DONE
+    path, filename = CohortExportService.file_for(job_id, "notas")
+    assert os.path.exists(path) and filename.endswith(".parquet")
+
+
+def test_status_request_deletes_expired_jobs(monkeypatch):
+    job_id = _finished_job()
+    monkeypatch.setattr(settings, "EXPORT_TTL_SECONDS", 10)
+    later = time.time() + 60
+    monkeypatch.setattr(cohort_export_service.time, "time", lambda: later)
+
+    assert CohortExportService.get_status(job_id) is None
+    assert not os.path.exists(os.path.join(settings.EXPORT_DIR, job_id))
+
+
+def test_unknown_or_malformed_job_ids_are_not_found():
+    assert CohortExportService.get_status("../../etc") is None
+    assert CohortExportService.get_status("0" * 32) is None
@@ -0,0 +1,33 @@
+"""
+Background rebuild of the collaborative filtering neighbour table
+All likes must be read, page by page, whatever PostgREST's max-rows
+"""
+import asyncio
+
+from app.services import collaborative_recommender
+from app.services.collaborative_recommender import CollaborativeRecommender
+
+
+def test_rebuild_reads_every_page_of_likes(monkeypatch):
+    monkeypatch.setattr(collaborative_recommender, "_LIKES_PAGE_SIZE", 2)
+    likes = [
+        {"user_id": "u1", "recomendacion_id": "a"},
+        {"user_id": "u1", "recomendacion_id": "b"},
+        {"user_id": "u2", "recomendacion_id": "a"},
+        {"user_id": "u2", "recomendacion_id": "b"},
+        {"user_id": "u3", "recomendacion_id": "c"},
+    ]
+    requests = []
+
+    async def page_all(page_size, cursor=None, columns="user_id, recomendacion_id"):
+        start = int(cursor or 0)
+        requests.append(start)
+        end = start + page_size
+        return likes[start:end], (str(end) if end < len(likes) else None)
+
+    monkeypatch.setattr(collaborative_recommender.likes_repo, "page_all", page_all)
+    asyncio.run(CollaborativeRecommender.rebuild())
+
+    assert requests == [0, 2, 4]
+    assert CollaborativeRecommender._likes == len(likes)
+    assert CollaborativeRecommender._neighbors["a"][0][0] == "b"
@@ -0,0 +1,142 @@
+"""
+Gmail API send path over the local transport
+The cached client must build credentials once and refresh the token only when expired
+"""
+import base64
+import email
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.config.settings import settings
+from app.services import email_service
+from app.services.email_service import EmailService, GmailClientCache, LocalGmailTransport
+
+SERVICE_ACCOUNT = json.dumps({"type": "service_account", "client_email": "bot@example.iam.gserviceaccount.com"})
+
+
+class _FakeCredentials:
+    def __init__(self):
+        self.valid = False
+        self.refreshes = 0
+
+    def with_subject(self, subject):
+        return self
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.valid = True
+
+
+class _FakeServiceAccount:
+    """google.oauth2.service_account: counts credential builds"""
+
+    def __init__(self):
+        self.built = []
+
+    @property
+    def Credentials(self):
+        return self
+
+    def from_service_account_info(self, info, scopes):
+        self.built.append(_FakeCredentials())
+        return self.built[-1]
+
+
+class _SendRequest:
+    """googleapiclient HttpRequest for users.messages.send"""
+
+    def __init__(self, body):
+        self.body = body
+
+    def execute(self, http):
+        response, content = http.request(
+            "https://gmail.googleapis.com/gmail/v1/users/me/messages/send?alt=json",
+            method="POST",
+            body=json.dumps(self.body),
+            headers={"content-type": "application/json"},
+        )
+        assert response.status == 200
+        return json.loads(content)
+
+
+class _FakeService:
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def send(self, userId, body):
+        return _SendRequest(body)
+
+
+class _AuthorizedHttp:
+    """google_auth_httplib2.AuthorizedHttp: forwards to the wrapped connection"""
+
+    def __init__(self, credentials, http):
+        self.credentials = credentials
+        self.http = http
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        return self.http.request(uri, method, body=body, headers=headers, **kwargs)
+
+
+@pytest.fixture
+def gmail(monkeypatch):
+    accounts = _FakeServiceAccount()
+    builds = []
+
+    def build(name, version, credentials, cache_discovery):
+        builds.append(credentials)
+        return _FakeService()
+
+    monkeypatch.setattr(email_service, "GMAIL_API_AVAILABLE", True)
+    monkeypatch.setattr(email_service, "service_account", accounts)
+    monkeypatch.setattr(email_service, "build", build)
+    monkeypatch.setattr(email_service, "GoogleAuthRequest", lambda: None)
+    monkeypatch.setattr(email_service, "google_auth_httplib2", type("m", (), {"AuthorizedHttp": _AuthorizedHttp}))
+    monkeypatch.setattr(settings, "GMAIL_TRANSPORT", "local")
+    monkeypatch.setattr(settings, "GMAIL_LOCAL_LATENCY_MS", 0)
+    monkeypatch.setattr(settings, "GMAIL_SERVICE_ACCOUNT_JSON", SERVICE_ACCOUNT)
+    monkeypatch.setattr(settings, "GMAIL_DELEGATED_USER", "alertas@example.com")
+    GmailClientCache.reset()
+    LocalGmailTransport.clear()
+    yield accounts, builds
+    GmailClientCache.reset()
+    LocalGmailTransport.clear()
+
+
+def _send(i: int) -> None:
+    EmailService.send_via_gmail_api("alertas@example.com", f"psico{i}@example.com", "Alerta", f"Mensaje {i}")
+
+
+def test_concurrent_sends_share_one_client(gmail):
+    accounts, builds = gmail
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(_send, range(20)))
+
+    assert len(accounts.built) == 1
+    assert len(builds) == 1
+    assert accounts.built[0].refreshes == 1
+
+    sent = LocalGmailTransport.sent_messages()
+    assert len(sent) == 20
+    recipients = {
+        email.message_from_bytes(base64.urlsafe_b64decode(m["raw"]))["To"] for m in sent
+    }
+    assert recipients == {f"psico{i}@example.com" for i in range(20)}
+
+
+def test_token_is_refreshed_only_when_expired(gmail):
+    accounts, _ = gmail
+    _send(1)
+    _send(2)
+    credentials = accounts.built[0]
+    assert credentials.refreshes == 1
+
+    credentials.valid = False
+    _send(3)
+    assert credentials.refreshes == 2
+    assert len(LocalGmailTransport.sent_messages()) == 3
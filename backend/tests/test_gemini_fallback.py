@@ -0,0 +1,203 @@
+"""
+Fallback loop of GeminiService against a mocked Gemini API
+Half-open circuit slots must be released however a call ends (cancellation, client disconnect)
+"""
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from app.config.settings import settings
+from app.services.gemini_cache import GeminiResponseCache
+from app.services.gemini_client import GeminiHttpClient
+from app.services.gemini_health import ModelHealthRegistry
+from app.services.gemini_service import GeminiService
+
+PRIMARY = "gemini-2.0-flash"
+FALLBACK = "gemini-1.5-flash"
+
+
+def _sse(*texts: str) -> bytes:
+    return "".join(
+        f"data: {json.dumps({'candidates': [{'content': {'parts': [{'text': t}]}}]})}\n\n"
+        for t in texts
+    ).encode()
+
+
+def _ok_body(text: str) -> dict:
+    return {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+
+
+def _error_body(status_code: int, status: str, message: str, reason: str = None) -> dict:
+    error = {"code": status_code, "message": message, "status": status}
+    if reason:
+        error["details"] = [{"@type": "type.googleapis.com/google.rpc.ErrorInfo", "reason": reason}]
+    return {"error": error}
+
+
+def _half_open(model: str) -> None:
+    """Put a model's circuit in the half-open state (reset period elapsed)"""
+    ModelHealthRegistry.reset()
+    with ModelHealthRegistry._lock:
+        state = ModelHealthRegistry._state(model)
+        state.consecutive_failures = 3
+        state.circuit_open_until = time.monotonic() - 1
+
+
+def _in_flight(model: str) -> bool:
+    return ModelHealthRegistry._state(model).half_open_in_flight
+
+
+@pytest.fixture(autouse=True)
+def _isolated(monkeypatch):
+    monkeypatch.setenv("GEMINI_MODEL", PRIMARY)
+    ModelHealthRegistry.reset()
+    yield
+    ModelHealthRegistry.reset()
+    GeminiHttpClient._async_client = None
+
+
+def _use_transport(handler) -> None:
+    GeminiHttpClient._async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_stream_closed_by_client_releases_half_open_slot():
+    _half_open(PRIMARY)
+    _use_transport(lambda request: httpx.Response(200, content=_sse("Hola", " mundo")))
+
+    async def scenario():
+        stream = GeminiService._stream_with_fallback_async({}, "key", "TEST", "invalid")
+        assert await stream.__anext__() == "Hola"
+        assert _in_flight(PRIMARY)
+        # SSE client disconnects after the first chunk
+        await stream.aclose()
+
+    asyncio.run(scenario())
+    assert not _in_flight(PRIMARY)
+    # The model was answering: its circuit is closed again
+    assert ModelHealthRegistry.snapshot()[PRIMARY]["circuit"] == "closed"
+
+
+def test_cancelled_stream_releases_half_open_slot():
+    _half_open(PRIMARY)
+
+    async def slow(request):
+        await asyncio.sleep(10)
+        return httpx.Response(200, content=_sse("tarde"))
+
+    _use_transport(slow)
+
+    async def consume():
+        return [chunk async for chunk in GeminiService._stream_with_fallback_async({}, "key", "TEST", "invalid")]
+
+    async def scenario():
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        assert _in_flight(PRIMARY)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert not _in_flight(PRIMARY)
+    # The next call gets the trial slot again instead of skipping the model
+    assert ModelHealthRegistry.acquire(PRIMARY) is None
+
+
+def test_cancelled_call_releases_half_open_slot():
+    _half_open(PRIMARY)
+
+    async def slow(request):
+        await asyncio.sleep(10)
+        return httpx.Response(200, json=_ok_body("tarde"))
+
+    _use_transport(slow)
+
+    async def scenario():
+        task = asyncio.create_task(
+            GeminiService._generate_with_fallback_async({}, "key", "TEST", "invalid")
+        )
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    assert not _in_flight(PRIMARY)
+
+
+def test_fallback_models_are_not_acquired_when_primary_answers():
+    _half_open(FALLBACK)
+    _use_transport(lambda request: httpx.Response(200, json=_ok_body("respuesta")))
+
+    result = asyncio.run(GeminiService._generate_with_fallback_async({}, "key", "TEST", "invalid"))
+    assert result == "respuesta"
+    assert not _in_flight(FALLBACK)
+
+
+def test_permission_denied_for_disabled_model_falls_back():
+    def handler(request):
+        if PRIMARY in request.url.path:
+            return httpx.Response(403, json=_error_body(403, "PERMISSION_DENIED", "Method doesn't allow unregistered callers"))
+        return httpx.Response(200, json=_ok_body("desde el respaldo"))
+
+    _use_transport(handler)
+    result = asyncio.run(GeminiService._generate_with_fallback_async({}, "key", "TEST", "invalid"))
+    assert result == "desde el respaldo"
+    assert ModelHealthRegistry.snapshot()[PRIMARY]["cooldown_reason"] == "http_403"
+
+
+def test_invalid_api_key_stops_the_chain():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(400, json=_error_body(400, "INVALID_ARGUMENT", "API key not valid.", "API_KEY_INVALID"))
+
+    _use_transport(handler)
+    result = asyncio.run(GeminiService._generate_with_fallback_async({}, "key", "TEST", "invalid"))
+    assert result == "invalid"
+    assert len(calls) == 1
+
+
+def test_fallback_insight_is_cached_under_the_model_that_answered(monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_API_KEY", "key")
+    monkeypatch.setattr(settings, "GEMINI_CACHE_DB_PATH", "")
+    GeminiResponseCache.clear()
+
+    def handler(request):
+        if PRIMARY in request.url.path:
+            return httpx.Response(404, json=_error_body(404, "NOT_FOUND", "model not found"))
+        return httpx.Response(200, json=_ok_body("insight del respaldo"))
+
+    _use_transport(handler)
+    texts = ["Aprendí a organizar mi tiempo"]
+    result = asyncio.run(GeminiService.generate_insight_async(texts))
+    assert result == "insight del respaldo"
+    assert GeminiResponseCache.get(GeminiService._insight_cache_key(texts), "insight") is None
+    assert GeminiResponseCache.get(GeminiService._insight_cache_key(texts, FALLBACK), "insight") == result
+    GeminiResponseCache.clear()
+
+
+def test_fallback_insight_is_served_from_cache_on_repeat(monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_API_KEY", "key")
+    monkeypatch.setattr(settings, "GEMINI_CACHE_DB_PATH", "")
+    GeminiResponseCache.clear()
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        if PRIMARY in request.url.path:
+            return httpx.Response(429, json=_error_body(429, "RESOURCE_EXHAUSTED", "quota exceeded"))
+        return httpx.Response(200, json=_ok_body("insight del respaldo"))
+
+    _use_transport(handler)
+    texts = ["Hoy participé en clase"]
+    first = asyncio.run(GeminiService.generate_insight_async(texts))
+    calls.clear()
+
+    assert asyncio.run(GeminiService.generate_insight_async(texts)) == first
+    assert calls == []
+    GeminiResponseCache.clear()
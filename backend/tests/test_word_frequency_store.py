@@ -0,0 +1,31 @@
+"""
+Incremental word frequencies of WordFrequencyStore
+Counters already handed out must not change when a note is added
+"""
+from app.services.word_frequency_store import WordFrequencyStore
+
+ROWS = [
+    {"tokens": ["escuela", "amigos"], "created_at": "2026-01-01T10:00:00"},
+    {"tokens": ["amigos"], "created_at": "2026-01-02T10:00:00"},
+]
+
+
+def test_add_note_does_not_mutate_counter_in_use():
+    user = "copy-on-write"
+    counter = WordFrequencyStore.frequencies(user, ROWS)
+    before = dict(counter)
+
+    WordFrequencyStore.add_note(user, ["amigos", "tarea"], "2026-01-03T10:00:00")
+
+    assert dict(counter) == before
+    rows = ROWS + [{"created_at": "2026-01-03T10:00:00"}]
+    updated = WordFrequencyStore.lookup(user, rows)
+    assert updated["amigos"] == 3 and updated["tarea"] == 1
+
+
+def test_lookup_misses_when_notes_changed_without_reading_tokens():
+    user = "lookup"
+    WordFrequencyStore.frequencies(user, ROWS)
+
+    assert WordFrequencyStore.lookup(user, [{"created_at": r["created_at"]} for r in ROWS]) is not None
+    assert WordFrequencyStore.lookup(user, [{"created_at": ROWS[0]["created_at"]}]) is None
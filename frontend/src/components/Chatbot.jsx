@@ -13,7 +13,8 @@ export default function Chatbot({ context }) {
         setLoading(true);
         setMessages([...messages, { role: "user", content: input }]);
         try {
-            const res = await fetch("http://127.0.0.1:8000/attendance-chatbot", {
+            // Respuesta por streaming (SSE): se muestra el texto a medida que llega
+            const res = await fetch("http://127.0.0.1:8000/attendance-chatbot/stream", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify({
@@ -21,8 +22,32 @@ export default function Chatbot({ context }) {
                     question: input
                 })
             });
-            const result = await res.json();
-            setMessages(msgs => [...msgs, { role: "assistant", content: result.answer }]);
+            if (!res.ok || !res.body) throw new Error(`Error HTTP ${res.status}`);
+
+            const setAnswer = (content) => setMessages(msgs => [...msgs.slice(0, -1), { role: "assistant", content }]);
+            setMessages(msgs => [...msgs, { role: "assistant", content: "" }]);
+
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = "";
+            let answer = "";
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split("\n\n");
+                buffer = events.pop();
+                for (const raw of events) {
+                    const eventName = raw.match(/^event: (.*)$/m)?.[1];
+                    const data = raw.match(/^data: (.*)$/m)?.[1];
+                    if (!data) continue;
+                    const payload = JSON.parse(data);
+                    if (eventName === "token") answer += payload.text;
+                    else if (eventName === "done") answer = payload.answer;
+                    else if (eventName === "error") answer = "No se pudo obtener respuesta.";
+                    setAnswer(answer);
+                }
+            }
         } catch {
             setMessages(msgs => [...msgs, { role: "assistant", content: "No se pudo obtener respuesta." }]);
         } finally {
@@ -27,7 +27,8 @@ export default function MiDiarioDeBienestar() {
     try {
       setNotesLoading(true);
       // Asegúrate de que esta URL sea accesible desde tu entorno de desarrollo
-      const res = await fetch(`http://127.0.0.1:8000/notas/${userId}`);
+      // Solo las columnas que muestra el diario (evita traer y desencriptar `tokens`)
+      const res = await fetch(`http://127.0.0.1:8000/notas/${userId}?fields=nota,sentimiento,emocion,emocion_score`);
       if (!res.ok) throw new Error(`Error al obtener notas: ${res.status}`);
   const result = await res.json();
   // Reiniciar la página a la primera cuando se cargan notas
@@ -92,6 +93,19 @@ export default function MiDiarioDeBienestar() {
     recognition.start();
   };
 
+  const listenAccompaniment = (jobId) => {
+    const source = new EventSource(`http://127.0.0.1:8000/notas/${jobId}/acompanamiento/stream`);
+    source.addEventListener("accompaniment", (event) => {
+      source.close();
+      const status = JSON.parse(event.data);
+      if (status.accompaniment) {
+        setAccompanimentText(status.accompaniment);
+        setShowAccompaniment(true);
+      }
+    });
+    source.addEventListener("error", () => source.close());
+  };
+
   const handleAddNote = async () => {
     if (!note.trim() || !user) {
       // Se elimina el alert para una mejor experiencia de usuario. El botón ya está deshabilitado.
@@ -131,6 +145,9 @@ export default function MiDiarioDeBienestar() {
       if (result.accompaniment) {
         setAccompanimentText(result.accompaniment);
         setShowAccompaniment(true);
+      } else if (result.accompaniment_job_id) {
+        // El acompañamiento se genera en segundo plano: lo recibimos por SSE
+        listenAccompaniment(result.accompaniment_job_id);
       }
     } catch (err) {
       console.error("Error enviando o procesando la nota:", err);
@@ -63,6 +63,7 @@ export default function Recomendaciones() {
   const [todas, setTodas] = useState([]);
   const [personalizada, setPersonalizada] = useState(null);
   const [likes, setLikes] = useState([]);
+  const [likeCounts, setLikeCounts] = useState({});
   const [loading, setLoading] = useState(false);
   const [emocion, setEmocion] = useState(null);
   // 🔑 NUEVO ESTADO: Controla si el modal debe mostrarse
@@ -82,13 +83,15 @@ export default function Recomendaciones() {
     fetchTodas();
   }, []);
 
-  // 💚 Obtener likes del usuario
+  // 💚 Obtener likes del usuario + popularidad de cada tarjeta (una sola petición)
   useEffect(() => {
     const fetchLikes = async () => {
       if (!user?.id) return;
-      const res = await fetch(`http://127.0.0.1:8000/likes/${user.id}`);
+      const res = await fetch(`http://127.0.0.1:8000/likes/${user.id}/resumen`);
       const data = await res.json();
-      setLikes(data);
+      const resumen = data.data || [];
+      setLikes(resumen.filter((r) => r.liked_by_user).map((r) => r.recomendacion_id));
+      setLikeCounts(Object.fromEntries(resumen.map((r) => [r.recomendacion_id, r.likes])));
     };
     fetchLikes();
   }, [user]);
@@ -129,6 +132,10 @@ export default function Recomendaciones() {
     setLikes((prev) =>
       isLiked ? prev.filter((id) => id !== recId) : [...prev, recId]
     );
+    setLikeCounts((prev) => ({
+      ...prev,
+      [recId]: Math.max(0, (prev[recId] || 0) + (isLiked ? -1 : 1)),
+    }));
   };
   
   // ❌ Función para cerrar el modal
@@ -181,6 +188,7 @@ export default function Recomendaciones() {
                   className={`heart-btn ${liked ? "liked" : ""}`}
                 >
                   <Heart />
+                  <span className="like-count">{likeCounts[rec.id] || 0}</span>
                 </button>
               </div>
               {rec.miniatura && (
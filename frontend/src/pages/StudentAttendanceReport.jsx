@@ -1,11 +1,12 @@
 import { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import Chatbot from "../components/Chatbot";
+import Charts from "../components/Charts";
 
 const initialAnalysis = {
     sentiments: null,
     emotions: null,
-    wordcloud: null,
+    termFrequency: [],
     topics: null,
 };
 
@@ -25,7 +26,7 @@ export default function StudentAttendanceReport() {
         setLoading(true);
         setError(null);
         try {
-            const res = await fetch(`http://127.0.0.1:8000/analyze-asistencia/${studentId}`);
+            const res = await fetch(`http://127.0.0.1:8000/analyze-asistencia/${studentId}?format=data`);
             const result = await res.json();
 
             if (!res.ok) {
@@ -449,43 +450,10 @@ export default function StudentAttendanceReport() {
                             gap: "1.5rem",
                             marginBottom: "2rem"
                         }}>
-                            {/* Gráfico de Sentimientos */}
-                            {analysis.sentiments && (
-                                <div style={{
-                                    background: "#fff",
-                                    padding: "1rem",
-                                    borderRadius: "0.7rem",
-                                    boxShadow: "0 2px 8px rgba(0,0,0,0.07)"
-                                }}>
-                                    <h3 style={{
-                                        fontSize: "1.1rem",
-                                        fontWeight: 600,
-                                        marginBottom: "0.5rem",
-                                        color: "var(--color-primary)"
-                                    }}>
-                                        Distribución de Sentimientos
-                                    </h3>
-                                    <img src={`data:image/png;base64,${analysis.sentiments}`} alt="Gráfico de Sentimientos" style={{ width: "100%", height: "auto" }} />
-                                </div>
-                            )}
-
-                            {/* Gráfico de Emociones */}
-                            {analysis.emotions && (
-                                <div style={{
-                                    background: "#fff",
-                                    padding: "1rem",
-                                    borderRadius: "0.7rem",
-                                    boxShadow: "0 2px 8px rgba(0,0,0,0.07)"
-                                }}>
-                                    <h3 style={{
-                                        fontSize: "1.1rem",
-                                        fontWeight: 600,
-                                        marginBottom: "0.5rem",
-                                        color: "var(--color-primary)"
-                                    }}>
-                                        Distribución de Emociones
-                                    </h3>
-                                    <img src={`data:image/png;base64,${analysis.emotions}`} alt="Gráfico de Emociones" style={{ width: "100%", height: "auto" }} />
+                            {/* Gráficos (datos JSON renderizados en el cliente) */}
+                            {(analysis.sentiments || analysis.emotions) && (
+                                <div style={{ gridColumn: "1 / span 2" }}>
+                                    <Charts data={analysis} />
                                 </div>
                             )}
 
@@ -539,27 +507,6 @@ export default function StudentAttendanceReport() {
                                     </div>
                                 </div>
                             )}
-
-                            {/* Nube de Palabras (Ocupa todo el ancho) */}
-                            {analysis.wordcloud && (
-                                <div style={{
-                                    gridColumn: "1 / span 2",
-                                    background: "#fff",
-                                    padding: "1rem",
-                                    borderRadius: "0.7rem",
-                                    boxShadow: "0 2px 8px rgba(0,0,0,0.07)"
-                                }}>
-                                    <h3 style={{
-                                        fontSize: "1.1rem",
-                                        fontWeight: 600,
-                                        marginBottom: "0.5rem",
-                                        color: "var(--color-primary)"
-                                    }}>
-                                        Nube de Palabras Clave
-                                    </h3>
-                                    <img src={`data:image/png;base64,${analysis.wordcloud}`} alt="Nube de Palabras" style={{ width: "100%", height: "auto" }} />
-                                </div>
-                            )}
                         </div>
 
                         {/* Botón para generar insight IA */}